@@ -0,0 +1,304 @@
+"""
+Card purchase alerts: a keyed rule index and a batch evaluation engine.
+
+Rules ("tell me when a purchase on Credit Card 4126 goes over $100, by SMS") are
+indexed by (card_type, last_digits), so saving or reading one is a dict lookup.
+
+The engine takes card transactions from any iterable (a generator, a CSV or JSONL
+file), cuts them into batches and evaluates the threshold rules over a whole batch
+at once. With numpy that is a searchsorted join of each transaction's card key
+against the sorted rule keys plus one vectorized comparison; without numpy the
+same logic runs as a plain loop. Every match becomes one NotificationEvent per
+channel (sms / email), handed to pluggable sinks.
+"""
+from collections import deque
+from dataclasses import dataclass, asdict
+import csv
+import json
+import logging
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional: the engine falls back to a python loop
+    np = None
+
+CHANNELS = ("sms", "email")
+DEFAULT_BATCH_SIZE = 65536
+
+
+@dataclass
+class AlertRule:
+    card_type: str        # e.g. "Credit Card"
+    last_digits: str      # e.g. "4126"
+    threshold: float      # notify when an amount goes over this
+    sms: bool = False
+    email: bool = False
+    enabled: bool = False
+
+    @property
+    def key(self):
+        return (self.card_type, self.last_digits)
+
+
+@dataclass(frozen=True)
+class CardTransaction:
+    card_type: str
+    last_digits: str
+    amount: float
+    merchant: str = ""
+    timestamp: float = 0.0
+    transaction_id: str = ""
+
+
+@dataclass(frozen=True)
+class NotificationEvent:
+    channel: str          # "sms" or "email"
+    card_type: str
+    last_digits: str
+    threshold: float
+    amount: float
+    merchant: str
+    timestamp: float
+    transaction_id: str
+
+    @property
+    def message(self) -> str:
+        where = f" at {self.merchant}" if self.merchant else ""
+        return (f"{self.card_type} ending {self.last_digits}: a ${self.amount:,.2f} transaction{where} "
+                f"is over your ${self.threshold:,.2f} alert amount.")
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "message": self.message}
+
+
+class AlertIndex:
+    """Rules keyed by (card_type, last_digits), plus sorted arrays for batch evaluation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules = {}          # (card_type, last_digits) -> AlertRule
+        self._card_ids = {}       # (card_type, last_digits) -> numeric card key, never reused
+        self._arrays = None       # built lazily after changes
+
+    def save(self, rule: AlertRule) -> str:
+        """Creates or replaces the rule for the rule's card. Returns "created" or "updated"."""
+        with self._lock:
+            status = "updated" if rule.key in self._rules else "created"
+            self._rules[rule.key] = rule
+            self._card_ids.setdefault(rule.key, len(self._card_ids))
+            self._arrays = None
+            return status
+
+    def get(self, card_type: str, last_digits: str) -> Optional[AlertRule]:
+        return self._rules.get((card_type, last_digits))
+
+    def all(self) -> List[AlertRule]:
+        with self._lock:
+            return list(self._rules.values())
+
+    def __len__(self):
+        return len(self._rules)
+
+    def card_key(self, card_type: str, last_digits: str) -> int:
+        """
+        Numeric key for a card, or -1 for a card no rule mentions. Keys are handed out per exact
+        (card_type, last_digits), so "0412" and "412" are different cards with different keys.
+        """
+        return self._card_ids.get((card_type, last_digits), -1)
+
+    def arrays(self):
+        """(keys, thresholds, rules) sorted by card key, for the enabled rules that have a channel."""
+        with self._lock:
+            if self._arrays is None:
+                active = sorted(
+                    (self.card_key(r.card_type, r.last_digits), r) for r in self._rules.values()
+                    if r.enabled and (r.sms or r.email) and self.card_key(r.card_type, r.last_digits) >= 0
+                )
+                rules = [r for _, r in active]
+                keys = [k for k, _ in active]
+                if np is not None:
+                    self._arrays = (
+                        np.array(keys, dtype=np.int64),
+                        np.array([r.threshold for r in rules], dtype=np.float64),
+                        rules,
+                    )
+                else:
+                    self._arrays = (keys, [r.threshold for r in rules], rules)
+            return self._arrays
+
+
+class MemorySink:
+    """Keeps the latest events in memory (e.g. for an API to show)."""
+
+    def __init__(self, max_events: Optional[int] = 1000):
+        self.events = deque(maxlen=max_events)
+
+    def emit(self, events):
+        self.events.extend(events)
+
+
+class JsonlFileSink:
+    """Appends one JSON line per event to a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, events):
+        lines = "".join(json.dumps(e.to_dict()) + "\n" for e in events)
+        if lines:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+
+class LogSink:
+    """One INFO record per event, so notifications go through the app's (redacting, queued) logging."""
+
+    def __init__(self, logger: Optional[logging.Logger] = None):
+        self.logger = logger or logging.getLogger(__name__)
+
+    def emit(self, events):
+        for event in events:
+            self.logger.info("[%s] %s", event.channel, event.message)
+
+
+class CountingSink:
+    """Counts events per channel without keeping them; for benchmarks."""
+
+    def __init__(self):
+        self.counts = {channel: 0 for channel in CHANNELS}
+
+    def emit(self, events):
+        for event in events:
+            self.counts[event.channel] += 1
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def read_transactions_csv(path: str) -> Iterator[CardTransaction]:
+    """CSV with a header: card_type,last_digits,amount[,merchant,timestamp,transaction_id]."""
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield CardTransaction(
+                card_type=row["card_type"],
+                last_digits=row["last_digits"],
+                amount=float(row["amount"]),
+                merchant=row.get("merchant") or "",
+                timestamp=float(row.get("timestamp") or 0),
+                transaction_id=row.get("transaction_id") or "",
+            )
+
+
+def read_transactions_jsonl(path: str) -> Iterator[CardTransaction]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield CardTransaction(**json.loads(line))
+
+
+class AlertEngine:
+    def __init__(self, index: AlertIndex, sinks=(), batch_size: int = DEFAULT_BATCH_SIZE, vectorized: bool = True):
+        self.index = index
+        self.sinks = list(sinks)
+        self.batch_size = batch_size
+        self.vectorized = vectorized and np is not None
+        self._lock = threading.Lock()
+        self._stats = {"transactions": 0, "matches": 0, "events": 0, "batches": 0, "seconds": 0.0}
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def match_columns(self, card_keys, amounts, arrays=None):
+        """
+        Core evaluation over columns: card_keys (from AlertIndex.card_key) and amounts.
+        Returns (transaction positions, rule positions) of every transaction over its card's threshold.
+        Rule positions index arrays (default: the index's current AlertIndex.arrays()); pass the snapshot
+        the caller will read the rules from, since a save in between rebuilds them.
+        """
+        keys, thresholds, rules = arrays if arrays is not None else self.index.arrays()
+        if not rules:
+            return [], []
+        if self.vectorized:
+            card_keys = np.asarray(card_keys, dtype=np.int64)
+            amounts = np.asarray(amounts, dtype=np.float64)
+            slots = np.searchsorted(keys, card_keys)
+            slots[slots >= len(keys)] = 0
+            hit = (keys[slots] == card_keys) & (amounts > thresholds[slots])
+            positions = np.nonzero(hit)[0]
+            return positions, slots[positions]
+        slot_by_key = {k: i for i, k in enumerate(keys)}
+        positions, slots = [], []
+        for i, (key, amount) in enumerate(zip(card_keys, amounts)):
+            slot = slot_by_key.get(key)
+            if slot is not None and amount > thresholds[slot]:
+                positions.append(i)
+                slots.append(slot)
+        return positions, slots
+
+    def evaluate(self, transactions: List[CardTransaction]) -> List[NotificationEvent]:
+        """Evaluates one batch and returns its notification events (without emitting them)."""
+        return self._evaluate(transactions)[0]
+
+    def _evaluate(self, transactions):
+        card_key = self.index.card_key
+        card_keys = [card_key(t.card_type, t.last_digits) for t in transactions]
+        amounts = [t.amount for t in transactions]
+        arrays = self.index.arrays()  # one snapshot: slots must point into the same rule list
+        positions, slots = self.match_columns(card_keys, amounts, arrays)
+        rules = arrays[2]
+        events = []
+        for position, slot in zip(positions, slots):
+            t, rule = transactions[int(position)], rules[int(slot)]
+            for channel in CHANNELS:
+                if getattr(rule, channel):
+                    events.append(NotificationEvent(
+                        channel=channel,
+                        card_type=rule.card_type,
+                        last_digits=rule.last_digits,
+                        threshold=rule.threshold,
+                        amount=t.amount,
+                        merchant=t.merchant,
+                        timestamp=t.timestamp,
+                        transaction_id=t.transaction_id,
+                    ))
+        return events, len(positions)
+
+    def process(self, transactions: Iterable[CardTransaction], extra_sinks=()) -> dict:
+        """
+        Evaluates a stream in batches, emitting each batch's events to every sink (plus extra_sinks, for this run only).
+        Returns this run's counts.
+        """
+        run = {"transactions": 0, "matches": 0, "events": 0, "batches": 0}
+        started = time.perf_counter()
+        for batch in batched(transactions, self.batch_size):
+            events, matches = self._evaluate(batch)
+            for sink in self.sinks + list(extra_sinks):
+                sink.emit(events)
+            run["transactions"] += len(batch)
+            run["matches"] += matches
+            run["events"] += len(events)
+            run["batches"] += 1
+        run["seconds"] = time.perf_counter() - started
+        with self._lock:
+            for name, value in run.items():
+                self._stats[name] += value
+        return run
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["rules"] = len(self.index)
+        stats["vectorized"] = self.vectorized
+        return stats
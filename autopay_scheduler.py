@@ -0,0 +1,308 @@
+"""
+Autopayment scheduling.
+
+Each autopayment (Once / Weekly / Bi-weekly / Monthly from a start date) sits in a
+timer wheel of day buckets keyed by its next run date, and a heap holds the days
+that have a non-empty bucket. So:
+
+- run_due() pops only the days that are due and executes what is in their buckets,
+  then moves each schedule to the bucket of its following run
+- upcoming(days) reads the buckets of the next N days and expands the few
+  schedules found there, instead of recomputing every schedule
+
+Executions are recorded under (schedule id, run date). Recording is insert-if-absent,
+so re-running a day (a retry, a restart, a second worker with the SQLite log) never
+pays twice. Catch-up only covers runs missed after a schedule was created (a worker
+that was down); a start date in the past doesn't pay the runs before the day it was
+saved. Dates come from an injectable clock, which lets a simulation step
+through a year of schedules in seconds.
+"""
+from calendar import monthrange
+from dataclasses import dataclass, asdict
+from datetime import date, timedelta
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional
+
+FREQUENCIES = ("Once", "Weekly", "Bi-weekly", "Monthly")
+
+
+def add_months(start: date, months: int, anchor_day: int) -> date:
+    """Same day of month as the anchor, clamped to the month's length (Jan 31 -> Feb 28 -> Mar 31)."""
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(anchor_day, monthrange(year, month)[1]))
+
+
+@dataclass
+class Autopayment:
+    id: int
+    name: str
+    account: str
+    amount: float
+    from_account: str
+    frequency: str            # one of FREQUENCIES
+    start: date
+    enabled: bool = True
+    notify_sms: bool = False
+    notify_email: bool = False
+    next_run: Optional[date] = None   # None once a "Once" payment ran, or while disabled
+    created: Optional[date] = None    # the day it was scheduled; runs dated before it are never paid
+
+    def following_run(self, run: date) -> Optional[date]:
+        if self.frequency == "Weekly":
+            return run + timedelta(days=7)
+        if self.frequency == "Bi-weekly":
+            return run + timedelta(days=14)
+        if self.frequency == "Monthly":
+            months = (run.year - self.start.year) * 12 + run.month - self.start.month + 1
+            return add_months(self.start, months, self.start.day)
+        return None  # Once
+
+    def runs_between(self, first: date, end: date):
+        """Run dates from first (a run date) up to, not including, end."""
+        run = first
+        while run is not None and run < end:
+            yield run
+            run = self.following_run(run)
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        d["start"] = self.start.isoformat()
+        d["next_run"] = self.next_run.isoformat() if self.next_run else None
+        d["created"] = self.created.isoformat() if self.created else None
+        return d
+
+
+@dataclass(frozen=True)
+class ExecutionRecord:
+    autopayment_id: int
+    run_date: date
+    amount: float
+    executed_at: float
+    status: str = "paid"
+
+
+class MemoryExecutionLog:
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def record(self, rec: ExecutionRecord):
+        """Stores rec unless this (autopayment, run date) already ran. Returns (record, created)."""
+        key = (rec.autopayment_id, rec.run_date)
+        with self._lock:
+            existing = self._records.get(key)
+            if existing is not None:
+                return existing, False
+            self._records[key] = rec
+            return rec, True
+
+    def recent(self, limit: int = 50) -> List[ExecutionRecord]:
+        with self._lock:
+            return list(self._records.values())[-limit:]
+
+    def __len__(self):
+        return len(self._records)
+
+
+class SQLiteExecutionLog:
+    """Execution records shared by workers; the primary key makes a second insert a no-op."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS autopay_executions ("
+            "autopayment_id INTEGER NOT NULL, run_date TEXT NOT NULL, amount REAL NOT NULL, "
+            "executed_at REAL NOT NULL, status TEXT NOT NULL, PRIMARY KEY (autopayment_id, run_date))"
+        )
+
+    def record(self, rec: ExecutionRecord):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO autopay_executions VALUES (?, ?, ?, ?, ?)",
+                (rec.autopayment_id, rec.run_date.isoformat(), rec.amount, rec.executed_at, rec.status),
+            )
+            if cursor.rowcount == 1:
+                return rec, True
+            row = self._conn.execute(
+                "SELECT amount, executed_at, status FROM autopay_executions WHERE autopayment_id = ? AND run_date = ?",
+                (rec.autopayment_id, rec.run_date.isoformat()),
+            ).fetchone()
+        return ExecutionRecord(rec.autopayment_id, rec.run_date, row[0], row[1], row[2]), False
+
+    def recent(self, limit: int = 50) -> List[ExecutionRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT autopayment_id, run_date, amount, executed_at, status FROM autopay_executions "
+                "ORDER BY executed_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [ExecutionRecord(r[0], date.fromisoformat(r[1]), r[2], r[3], r[4]) for r in reversed(rows)]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM autopay_executions").fetchone()[0]
+
+
+class AutopayScheduler:
+    def __init__(self, execution_log=None, on_execute: Optional[Callable] = None,
+                 today: Callable[[], date] = date.today, clock: Callable[[], float] = time.time):
+        """
+        on_execute(autopayment, record): called once per newly recorded execution (make the payment, notify).
+        today: the scheduler's notion of the current date; clock: timestamps for execution records.
+        """
+        self.execution_log = execution_log if execution_log is not None else MemoryExecutionLog()
+        self.on_execute = on_execute
+        self.today = today
+        self.clock = clock
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self._autopayments = {}     # id -> Autopayment
+        self._buckets = {}          # date ordinal -> set of autopayment ids whose next run is that day
+        self._days = []             # heap of ordinals that have a bucket
+        self._stats = {"executions": 0, "duplicates_skipped": 0}
+
+    # --- wheel maintenance ---
+
+    def _place(self, ap: Autopayment):
+        if ap.next_run is None or not ap.enabled:
+            return
+        day = ap.next_run.toordinal()
+        bucket = self._buckets.get(day)
+        if bucket is None:
+            bucket = self._buckets[day] = set()
+            heapq.heappush(self._days, day)
+        bucket.add(ap.id)
+
+    def _unplace(self, ap: Autopayment):
+        if ap.next_run is None:
+            return
+        bucket = self._buckets.get(ap.next_run.toordinal())
+        if bucket is not None:
+            bucket.discard(ap.id)  # an empty bucket's day is dropped lazily when popped
+
+    # --- API ---
+
+    def build(self, name, account, amount, from_account, frequency, start: date, enabled=True,
+              notify_sms=False, notify_email=False, autopayment_id: Optional[int] = None,
+              created: Optional[date] = None) -> Autopayment:
+        """
+        A validated autopayment with its first run, not yet scheduled. created (default today) is when the
+        user scheduled it: runs dated before it are skipped, so a start date in the past doesn't pay the
+        year since then at once. Re-adding a saved schedule (another worker, a restart) passes its original
+        created date, which keeps catch-up for runs missed since.
+        """
+        if frequency not in FREQUENCIES:
+            raise ValueError(f"Unknown frequency: {frequency}")
+        ap = Autopayment(
+            id=autopayment_id if autopayment_id is not None else next(self._ids), name=name, account=account, amount=float(amount), from_account=from_account,
+            frequency=frequency, start=start, enabled=enabled, notify_sms=notify_sms, notify_email=notify_email,
+            next_run=start, created=created or self.today(),
+        )
+        while ap.next_run is not None and ap.next_run < ap.created:
+            ap.next_run = ap.following_run(ap.next_run)
+        return ap
+
+    def add(self, name, account, amount, from_account, frequency, start: date, enabled=True,
+            notify_sms=False, notify_email=False, autopayment_id: Optional[int] = None,
+            created: Optional[date] = None) -> Autopayment:
+        """Schedules a new autopayment (see build). With an autopayment_id that is already scheduled, returns that one."""
+        with self._lock:
+            if autopayment_id in self._autopayments:
+                return self._autopayments[autopayment_id]
+            ap = self.build(name, account, amount, from_account, frequency, start, enabled, notify_sms, notify_email,
+                            autopayment_id, created)
+            self._autopayments[ap.id] = ap
+            self._place(ap)
+            return ap
+
+    def set_enabled(self, autopayment_id: int, enabled: bool) -> Optional[Autopayment]:
+        with self._lock:
+            ap = self._autopayments.get(autopayment_id)
+            if ap is None or ap.enabled == enabled:
+                return ap
+            self._unplace(ap)
+            ap.enabled = enabled
+            if enabled:
+                # Runs that fell while the autopayment was off are skipped, not caught up
+                today = self.today()
+                while ap.next_run is not None and ap.next_run < today:
+                    ap.next_run = ap.following_run(ap.next_run)
+            self._place(ap)
+            return ap
+
+    def get(self, autopayment_id: int) -> Optional[Autopayment]:
+        return self._autopayments.get(autopayment_id)
+
+    def all(self) -> List[Autopayment]:
+        with self._lock:
+            return list(self._autopayments.values())
+
+    def run_due(self) -> List[ExecutionRecord]:
+        """Executes every run dated today or earlier (each missed run once) and returns the new records."""
+        today = self.today().toordinal()
+        executed = []
+        with self._lock:
+            while self._days and self._days[0] <= today:
+                day = heapq.heappop(self._days)
+                for ap_id in sorted(self._buckets.pop(day, ())):
+                    ap = self._autopayments[ap_id]
+                    run_date = ap.next_run
+                    # Catch up every missed run in order, then park the schedule at its next future run
+                    while run_date is not None and run_date.toordinal() <= today:
+                        record, created = self.execution_log.record(
+                            ExecutionRecord(ap.id, run_date, ap.amount, self.clock())
+                        )
+                        if created:
+                            self._stats["executions"] += 1
+                            executed.append(record)
+                            if self.on_execute is not None:
+                                self.on_execute(ap, record)
+                        else:
+                            self._stats["duplicates_skipped"] += 1
+                        run_date = ap.following_run(run_date)
+                    ap.next_run = run_date
+                    self._place(ap)
+        return executed
+
+    def upcoming(self, days: int, start: Optional[date] = None):
+        """(run date, autopayment) for every run in [start, start + days), by date. Reads only those days' buckets."""
+        start = start or self.today()
+        first, end = start.toordinal(), start.toordinal() + days
+        carried = {}    # ordinal -> ids whose later run inside the window was found while walking
+        runs = []
+        with self._lock:
+            # Overdue schedules (run_due hasn't caught up yet) still have runs inside the window
+            for ordinal in [d for d in self._buckets if d < first]:
+                for ap_id in self._buckets[ordinal]:
+                    run = self._autopayments[ap_id].next_run
+                    while run is not None and run.toordinal() < first:
+                        run = self._autopayments[ap_id].following_run(run)
+                    if run is not None and run.toordinal() < end:
+                        carried.setdefault(run.toordinal(), []).append(ap_id)
+            for ordinal in range(first, end):
+                ids = list(self._buckets.get(ordinal, ())) + carried.pop(ordinal, [])
+                if not ids:
+                    continue
+                run = date.fromordinal(ordinal)
+                for ap_id in sorted(ids):
+                    ap = self._autopayments[ap_id]
+                    runs.append((run, ap))
+                    following = ap.following_run(run)
+                    if following is not None and following.toordinal() < end:
+                        carried.setdefault(following.toordinal(), []).append(ap_id)
+        return runs
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "autopayments": len(self._autopayments),
+                "scheduled_days": sum(1 for b in self._buckets.values() if b),
+                "execution_records": len(self.execution_log),
+            }
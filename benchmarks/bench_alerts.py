@@ -0,0 +1,101 @@
+"""
+Alert evaluation throughput: millions of card transactions against tens of thousands of rules.
+
+Times AlertEngine.match_columns (the per-batch core) with numpy against the python
+loop it falls back to, then the end-to-end stream path (CardTransaction objects in,
+NotificationEvents out to a counting sink) on a smaller stream.
+
+    python benchmarks/bench_alerts.py --rules 50000 --transactions 5000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alert_engine import AlertEngine, AlertIndex, AlertRule, CardTransaction, CountingSink, np  # noqa: E402
+
+CARD_TYPES = ["Credit Card", "Debit Card", "Business Card"]
+
+
+def build_index(n_rules, seed=3):
+    rng = random.Random(seed)
+    index = AlertIndex()
+    cards = set()
+    while len(cards) < n_rules:
+        cards.add((rng.choice(CARD_TYPES), f"{rng.randrange(10 ** 6):06d}"))
+    for card_type, digits in cards:
+        index.save(AlertRule(
+            card_type=card_type,
+            last_digits=digits,
+            threshold=rng.choice([10, 50, 100, 250, 500, 1000]),
+            sms=rng.random() < 0.8,
+            email=rng.random() < 0.4,
+            enabled=rng.random() < 0.9,
+        ))
+    return index, sorted(cards)
+
+
+def transactions(cards, n, seed=4):
+    """Half the transactions are on cards with a rule, half on cards without one."""
+    rng = random.Random(seed)
+    for i in range(n):
+        if rng.random() < 0.5:
+            card_type, digits = rng.choice(cards)
+        else:
+            card_type, digits = rng.choice(CARD_TYPES), f"{rng.randrange(10 ** 6):06d}"
+        yield CardTransaction(card_type, digits, round(rng.lognormvariate(3.5, 1.2), 2), "Store", float(i), str(i))
+
+
+def columns(index, cards, n, seed=5):
+    rng = np.random.default_rng(seed)
+    rule_keys = np.array([index.card_key(c, d) for c, d in cards], dtype=np.int64)
+    other_keys = rng.integers(0, len(CARD_TYPES), n) * 10 ** 8 + rng.integers(0, 10 ** 6, n)
+    keys = np.where(rng.random(n) < 0.5, rule_keys[rng.integers(0, len(rule_keys), n)], other_keys)
+    amounts = np.round(rng.lognormal(3.5, 1.2, n), 2)
+    return keys, amounts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, default=50_000)
+    parser.add_argument("--transactions", type=int, default=5_000_000)
+    parser.add_argument("--batch-size", type=int, default=65_536)
+    parser.add_argument("--stream-transactions", type=int, default=500_000)
+    args = parser.parse_args()
+
+    index, cards = build_index(args.rules)
+    print(f"{len(index)} rules ({len(index.arrays()[2])} enabled with a channel)\n")
+
+    if np is not None:
+        keys, amounts = columns(index, cards, args.transactions)
+        vectorized = AlertEngine(index, batch_size=args.batch_size)
+        started = time.perf_counter()
+        matches = 0
+        for start in range(0, len(keys), args.batch_size):
+            positions, _ = vectorized.match_columns(keys[start:start + args.batch_size], amounts[start:start + args.batch_size])
+            matches += len(positions)
+        elapsed = time.perf_counter() - started
+        print(f"{'numpy columns':>16}: {args.transactions:>10,} txns in {elapsed:6.2f}s = {args.transactions / elapsed:>13,.0f} txns/s, {matches:,} over threshold")
+
+        loop = AlertEngine(index, vectorized=False)
+        n = min(len(keys), 1_000_000)
+        key_list, amount_list = keys[:n].tolist(), amounts[:n].tolist()
+        started = time.perf_counter()
+        positions, _ = loop.match_columns(key_list, amount_list)
+        elapsed = time.perf_counter() - started
+        print(f"{'python columns':>16}: {n:>10,} txns in {elapsed:6.2f}s = {n / elapsed:>13,.0f} txns/s, {len(positions):,} over threshold")
+    else:
+        print("numpy is not installed; only the python loop is measured")
+
+    sink = CountingSink()
+    engine = AlertEngine(index, sinks=[sink], batch_size=args.batch_size)
+    run = engine.process(transactions(cards, args.stream_transactions))
+    print(f"{'stream (objects)':>16}: {run['transactions']:>10,} txns in {run['seconds']:6.2f}s = "
+          f"{run['transactions'] / run['seconds']:>13,.0f} txns/s, {run['matches']:,} matches, events {sink.counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Autopayment scheduling: a simulated year of 100k autopayments.
+
+Steps a fake clock through every day of a year calling run_due(), replays a
+month after a simulated restart to check that executions stay idempotent, and
+times upcoming(N days) against recomputing every schedule's runs in the window.
+
+    python benchmarks/bench_autopay.py --autopayments 100000 --days 365
+"""
+import argparse
+from datetime import date, timedelta
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autopay_scheduler import FREQUENCIES, AutopayScheduler  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self, day: date):
+        self.day = day
+
+    def today(self) -> date:
+        return self.day
+
+    def timestamp(self) -> float:
+        return float(self.day.toordinal() * 86400)
+
+
+def build(scheduler, n, first_day, seed=11):
+    rng = random.Random(seed)
+    for i in range(n):
+        scheduler.add(
+            name=f"Payee {i}",
+            account=str(10_000_000_000 + i),
+            amount=round(rng.uniform(10, 2000), 2),
+            from_account=rng.choice(["Chequing", "Savings"]),
+            frequency=rng.choices(FREQUENCIES, weights=[1, 2, 2, 5])[0],
+            start=first_day + timedelta(days=rng.randrange(400)),
+            enabled=rng.random() < 0.95,
+        )
+
+
+def recompute(scheduler, start, days):
+    """The index-free answer: walk every schedule from its start date."""
+    end = start + timedelta(days=days)
+    return sorted(
+        (run, ap.id) for ap in scheduler.all() if ap.enabled
+        for run in ap.runs_between(ap.start, end) if run >= start
+    )
+
+
+def compare_upcoming(scheduler, today, window, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        indexed = scheduler.upcoming(window)
+    indexed_ms = (time.perf_counter() - started) / repeat * 1000
+    started = time.perf_counter()
+    scanned = recompute(scheduler, today, window)
+    scan_ms = (time.perf_counter() - started) * 1000
+    assert [(run, ap.id) for run, ap in indexed] == scanned
+    print(f"upcoming({window}) from {today}: {len(indexed):,} runs, index {indexed_ms:.1f} ms vs recompute {scan_ms:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--autopayments", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--window", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    first_day = date(2025, 1, 1)
+    clock = FakeClock(first_day)
+    scheduler = AutopayScheduler(today=clock.today, clock=clock.timestamp)
+    started = time.perf_counter()
+    build(scheduler, args.autopayments, first_day)
+    print(f"scheduled {args.autopayments:,} autopayments in {time.perf_counter() - started:.2f}s")
+
+    compare_upcoming(scheduler, clock.today(), args.window, args.repeat)
+
+    started = time.perf_counter()
+    executions = 0
+    for offset in range(args.days):
+        clock.day = first_day + timedelta(days=offset)
+        executions += len(scheduler.run_due())
+    elapsed = time.perf_counter() - started
+    stats = scheduler.stats()
+    print(f"simulated {args.days} days in {elapsed:.2f}s: {executions:,} executions, "
+          f"{stats['execution_records']:,} records, {stats['duplicates_skipped']} duplicates")
+    assert executions == stats["execution_records"]
+
+    # A restarted worker rebuilds its schedules from scratch but shares the execution log: replaying
+    # the first month must not pay anything twice
+    clock.day = first_day
+    restarted = AutopayScheduler(execution_log=scheduler.execution_log, today=clock.today, clock=clock.timestamp)
+    build(restarted, args.autopayments, first_day)
+    replayed = 0
+    for offset in range(30):
+        clock.day = first_day + timedelta(days=offset)
+        replayed += len(restarted.run_due())
+    print(f"replayed 30 days after a restart: {replayed} new executions, "
+          f"{restarted.stats()['duplicates_skipped']:,} duplicates skipped")
+    assert replayed == 0
+    clock.day = first_day + timedelta(days=args.days - 1)
+
+    # A year in, recomputing means walking each schedule's whole history; the index doesn't care
+    clock.day += timedelta(days=1)
+    compare_upcoming(scheduler, clock.today(), args.window, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
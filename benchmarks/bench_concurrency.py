@@ -0,0 +1,159 @@
+"""
+Load benchmark: how many concurrent chat sessions can one uvicorn worker sustain?
+
+Starts the fake completion server and a single-worker bot server, then ramps up
+the number of concurrent sessions hitting /tellerbot. While the load runs, a probe
+polls /api/payees to show whether the event loop is blocked by LLM calls.
+
+    python benchmarks/bench_concurrency.py --mode both --latency-ms 800
+
+A concurrency level counts as "sustained" when there are no errors and the p95
+turn latency stays under --slo-factor x the fake LLM latency.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TURN_BODY = {
+    "messages": [{"role": "user", "content": "I want to send money to Bob"}],
+    "newPageLoaded": False,
+    "intent": None,
+    "currentPage": "index.html",
+    "substep_flags": {},
+    "assistant": "frank",
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def start_server(app_path, port, env):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app_path, "--port", str(port), "--workers", "1", "--log-level", "warning"],
+        cwd=ROOT,
+        env={**os.environ, **env},
+    )
+
+
+async def wait_until_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.monotonic() < deadline:
+            try:
+                await http.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+async def run_session(http, base_url, turns, latencies, errors):
+    for _ in range(turns):
+        started = time.perf_counter()
+        try:
+            res = await http.post(f"{base_url}/tellerbot", json=TURN_BODY)
+            res.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            errors.append(1)
+
+
+async def probe(http, base_url, stop, probe_latencies):
+    # Static/API requests should stay fast even while completions are pending
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await http.get(f"{base_url}/api/payees")
+            probe_latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.05)
+
+
+async def run_level(base_url, sessions, turns):
+    latencies, errors, probe_latencies = [], [], []
+    limits = httpx.Limits(max_connections=sessions + 10, max_keepalive_connections=sessions + 10)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as http:
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(http, base_url, stop, probe_latencies))
+        started = time.perf_counter()
+        await asyncio.gather(*(run_session(http, base_url, turns, latencies, errors) for _ in range(sessions)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe_task
+    return {
+        "sessions": sessions,
+        "turns_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "probe_p95": percentile(probe_latencies, 95),
+        "errors": len(errors),
+    }
+
+
+async def bench_mode(mode, args):
+    fake_port, bot_port = args.fake_port, args.bot_port
+    fake = start_server("benchmarks.fake_completion_server:app", fake_port, {"FAKE_LLM_LATENCY_MS": str(args.latency_ms)})
+    bot = start_server("main:app", bot_port, {
+        "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{fake_port}",
+        "AZURE_OPENAI_API_KEY": "fake",
+        "LLM_CLIENT_MODE": mode,
+    })
+    base_url = f"http://127.0.0.1:{bot_port}"
+    try:
+        await wait_until_ready(f"http://127.0.0.1:{fake_port}/docs")
+        await wait_until_ready(f"{base_url}/api/payees")
+
+        slo = args.slo_factor * args.latency_ms / 1000
+        sustained = 0
+        print(f"\n== LLM_CLIENT_MODE={mode}, fake latency {args.latency_ms:.0f} ms, p95 SLO {slo * 1000:.0f} ms")
+        print(f"{'sessions':>9} {'turns/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'probe p95':>10} {'errors':>7}")
+        for sessions in args.levels:
+            row = await run_level(base_url, sessions, args.turns)
+            print(
+                f"{row['sessions']:>9} {row['turns_per_sec']:>9.1f} {row['p50'] * 1000:>9.0f} "
+                f"{row['p95'] * 1000:>9.0f} {row['probe_p95'] * 1000:>10.1f} {row['errors']:>7}"
+            )
+            if row["errors"] or row["p95"] > slo:
+                break
+            sustained = sessions
+        print(f"Sustained concurrent sessions on one worker ({mode}): {sustained}")
+        return sustained
+    finally:
+        bot.terminate()
+        fake.terminate()
+        bot.wait()
+        fake.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["async", "sync", "both"], default="both")
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--turns", type=int, default=3, help="turns per session at each level")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 10, 25, 50, 100, 200, 400, 800])
+    parser.add_argument("--slo-factor", type=float, default=1.5)
+    parser.add_argument("--fake-port", type=int, default=8765)
+    parser.add_argument("--bot-port", type=int, default=8766)
+    args = parser.parse_args()
+
+    modes = ["sync", "async"] if args.mode == "both" else [args.mode]
+    results = {mode: asyncio.run(bench_mode(mode, args)) for mode in modes}
+    if len(results) > 1:
+        print("\nSummary:", ", ".join(f"{mode}={count}" for mode, count in results.items()))
+
+
+if __name__ == "__main__":
+    main()
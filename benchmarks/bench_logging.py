@@ -0,0 +1,114 @@
+"""
+Request throughput with logging off, on, sampled and synchronous.
+
+Runs a scripted mix of /tellerbot turns (intent, classification, fill with an
+amount and an account number, confirmation, page load) through main.run_turn
+in-process, with the LLM replaced by an instant fake so the turn's own CPU and
+I/O dominate. Each mode reinstalls structured_logging with a different setup and
+writes to a real file:
+
+- off:      LOG_LEVEL=WARNING, the per-turn DEBUG/INFO calls are level checks
+- info:     the default, queued
+- debug:    everything, queued (formatting and redaction on the listener thread)
+- sampled:  DEBUG with LOG_SAMPLING={"bankbot": 0.1}
+- sync:     DEBUG written from the request path (the old print() behaviour)
+
+    python benchmarks/bench_logging.py --turns 5000 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+TMP = tempfile.mkdtemp(prefix="bench_logging_")
+for name, filename in (("PAYEE_DB_PATH", "payees.sqlite3"), ("MUTATIONS_DB_PATH", "mutations.sqlite3"),
+                       ("STATEMENTS_DB_PATH", "statements.sqlite3"), ("SESSION_DB_PATH", "sessions.sqlite3"),
+                       ("AUTOPAY_EXECUTIONS_PATH", "autopay_executions.sqlite3"), ("CONTACTS_DB_PATH", "contacts.sqlite3")):
+    os.environ.setdefault(name, os.path.join(TMP, filename))
+os.environ.update({"LLM_BACKEND": "fake", "LLM_CACHE_BACKEND": "off", "LLM_CLIENT_MODE": "async", "TTS_PRERENDER": "0"})
+os.chdir(ROOT)  # main mounts ./static
+
+import main  # noqa: E402
+from benchmarks.fake_completion_server import fake_reply  # noqa: E402
+from fake_llm import FakeLLM  # noqa: E402
+from structured_logging import setup_logging  # noqa: E402
+
+TURNS = [
+    {"messages": [{"role": "user", "content": "I want to send $250 to Bob"}],
+     "intent": None, "currentPage": "index.html", "substep_flags": {}},
+    {"messages": [{"role": "assistant", "content": "Who would you like to send money to?"},
+                  {"role": "user", "content": "Bob Chen please"}],
+     "intent": "e_transfer", "currentPage": "etransfer.html", "substep_flags": {}},
+    {"messages": [{"role": "assistant", "content": "How much do you want to send?"},
+                  {"role": "user", "content": "send 250 dollars from 38792 2561-5438"}],
+     "intent": "e_transfer", "currentPage": "send_to_alex.html", "substep_flags": {"account_chosen": True}},
+    {"messages": [{"role": "assistant", "content": "Do you want to confirm this transfer or cancel it?"},
+                  {"role": "user", "content": "yes, confirm it"}],
+     "intent": "e_transfer", "currentPage": "confirm_transfer.html", "substep_flags": {}},
+    {"messages": [], "newPageLoaded": True,
+     "intent": "e_transfer", "currentPage": "send_to_alex.html", "substep_flags": {}},
+]
+
+MODES = {
+    "off": dict(level="WARNING"),
+    "info": dict(level="INFO"),
+    "debug": dict(level="DEBUG"),
+    "sampled": dict(level="DEBUG", sampling={"bankbot": 0.1}),
+    "sync": dict(level="DEBUG", queued=False),
+}
+
+
+async def run_turns(count, concurrency):
+    next_turn = iter(range(count))
+
+    async def worker():
+        for i in next_turn:
+            body = {**TURNS[i % len(TURNS)], "assistant": "frank"}
+            await main.run_turn(main.teller_turn, body)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def bench_mode(mode, args):
+    path = os.path.join(TMP, f"{mode}.log")
+    with open(path, "w", encoding="utf-8") as stream:
+        setup = setup_logging(stream=stream, **MODES[mode])
+        try:
+            asyncio.run(run_turns(args.warmup, args.concurrency))
+            started = time.perf_counter()
+            asyncio.run(run_turns(args.turns, args.concurrency))
+            elapsed = time.perf_counter() - started
+        finally:
+            drain_started = time.perf_counter()
+            setup.stop()
+            drain = time.perf_counter() - drain_started
+    with open(path, encoding="utf-8") as f:
+        lines = sum(1 for _ in f)
+    return {"mode": mode, "turns_per_sec": args.turns / elapsed, "us_per_turn": elapsed / args.turns * 1e6,
+            "lines": lines, "drain_ms": drain * 1000}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    llm = FakeLLM(responder=lambda messages: fake_reply(messages[0]["content"] if messages else ""))
+    main.use_llm_clients(llm.client(), llm.async_client())
+    print(f"{args.turns} turns, {args.concurrency} concurrent, instant fake LLM")
+    print(f"{'mode':>8} {'turns/s':>9} {'us/turn':>9} {'log lines':>10} {'drain ms':>9}")
+    for mode in args.modes:
+        row = bench_mode(mode, args)
+        print(f"{row['mode']:>8} {row['turns_per_sec']:>9.0f} {row['us_per_turn']:>9.0f} "
+              f"{row['lines']:>10} {row['drain_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,154 @@
+"""
+Recipient classification over growing contact lists: prompt size, retrieval latency and recall.
+
+Builds synthetic contact directories of each --sizes, then asks for random
+contacts the way users do: the full name in a sentence, with a typo, spelled
+the way it sounds ("Sofia Smyth", "Katherine Chan"), or only the last name
+said twice over. For each size it reports:
+
+- the classification prompt the recipient step sends with every contact as an
+  option (the old behaviour) and with the top --k retrieved ones
+- OptionRetriever.retrieve() latency, p50/p99, and how many records it scored
+- recall: how often the asked-for contact (or a namesake) is among the top k
+
+    python benchmarks/bench_option_retrieval.py --sizes 100 1000 10000 100000 --queries 500
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+TMP = tempfile.mkdtemp(prefix="bench_option_retrieval_")
+for name, filename in (("PAYEE_DB_PATH", "payees.sqlite3"), ("MUTATIONS_DB_PATH", "mutations.sqlite3"),
+                       ("STATEMENTS_DB_PATH", "statements.sqlite3"), ("SESSION_DB_PATH", "sessions.sqlite3"),
+                       ("AUTOPAY_EXECUTIONS_PATH", "autopay_executions.sqlite3"), ("CONTACTS_DB_PATH", "contacts.sqlite3")):
+    os.environ.setdefault(name, os.path.join(TMP, filename))
+os.environ.update({"LLM_BACKEND": "fake", "TTS_PRERENDER": "0", "LOG_LEVEL": "WARNING"})
+os.chdir(ROOT)  # main mounts ./static
+
+import main  # noqa: E402
+from contact_store import ContactStore  # noqa: E402
+from option_retrieval import OptionRetriever  # noqa: E402
+
+FIRST_NAMES = (
+    "Bob", "Sophia", "David", "Katherine", "Michael", "Olivia", "Liam", "Emma", "Noah", "Ava", "Ethan", "Mia", "Lucas",
+    "Chloe", "Mason", "Zoe", "Logan", "Grace", "Jacob", "Hannah", "Ryan", "Isabelle", "Nathan", "Leah", "Owen", "Sarah",
+    "Daniel", "Julia", "Matthew", "Priya", "Arjun", "Wei", "Mei", "Hiroshi", "Yuki", "Omar", "Fatima", "Carlos", "Lucia",
+    "Jean", "Amelie", "Connor", "Siobhan", "Stephen", "Philip", "Jeffrey", "Caitlin", "Aaliyah", "Mohammed", "Nguyen",
+)
+LAST_NAMES = (
+    "Chen", "Smith", "Kim", "Nguyen", "Patel", "Singh", "Wong", "Li", "Brown", "Tremblay", "Martin", "Roy", "Gagnon",
+    "Lee", "Wilson", "Johnson", "MacDonald", "Taylor", "Campbell", "Anderson", "Thompson", "Leblanc", "Gauthier",
+    "Fraser", "Murphy", "Stewart", "Schmidt", "Kowalski", "Rossi", "Garcia", "Hernandez", "Sato", "Tanaka", "Park",
+    "Choi", "Khan", "Ali", "Cohen", "Friedman", "O'Brien", "Sullivan", "Fitzgerald", "Philips", "Catherwood",
+)
+SYLLABLES = ("ka", "lo", "mi", "ren", "ta", "vor", "shi", "bel", "dan", "ko", "mar", "ste", "lin", "gor", "pha", "zu")
+# Same sound, different spelling: what speech-to-text and users get "wrong"
+SOUNDALIKES = (("ph", "f"), ("ie", "y"), ("c", "k"), ("th", "t"), ("en", "an"), ("i", "y"), ("ey", "y"), ("ff", "ph"))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def directory(size, rng):
+    """(name, email) pairs: real-looking names first, then invented surnames so big lists aren't all namesakes."""
+    contacts = []
+    for i in range(size):
+        first = FIRST_NAMES[i % len(FIRST_NAMES)]
+        if i < len(FIRST_NAMES) * len(LAST_NAMES):
+            last = LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]
+        else:
+            last = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+        contacts.append((f"{first} {last}", f"{first}.{last}.{i}@example.com".lower()))
+    return contacts
+
+
+def typo(word, rng):
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return rng.choice((word[:i] + word[i + 1:], word[:i] + word[i + 1] + word[i] + word[i + 2:]))
+
+
+def soundalike(word):
+    for written, said in SOUNDALIKES:
+        if written in word[1:]:
+            return word[0] + word[1:].replace(written, said, 1)
+    return word
+
+
+def ask(name, rng):
+    first, last = name.split(" ", 1)
+    return rng.choice((
+        f"send money to {first} {last}",
+        f"I want to e-transfer {first} {typo(last, rng)}",
+        f"it's {soundalike(first)} {soundalike(last)}",
+        f"{first.lower()} {last.lower()} please",
+        f"pay back {typo(first, rng)} {last}",
+    ))
+
+
+def bench(size, args):
+    rng = random.Random(args.seed)
+    store = ContactStore(os.path.join(TMP, f"contacts_{size}.sqlite3"))
+    store.add_many(directory(size, rng))
+    retriever = OptionRetriever(store)
+    started = time.perf_counter()
+    retriever.retrieve("warm up the index", k=args.k)
+    index_seconds = time.perf_counter() - started
+
+    substep = main.flow_graph.page("e_transfer", "frank", "etransfer.html").substeps[0].spec
+    everyone = {record.name: {} for record in store.records()}
+    full_prompt = main.option_prompts(substep, everyone)["classification_prompt"]
+
+    records = store.records()
+    timings, scored, hits, prompt_chars = [], [], 0, []
+    for _ in range(args.queries):
+        target = rng.choice(records)
+        text = ask(target.name, rng)
+        started = time.perf_counter()
+        retrieval = retriever.retrieve(text, k=args.k)
+        timings.append((time.perf_counter() - started) * 1e6)
+        scored.append(retrieval.scored)
+        hits += any(c.record.name_norm == target.name_norm for c in retrieval.candidates)
+        options = {c.record.name: {} for c in retrieval.candidates}
+        prompt_chars.append(len(main.option_prompts(substep, options)["classification_prompt"]))
+    return {
+        "size": size,
+        "index_ms": index_seconds * 1000,
+        "full_prompt": len(full_prompt),
+        "full_tokens": main.count_text_tokens(full_prompt),
+        "topk_prompt": max(prompt_chars),
+        "p50_us": percentile(timings, 50),
+        "p99_us": percentile(timings, 99),
+        "scored": sum(scored) / len(scored),
+        "recall": hits / args.queries,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[3, 100, 1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{args.queries} recipient requests per directory, top {args.k} retrieved")
+    print(f"{'contacts':>9} {'index ms':>9} {'all-options prompt':>19} {'tokens':>8} {'top-k prompt':>13} "
+          f"{'p50 us':>7} {'p99 us':>7} {'scored':>7} {'recall':>7}")
+    for size in args.sizes:
+        row = bench(size, args)
+        print(f"{row['size']:>9} {row['index_ms']:>9.0f} {row['full_prompt']:>19,} {row['full_tokens']:>8,} "
+              f"{row['topk_prompt']:>13,} {row['p50_us']:>7.0f} {row['p99_us']:>7.0f} {row['scored']:>7.1f} "
+              f"{row['recall']:>7.1%}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,64 @@
+"""
+Payee search latency as the directory grows.
+
+Builds synthetic biller directories of increasing size in a temporary SQLite
+file and times PayeeStore.search for prefix, multi-word, typo and account-number
+queries, next to the old approach (scan the whole list for a substring).
+
+    python benchmarks/bench_payee_search.py --sizes 1000 10000 100000 300000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from payee_store import PayeeStore  # noqa: E402
+
+WORDS = [
+    "hydro", "telus", "bell", "rogers", "energy", "city", "water", "gas", "mobile", "insurance",
+    "bank", "credit", "union", "services", "utilities", "north", "west", "coast", "power", "fortis",
+]
+QUERIES = ["hyd", "telus mob", "wter servcs", "1000004"]
+
+
+def directory(size, seed=7):
+    rng = random.Random(seed)
+    for i in range(size):
+        name = " ".join(rng.choice(WORDS).title() for _ in range(rng.randint(1, 3)))
+        yield f"{name} {''.join(rng.choice(string.ascii_uppercase) for _ in range(4))}", str(10_000_000_000 + i)
+
+
+def time_per_call(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'payees':>8} {'load s':>7} " + " ".join(f"{q!r:>15}" for q in QUERIES) + f" {'list scan':>10}   (ms/query)")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            rows = list(directory(size))
+            store = PayeeStore(os.path.join(tmp, "payees.sqlite3"))
+            started = time.perf_counter()
+            store.add_many(rows)
+            load = time.perf_counter() - started
+            timings = [time_per_call(lambda: store.search(q), args.repeat) for q in QUERIES]
+            as_list = [{"name": n, "account": a} for n, a in rows]
+            scan = time_per_call(lambda: [p for p in as_list if "hyd" in p["name"].lower()], max(1, args.repeat // 10))
+            print(f"{size:>8} {load:>7.1f} " + " ".join(f"{t:>15.2f}" for t in timings) + f" {scan:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+Offline replay of scripted conversations, end to end, as a benchmark and a regression gate.
+
+Each script in replay_scripts.json is one task the way the browser drives it
+(page loads, user turns, the form pages' flags, the plain API calls in between),
+sent through /tellerbot or /tutorbot with the FastAPI TestClient. The LLM and TTS
+are deterministic local fakes with configurable latency: the fake LLM (fake_llm.FakeLLM,
+swapped in with main.use_llm_clients) answers each user message with the reply the
+script gives for it, and the stub TTS backend waits --tts-latency-ms before its
+first chunk. Every bot reply is spoken through
+GET /speak unless --no-speak.
+
+Every response carries its trace id (x-trace-id), so the spans in memory tell
+which substep served each turn and how many LLM calls it made. Reported:
+turns per second, LLM calls per completed task (by script) and p50/p95/p99
+latency per substep and per API endpoint.
+
+    python benchmarks/bench_replay.py --repeat 20 --sessions 8 --save baseline.json
+    python benchmarks/bench_replay.py --repeat 20 --sessions 8 --baseline baseline.json
+
+With --baseline the run fails (exit status 1) when a task fails, a script needs more
+LLM calls, turns/s drops or a substep's p95 grows by more than --tolerance
+(plus --slack-ms, for substeps that take a few milliseconds).
+"""
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "replay_scripts.json")
+CLARIFICATION_QUESTION = "Could you tell me a little more about what you would like to do?"
+
+
+def normalize(text: str) -> str:
+    # fill_handler joins spaced digits before asking the LLM ("1 2 3" -> "123")
+    return re.sub(r"(?<=\d) (?=\d)", "", " ".join((text or "").split())).lower()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class ScriptedLLM:
+    """
+    The fake LLM's responder: answers from the scripts' "llm" replies. Replies are keyed by the
+    latest user message, so they don't depend on which prompt or how many calls a turn makes.
+    """
+
+    def __init__(self, scripts, intent_prompt: str):
+        self.intent_prompt = intent_prompt.strip()
+        self.answers = {}        # normalized user message -> {"intent": ..., "label": ...}
+        for script in scripts:
+            for step in script["steps"]:
+                if "say" not in step or "llm" not in step:
+                    continue
+                reply = step["llm"] if isinstance(step["llm"], dict) else {"label": step["llm"]}
+                key = normalize(step["say"])
+                if self.answers.get(key, reply) != reply:
+                    raise ValueError(f"Scripts answer {step['say']!r} in two different ways")
+                self.answers[key] = reply
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.unscripted = 0
+
+    def _answer_for(self, messages):
+        system = messages[0]["content"] if messages else ""
+        users = [m["content"] for m in messages[1:] if m.get("role") == "user"]
+        if users:
+            text = normalize(users[-1])
+        else:
+            # confirmation_handler puts the user's message inside its prompt
+            match = re.search(r'User message is: "(.*)"', system)
+            text = normalize(match.group(1)) if match else ""
+        answer = self.answers.get(text)
+        if answer is None:
+            # Merged consecutive user messages end with the scripted one
+            answer = next((self.answers[k] for k in sorted(self.answers, key=len, reverse=True) if text.endswith(k)), None)
+        return system, answer
+
+    def reply(self, messages) -> str:
+        system, answer = self._answer_for(messages)
+        with self._lock:
+            self.calls += 1
+        if "go_back or none" in system:
+            return "none"
+        if "is unclear. Your job is to ask" in system:
+            return CLARIFICATION_QUESTION
+        if answer is None:
+            with self._lock:
+                self.unscripted += 1
+            return "clarification_required"
+        if system.strip() == self.intent_prompt:
+            return answer.get("intent", "clarification_required")
+        if "single JSON object" in system:
+            return json.dumps({"intent": answer.get("intent", "clarification_required"), "question": CLARIFICATION_QUESTION,
+                               "go_back": False, "label": answer.get("label")})
+        return answer.get("label", "clarification_required")
+
+
+def load_app(args):
+    """Imports main against temporary stores and swaps in the fakes; returns (module, trace exporter, fake LLM)."""
+    tmp = tempfile.mkdtemp(prefix="bench_replay_")
+    for name, filename in (("PAYEE_DB_PATH", "payees.sqlite3"), ("MUTATIONS_DB_PATH", "mutations.sqlite3"),
+                           ("STATEMENTS_DB_PATH", "statements.sqlite3"), ("SESSION_DB_PATH", "sessions.sqlite3"),
+                           ("AUTOPAY_EXECUTIONS_PATH", "autopay_executions.sqlite3"), ("CONTACTS_DB_PATH", "contacts.sqlite3"),
+                           ("TTS_CACHE_DIR", "tts")):
+        os.environ.setdefault(name, os.path.join(tmp, filename))
+    os.environ["LLM_BACKEND"] = "fake"  # its clients are replaced by the scripted ones below
+    os.environ["LLM_CACHE_BACKEND"] = args.llm_cache
+    os.environ.setdefault("TTS_PRERENDER", "0")
+    os.environ.setdefault("AUTOPAY_TICK_SECONDS", "0")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.chdir(ROOT)  # main mounts ./static
+
+    bot = importlib.import_module("main")
+    from fake_llm import FakeLLM, LatencyModel
+    from tracing import MemoryExporter
+    from tts import create_tts_service
+
+    with open(args.scripts, encoding="utf-8") as f:
+        scripts = json.load(f)["scripts"]
+    if args.only:
+        scripts = [s for s in scripts if s["name"] in args.only]
+    fake = ScriptedLLM(scripts, bot.INTENT_PROMPT)
+    latency = LatencyModel("uniform", (max(0.0, args.llm_latency_ms - args.llm_jitter_ms),
+                                       args.llm_latency_ms + args.llm_jitter_ms), seed=args.seed)
+    llm = FakeLLM(templates=vars(bot), latency=latency, responder=fake.reply)
+    bot.use_llm_clients(llm.client(), llm.async_client())
+    bot.tts_service = create_tts_service("stub", cache_dir=os.environ["TTS_CACHE_DIR"], stub_latency_ms=args.tts_latency_ms)
+    exporter = MemoryExporter(max_traces=10_000_000)
+    bot.tracer.exporters.append(exporter)
+    return bot, exporter, fake, scripts
+
+
+def run_script(http, script, run_id, speak):
+    """Drives one task like the browser does; returns (completed, records), one record per request."""
+    endpoint, assistant = script["endpoint"], script["assistant"]
+    messages, intent, page, flags, state = [], None, None, {}, {}
+    records = []
+
+    def send(kind, label_page, method, path, **kwargs):
+        started = time.perf_counter()
+        res = http.request(method, path, **kwargs)
+        records.append({"kind": kind, "page": label_page, "trace_id": res.headers.get("x-trace-id"),
+                        "seconds": time.perf_counter() - started})
+        return res
+
+    for index, step in enumerate(script["steps"]):
+        if "flags" in step:
+            flags = dict(step["flags"])
+        if "request" in step:
+            req = step["request"]
+            res = send("request", page, req["method"], req["path"], json=req.get("json"),
+                       headers={"Idempotency-Key": f"replay-{script['name']}-{run_id}-{index}"})
+        else:
+            new_page = "page" in step
+            if new_page:
+                page = step["page"]
+                if intent is None:
+                    continue  # the page only resumes the conversation once there's an intent
+            else:
+                messages.append({"role": "user", "content": step["say"]})
+            body = {"messages": messages, "newPageLoaded": new_page, "intent": intent, "currentPage": page,
+                    "state": state, "substep_flags": flags, "assistant": assistant}
+            res = send("page load" if new_page else "turn", page, "POST", endpoint, json=body)
+            if res.status_code < 400:
+                data = res.json() or {}
+                intent = data.get("intent") or intent
+                state = data.get("state") or state
+                flags = data.get("substep_flags") or flags
+                spoken = []
+                if data.get("botMessage"):
+                    spoken.append(data["botMessage"])
+                for act in data.get("action") or []:
+                    if isinstance(act, dict) and act.get("immediate_reply"):
+                        spoken.append(act["immediate_reply"])
+                for text in spoken:
+                    messages.append({"role": "assistant", "content": text})
+                    if speak:
+                        send("speak", page, "GET", f"/speak?text={quote(text)}")
+        if res.status_code >= 400 or step.get("expect", "") not in res.text:
+            print(f"  {script['name']} run {run_id}: step {index} failed ({res.status_code}): {res.text[:200]}")
+            return False, records
+    return True, records
+
+
+def traces_by_id(exporter):
+    spans = defaultdict(list)
+    for trace in list(exporter.traces):
+        for span in trace:
+            spans[span.trace_id].append(span)
+    return spans
+
+
+def describe(record, spans, assistant):
+    """(latency label, LLM calls) for one request from its trace."""
+    llm_calls = sum(1 for s in spans if s.name == "llm.call" and not s.attributes.get("cached"))
+    if record["kind"] in ("turn", "page load"):
+        route = next((s for s in spans if s.name == "flow.route"), None)
+        substep = route.attributes.get("substep") if route else None
+        if substep is None:
+            substep = "(intent)" if any(s.name == "classify" for s in spans) else "(no route)"
+        suffix = " (page load)" if record["kind"] == "page load" else ""
+        return f"{assistant} {record['page']} {substep}{suffix}", llm_calls
+    root = next((s for s in spans if s.parent_id is None), None)
+    endpoint = root.attributes.get("endpoint", "?") if root else "?"
+    method = root.attributes.get("method", "") if root else ""
+    return f"{method} {endpoint}", llm_calls
+
+
+def run(args):
+    bot, exporter, fake, scripts = load_app(args)
+    from fastapi.testclient import TestClient
+
+    jobs = [(script, run_id) for run_id in range(args.repeat) for script in scripts]
+    with TestClient(bot.app) as http:
+        # One untimed pass, so first-request costs (imports, TTS renders of static replies) aren't measured
+        for script in scripts:
+            run_script(http, script, "warmup", not args.no_speak)
+        exporter.traces.clear()
+        fake.calls = fake.unscripted = 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            outcomes = list(pool.map(lambda job: (job[0], *run_script(http, job[0], job[1], not args.no_speak)), jobs))
+        elapsed = time.perf_counter() - started
+
+    spans = traces_by_id(exporter)
+    latencies = defaultdict(list)
+    per_script = {s["name"]: {"runs": 0, "completed": 0, "llm_calls": 0} for s in scripts}
+    turns = 0
+    for script, completed, records in outcomes:
+        totals = per_script[script["name"]]
+        totals["runs"] += 1
+        calls = 0
+        for record in records:
+            label, llm_calls = describe(record, spans.get(record["trace_id"], []), script["assistant"])
+            latencies[label].append(record["seconds"])
+            calls += llm_calls
+            turns += record["kind"] in ("turn", "page load")
+        if completed:
+            totals["completed"] += 1
+            totals["llm_calls"] += calls
+
+    return {
+        "config": {k: getattr(args, k) for k in ("repeat", "sessions", "llm_latency_ms", "llm_jitter_ms",
+                                                 "tts_latency_ms", "llm_cache", "seed")} | {"speak": not args.no_speak},
+        "seconds": elapsed,
+        "turns": turns,
+        "turns_per_sec": turns / elapsed if elapsed else 0.0,
+        "failed_tasks": sum(t["runs"] - t["completed"] for t in per_script.values()),
+        "llm_calls": fake.calls,
+        "unscripted_llm_calls": fake.unscripted,
+        "scripts": {
+            name: {**t, "llm_calls_per_task": t["llm_calls"] / t["completed"] if t["completed"] else None}
+            for name, t in per_script.items()
+        },
+        "substeps": {
+            label: {"n": len(values), "p50_ms": percentile(values, 50) * 1000, "p95_ms": percentile(values, 95) * 1000,
+                    "p99_ms": percentile(values, 99) * 1000}
+            for label, values in sorted(latencies.items())
+        },
+    }
+
+
+def report(results):
+    c = results["config"]
+    print(f"{len(results['scripts'])} scripts x {c['repeat']} runs, {c['sessions']} concurrent sessions, "
+          f"fake LLM {c['llm_latency_ms']:.0f}+/-{c['llm_jitter_ms']:.0f} ms, fake TTS {c['tts_latency_ms']:.0f} ms, "
+          f"LLM cache {c['llm_cache']}, speak {'on' if c['speak'] else 'off'}")
+    print(f"{results['turns']} turns in {results['seconds']:.1f} s: {results['turns_per_sec']:.1f} turns/s; "
+          f"failed tasks: {results['failed_tasks']}; unscripted LLM calls: {results['unscripted_llm_calls']}")
+    print(f"\n{'script':<36} {'runs':>5} {'done':>5} {'LLM calls/task':>15}")
+    for name, s in results["scripts"].items():
+        calls = f"{s['llm_calls_per_task']:.2f}" if s["llm_calls_per_task"] is not None else "-"
+        print(f"{name:<36} {s['runs']:>5} {s['completed']:>5} {calls:>15}")
+    print(f"\n{'substep / endpoint':<58} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label, s in results["substeps"].items():
+        print(f"{label:<58} {s['n']:>5} {s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f}")
+
+
+def compare(results, baseline, tolerance, slack_ms):
+    """The regressions of results against a saved baseline, as messages (empty when the run passes)."""
+    problems = []
+    changed = {k: (v, results["config"].get(k)) for k, v in baseline.get("config", {}).items() if results["config"].get(k) != v}
+    if changed:
+        problems.append("run settings differ from the baseline's: " +
+                        ", ".join(f"{k} {base} -> {now}" for k, (base, now) in changed.items()))
+    if results["failed_tasks"]:
+        problems.append(f"{results['failed_tasks']} task(s) failed")
+    for name, base in baseline.get("scripts", {}).items():
+        now = results["scripts"].get(name)
+        if now is None or base["llm_calls_per_task"] is None or now["llm_calls_per_task"] is None:
+            continue
+        if now["llm_calls_per_task"] > base["llm_calls_per_task"] + 1e-9:
+            problems.append(f"{name}: {now['llm_calls_per_task']:.2f} LLM calls per task (baseline {base['llm_calls_per_task']:.2f})")
+    if results["turns_per_sec"] < baseline["turns_per_sec"] * (1 - tolerance):
+        problems.append(f"{results['turns_per_sec']:.1f} turns/s (baseline {baseline['turns_per_sec']:.1f})")
+    for label, base in baseline.get("substeps", {}).items():
+        now = results["substeps"].get(label)
+        if now is not None and now["p95_ms"] > base["p95_ms"] * (1 + tolerance) + slack_ms:
+            problems.append(f"{label}: p95 {now['p95_ms']:.1f} ms (baseline {base['p95_ms']:.1f} ms)")
+    return problems
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scripts", default=DEFAULT_SCRIPTS)
+    parser.add_argument("--only", nargs="+", help="script names to run")
+    parser.add_argument("--repeat", type=int, default=10, help="runs of every script")
+    parser.add_argument("--sessions", type=int, default=8, help="conversations in flight at once")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--tts-latency-ms", type=float, default=150)
+    parser.add_argument("--no-speak", action="store_true", help="don't request /speak for bot replies")
+    parser.add_argument("--llm-cache", choices=["off", "memory"], default="off",
+                        help="off by default: repeated scripts would otherwise be served from the cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results as JSON (a baseline for --baseline)")
+    parser.add_argument("--baseline", help="compare against saved results and exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95 / throughput change")
+    parser.add_argument("--slack-ms", type=float, default=25.0, help="allowed absolute p95 change on top of --tolerance")
+    args = parser.parse_args()
+
+    results = run(args)
+    report(results)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    problems = [f"{results['failed_tasks']} task(s) failed"] if results["failed_tasks"] else []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(results, json.load(f), args.tolerance, args.slack_ms)
+    if problems:
+        print("\nREGRESSION:\n  " + "\n  ".join(problems))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
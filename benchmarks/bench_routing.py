@@ -0,0 +1,167 @@
+"""
+Micro-benchmark of per-turn routing: which substep handles this turn?
+
+Compares the old approach (look up flows[intent][assistant][page], walk the
+OrderedDict of substeps checking each completion condition, then rebuild the
+handler's label list and prompt) with the compiled flow graph's bitmask lookup
+and precomputed prompts. The "logged" variant includes the per-substep prints
+the old router made on every turn (written to /dev/null). Times are net of the
+benchmark loop's own overhead.
+
+    python benchmarks/bench_routing.py --iterations 200000
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import (  # noqa: E402
+    CLARIFICATION_PROMPT,
+    CLASSIFICATION_DECISION_PROMPT,
+    FILL_PROMPT,
+    SELECTION_PROMPT,
+    flow_graph,
+    flows,
+)
+
+
+def linear_route(intent, assistant, page, substep_flags):
+    """The pre-compiled routing: dict lookups plus a linear scan over substeps."""
+    if intent in flows and page in flows[intent][assistant]:
+        for name, substep in flows[intent][assistant][page]["substeps"].items():
+            if not substep_flags.get(substep.get("completion_condition", ""), ""):
+                return name
+    return None
+
+
+def linear_route_logged(intent, assistant, page, substep_flags):
+    """The old router including the prints it made on every turn."""
+    print("==Handling known intent:", intent)
+    if intent in flows and page in flows[intent][assistant]:
+        substeps = flows[intent][assistant][page]["substeps"]
+        print("====substeps:", substeps.keys())
+        print("===Handling first incomplete substep...")
+        print("===substep_flags:", substep_flags)
+        for name, substep in substeps.items():
+            condition = substep.get("completion_condition", "")
+            print("Checking condition:", condition)
+            if not substep_flags.get(condition, ""):
+                print("Found first incomplete substep:", name)
+                print("Dynamic handler type:", substep.get("dynamic_handler", ""))
+                return name
+    return None
+
+
+def linear_route_with_prompts(intent, assistant, page, substep_flags):
+    """The old router plus the prompt strings handlers rebuilt on every turn."""
+    if intent in flows and page in flows[intent][assistant]:
+        for name, substep in flows[intent][assistant][page]["substeps"].items():
+            if not substep_flags.get(substep.get("completion_condition", ""), ""):
+                options = substep.get("options")
+                if options:
+                    label_list = "', '".join(options.keys())
+                    prompt = CLASSIFICATION_DECISION_PROMPT.format(label_list=label_list)
+                    if substep.get("prompt"):
+                        prompt += "\n\n" + substep["prompt"]
+                    SELECTION_PROMPT.format(label_list=label_list)
+                    CLARIFICATION_PROMPT.format(label_list=label_list)
+                elif substep.get("dynamic_handler") == "fill_handler":
+                    FILL_PROMPT.format(field=substep.get("field", ""), value=substep.get("value", ""))
+                return name
+    return None
+
+
+def compiled_route(intent, assistant, page, substep_flags):
+    node = flow_graph.route(intent, assistant, page, substep_flags)
+    return node.name if node else None
+
+
+def compiled_route_with_prompts(intent, assistant, page, substep_flags):
+    node = flow_graph.route(intent, assistant, page, substep_flags)
+    if node is None:
+        return None
+    spec = node.spec
+    if "label_list" in spec:
+        spec["classification_prompt"], spec["selection_prompt"], spec["clarification_prompt"]
+    elif "fill_prompt" in spec:
+        spec["fill_prompt"]
+    return node.name
+
+
+def noop_route(intent, assistant, page, substep_flags):
+    return None
+
+
+def build_workload():
+    """Every (intent, assistant, page) with each prefix of its substeps completed."""
+    workload = []
+    for intent, assistants in flows.items():
+        for assistant, pages in assistants.items():
+            for page, step in pages.items():
+                flags = {}
+                workload.append((intent, assistant, page, dict(flags)))
+                for substep in step["substeps"].values():
+                    condition = substep.get("completion_condition")
+                    if condition:
+                        flags[condition] = True
+                        workload.append((intent, assistant, page, dict(flags)))
+    return workload
+
+
+def run(route, workload, iterations):
+    n = len(workload)
+    started = time.perf_counter()
+    for i in range(iterations):
+        intent, assistant, page, flags = workload[i % n]
+        route(intent, assistant, page, flags)
+    return time.perf_counter() - started
+
+
+def allocations_per_route(route, workload, rounds=1000):
+    tracemalloc.start()
+    for intent, assistant, page, flags in workload:  # warm up caches
+        route(intent, assistant, page, flags)
+    before = tracemalloc.take_snapshot()
+    for _ in range(rounds):
+        for intent, assistant, page, flags in workload:
+            route(intent, assistant, page, flags)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return retained / (rounds * len(workload))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200_000)
+    args = parser.parse_args()
+
+    workload = build_workload()
+    for intent, assistant, page, flags in workload:
+        assert linear_route(intent, assistant, page, flags) == compiled_route(intent, assistant, page, flags), (intent, assistant, page, flags)
+
+    print(f"{len(workload)} routing cases, {args.iterations} lookups each\n")
+    overhead = run(noop_route, workload, args.iterations)
+    routers = (
+        ("linear (logged)", linear_route_logged),
+        ("linear", linear_route),
+        ("compiled", compiled_route),
+        ("linear + prompts", linear_route_with_prompts),
+        ("compiled + prompts", compiled_route_with_prompts),
+    )
+    print(f"{'router':>20} {'routes/s':>14} {'ns/route':>10} {'retained B/route':>17}")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        rows = [
+            (name, max(run(route, workload, args.iterations) - overhead, 1e-9), allocations_per_route(route, workload))
+            for name, route in routers
+        ]
+    for name, elapsed, retained in rows:
+        print(f"{name:>20} {args.iterations / elapsed:>14,.0f} {elapsed / args.iterations * 1e9:>10.0f} {retained:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
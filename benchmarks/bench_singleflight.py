@@ -0,0 +1,90 @@
+"""
+Upstream LLM requests with and without single-flight, under thundering-herd bursts.
+
+Each burst is --herd sessions answering the same question the same way at the
+same moment (the yes/no classifier over "Would you like to download the
+statement?" / "yes", and the recipient classification over "Bob Chen"), plus
+--distinct sessions saying something of their own. The calls go through
+main.api_call in-process, against fake_llm with --latency-ms per completion and
+llm_cache off, for the async and the sync (threadpool) client.
+
+    python benchmarks/bench_singleflight.py --bursts 20 --herd 50 --distinct 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+TMP = tempfile.mkdtemp(prefix="bench_singleflight_")
+for name, filename in (("PAYEE_DB_PATH", "payees.sqlite3"), ("MUTATIONS_DB_PATH", "mutations.sqlite3"),
+                       ("STATEMENTS_DB_PATH", "statements.sqlite3"), ("SESSION_DB_PATH", "sessions.sqlite3"),
+                       ("AUTOPAY_EXECUTIONS_PATH", "autopay_executions.sqlite3"), ("CONTACTS_DB_PATH", "contacts.sqlite3")):
+    os.environ.setdefault(name, os.path.join(TMP, filename))
+os.environ.update({"LLM_BACKEND": "fake", "LLM_CACHE_BACKEND": "off", "TTS_PRERENDER": "0", "LOG_LEVEL": "WARNING"})
+os.chdir(ROOT)  # main mounts ./static
+
+import main  # noqa: E402
+from fake_llm import FakeLLM, LatencyModel  # noqa: E402
+from singleflight import SingleFlight  # noqa: E402
+
+HERDS = [
+    (main.YESNO_CLASSIFIER_PROMPT, [{"role": "assistant", "content": "Would you like to download the statement?"},
+                                    {"role": "user", "content": "yes"}], "yesno"),
+    (main.CLASSIFICATION_DECISION_PROMPT.format(label_list="Bob Chen', 'Sophia Smith', 'Add New Contact"),
+     [{"role": "assistant", "content": "Who would you like to send money to?"},
+      {"role": "user", "content": "Bob Chen"}], "classification"),
+]
+
+
+async def burst(index, args):
+    prompt, messages, kind = HERDS[index % len(HERDS)]
+    calls = [main.api_call(prompt, messages, kind=kind) for _ in range(args.herd)]
+    calls += [main.api_call(main.YESNO_CLASSIFIER_PROMPT,
+                            [{"role": "user", "content": f"yes, number {index}-{i}"}], kind="yesno")
+              for i in range(args.distinct)]
+    await asyncio.gather(*calls)
+
+
+async def run_bursts(args):
+    for index in range(args.bursts):
+        await burst(index, args)
+
+
+def bench(mode, enabled, args):
+    llm = FakeLLM(latency=LatencyModel("fixed", (args.latency_ms,)), default_reply="yes")
+    main.use_llm_clients(llm.client(), llm.async_client())
+    main.llm_client_mode = mode
+    main.llm_flight = SingleFlight() if enabled else None
+    started = time.perf_counter()
+    asyncio.run(run_bursts(args))
+    elapsed = time.perf_counter() - started
+    requests = args.bursts * (args.herd + args.distinct)
+    upstream = llm.stats()["calls"]
+    return {"mode": mode, "singleflight": "on" if enabled else "off", "requests": requests, "upstream": upstream,
+            "fan_in": requests / upstream, "seconds": elapsed}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--herd", type=int, default=50)
+    parser.add_argument("--distinct", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--modes", nargs="+", choices=["async", "sync"], default=["async", "sync"])
+    args = parser.parse_args()
+
+    print(f"{args.bursts} bursts of {args.herd} identical + {args.distinct} distinct calls, fake LLM {args.latency_ms:.0f} ms")
+    print(f"{'client':>7} {'flight':>7} {'requests':>9} {'upstream':>9} {'fan-in':>7} {'seconds':>8}")
+    for mode in args.modes:
+        for enabled in (False, True):
+            row = bench(mode, enabled, args)
+            print(f"{row['mode']:>7} {row['singleflight']:>7} {row['requests']:>9} {row['upstream']:>9} "
+                  f"{row['fan_in']:>7.2f} {row['seconds']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main_cli()
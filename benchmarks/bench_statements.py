@@ -0,0 +1,95 @@
+"""
+Statement export and activity paging over a multi-year transaction history.
+
+Loads a synthetic history into a temporary TransactionStore, then:
+- streams the whole statement through statement_csv() and reports throughput and
+  peak memory (tracemalloc), next to building the same CSV as one string
+- times a deep activity page reached by cursor against the same page via OFFSET
+
+    python benchmarks/bench_statements.py --years 10 --per-day 40
+"""
+import argparse
+from datetime import date, timedelta
+from itertools import islice
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from statements import TransactionStore, encode_cursor, statement_csv  # noqa: E402
+
+DESCRIPTIONS = ["GROCERIES", "GAS", "PAYROLL DEPOSIT", "E-TRANSFER", "BC HYDRO", "TELUS MOBILE", "COFFEE", "RENT"]
+
+
+def history(years, per_day, seed=5):
+    rng = random.Random(seed)
+    day = date(2025, 1, 1) - timedelta(days=365 * years)
+    for _ in range(365 * years):
+        for _ in range(per_day):
+            description = rng.choice(DESCRIPTIONS)
+            amount = rng.uniform(1000, 3000) if description == "PAYROLL DEPOSIT" else -rng.uniform(2, 200)
+            yield day, description, round(amount, 2)
+        day += timedelta(days=1)
+
+
+def measure(fn):
+    """(result, seconds, peak MB); timed and traced in separate runs, as tracemalloc slows allocation down."""
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--per-day", type=int, default=40)
+    parser.add_argument("--page-size", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TransactionStore(os.path.join(tmp, "statements.sqlite3"))
+        started = time.perf_counter()
+        n = store.append("chequing", history(args.years, args.per_day), opening_balance=1000)
+        print(f"loaded {n:,} transactions ({args.years} years) in {time.perf_counter() - started:.1f}s\n")
+
+        def streamed():
+            size = 0
+            for block in statement_csv(store.iter_transactions("chequing")):
+                size += len(block)  # a response would write the block to the socket here
+            return size
+
+        def whole():
+            return len("".join(statement_csv(store.iter_transactions("chequing"))))
+
+        for label, fn in (("streamed CSV", streamed), ("whole CSV", whole)):
+            size, elapsed, peak = measure(fn)
+            print(f"{label:>13}: {size / 2 ** 20:7.1f} MB in {elapsed:5.2f}s = {n / elapsed:>10,.0f} rows/s, peak {peak:7.1f} MB")
+
+        # The page a user reaches after clicking "Show more" a few hundred times
+        depth = min(n - args.page_size, 500 * args.page_size)
+        last = next(islice(store.iter_transactions("chequing"), depth - 1, None))
+        cursor = encode_cursor(last)
+        started = time.perf_counter()
+        page = store.page("chequing", cursor=cursor, limit=args.page_size)
+        keyset_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        offset_rows = store._conn.execute(
+            "SELECT id FROM account_transactions WHERE account = ? ORDER BY posted DESC, id DESC LIMIT ? OFFSET ?",
+            ("chequing", args.page_size, depth),
+        ).fetchall()
+        offset_ms = (time.perf_counter() - started) * 1000
+        assert [t["id"] for t in page["transactions"]] == [r[0] for r in offset_rows]
+        print(f"\npage at row {depth:,}: cursor {keyset_ms:.2f} ms vs OFFSET {offset_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
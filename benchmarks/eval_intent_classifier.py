@@ -0,0 +1,104 @@
+"""
+Offline accuracy and latency of the local intent classifier (intent_classifier.py).
+
+Trains on the seed file (plus any --logs recordings) and scores the held-out
+utterances in intent_eval.json. Reported:
+
+- accuracy of the top label over everything, and the confusion matrix
+- per confidence threshold: coverage (the share answered locally, without
+  INTENT_PROMPT) and accuracy on what was answered locally
+- latency of one predict() (p50/p99 over --repeat runs of every utterance)
+  and batch throughput of predict_batch()
+
+    python benchmarks/eval_intent_classifier.py
+    python benchmarks/eval_intent_classifier.py --logs recorded.jsonl --thresholds 0.5 0.7 0.9
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from intent_classifier import IntentClassifier  # noqa: E402
+
+DEFAULT_EVAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_eval.json")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def load_eval(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    texts, labels = [], []
+    for label, utterances in data.items():
+        if label.startswith("_"):
+            continue
+        texts += utterances
+        labels += [label] * len(utterances)
+    return texts, labels
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", default=os.path.join(ROOT, "intent_seed.json"))
+    parser.add_argument("--logs", nargs="*", default=[], help="fake_llm fixture/recording files to train on too")
+    parser.add_argument("--eval", default=DEFAULT_EVAL)
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[0.5, 0.6, 0.7, 0.8, 0.9])
+    parser.add_argument("--min-similarity", type=float, default=0.1)
+    parser.add_argument("--temperature", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    model = IntentClassifier.train(args.seed, args.logs, min_similarity=args.min_similarity, temperature=args.temperature)
+    train_ms = (time.perf_counter() - started) * 1000
+    texts, truth = load_eval(args.eval)
+
+    predicted, confidences, _ = model.predict_batch(texts)
+    correct = [p == t for p, t in zip(predicted, truth)]
+    print(f"trained in {train_ms:.1f} ms; {len(texts)} held-out utterances, labels {', '.join(model.labels)}")
+    print(f"top-label accuracy: {sum(correct) / len(texts):.1%}\n")
+
+    width = max(len(label) for label in model.labels)
+    print(f"{'truth/predicted':>{width}}  " + "  ".join(f"{label[:10]:>10}" for label in model.labels))
+    for label in model.labels:
+        row = [sum(1 for p, t in zip(predicted, truth) if t == label and p == other) for other in model.labels]
+        print(f"{label:>{width}}  " + "  ".join(f"{n:>10}" for n in row))
+
+    print(f"\n{'threshold':>9} {'coverage':>9} {'local acc':>10} {'to LLM':>7}")
+    for threshold in args.thresholds:
+        model.threshold = threshold
+        _, _, confident = model.predict_batch(texts)
+        local = [ok for ok, c in zip(correct, confident) if c]
+        accuracy = sum(local) / len(local) if local else 0.0
+        print(f"{threshold:>9.2f} {len(local) / len(texts):>9.1%} {accuracy:>10.1%} {len(texts) - len(local):>7}")
+    wrong = [(t, p, c, text) for text, t, p, c, ok in zip(texts, truth, predicted, confidences, correct) if not ok]
+    if wrong:
+        print("\nmisclassified (truth -> predicted, confidence):")
+        for t, p, c, text in sorted(wrong, key=lambda w: -w[2]):
+            print(f"  {t} -> {p} {c:.2f}  {text!r}")
+
+    timings = []
+    for _ in range(args.repeat):
+        for text in texts:
+            started = time.perf_counter()
+            model.predict(text)
+            timings.append((time.perf_counter() - started) * 1e6)
+    batch = (texts * (args.batch // len(texts) + 1))[:args.batch]
+    started = time.perf_counter()
+    model.predict_batch(batch)
+    batch_seconds = time.perf_counter() - started
+    print(f"\npredict(): p50 {percentile(timings, 50):.0f} us, p99 {percentile(timings, 99):.0f} us "
+          f"over {len(timings)} calls")
+    print(f"predict_batch({args.batch}): {batch_seconds * 1000:.1f} ms, {args.batch / batch_seconds:,.0f} texts/s")
+
+
+if __name__ == "__main__":
+    main_cli()
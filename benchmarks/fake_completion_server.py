@@ -0,0 +1,116 @@
+"""
+A local stand-in for the Azure OpenAI chat completions endpoint.
+
+It answers from recorded fixtures (fake_llm.FakeLLM; record them with
+LLM_RECORD_PATH on the bot) after a delay drawn from a latency model, and can
+fail a share of requests with 429s, 500s or timeouts, so we can load-test the
+bot without touching Azure. Without fixtures, or on a miss, it makes up a reply
+(the first option of a classifier prompt, a known intent, or "yes"). A fixture's
+recorded latency is used unless FAKE_LLM_LATENCY says otherwise. Run it with:
+
+    FAKE_LLM_LATENCY_MS=800 uvicorn benchmarks.fake_completion_server:app --port 8765
+    FAKE_LLM_FIXTURES=fixtures.jsonl FAKE_LLM_LATENCY=lognormal:350:0.5 FAKE_LLM_ERRORS=429:0.02,timeout:0.005 \
+        uvicorn benchmarks.fake_completion_server:app --port 8765
+
+and point the bot at it with AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8765
+Fixtures are keyed by the prompt templates in main.py (FAKE_LLM_TEMPLATES to read
+another file); an injected timeout holds the request for FAKE_LLM_TIMEOUT_SECONDS
+so the client's own timeout fires. GET /stats shows hits, misses and injected errors.
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_llm import ErrorInjector, FakeLLM, FixtureStore, LatencyModel, templates_from_source  # noqa: E402
+
+app = FastAPI()
+
+latency_ms = float(os.getenv("FAKE_LLM_LATENCY_MS", "800"))
+
+
+def fake_reply(system_prompt: str) -> str:
+    # Intent prompt -> a known intent, classification prompts -> the first option, everything else -> "yes"
+    if "identify the user's goal" in system_prompt:
+        return "e_transfer"
+    match = re.search(r"'([^']+?)'", system_prompt)
+    if match:
+        return match.group(1).split("', '")[0]
+    return "yes"
+
+
+seed = os.getenv("FAKE_LLM_SEED")
+fixtures_path = os.getenv("FAKE_LLM_FIXTURES")
+llm = FakeLLM(
+    fixtures=FixtureStore.load(fixtures_path) if fixtures_path else None,
+    templates=templates_from_source(os.getenv("FAKE_LLM_TEMPLATES", os.path.join(ROOT, "main.py"))),
+    latency=LatencyModel.parse(os.getenv("FAKE_LLM_LATENCY", f"recorded:fixed:{latency_ms}"), seed=int(seed) if seed else None),
+    errors=ErrorInjector.parse(os.getenv("FAKE_LLM_ERRORS"), seed=int(seed) if seed else None),
+    responder=lambda messages: fake_reply(messages[0]["content"] if messages else ""),
+    timeout_seconds=float(os.getenv("FAKE_LLM_TIMEOUT_SECONDS", "600")),
+)
+
+
+def error_response(kind: str):
+    status = int(kind)
+    kind_name = "rate_limit_exceeded" if status == 429 else "server_error"
+    return JSONResponse(
+        {"error": {"code": str(status), "type": kind_name, "message": f"Injected {status} from the fake server"}},
+        status_code=status,
+        headers={"retry-after": "1"} if status == 429 else None,
+    )
+
+
+def sse_chunks(plan, deployment):
+    for chunk in plan.chunks(deployment):
+        body = {
+            "id": chunk.id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": deployment,
+            "choices": [{"index": 0, "finish_reason": None, "delta": {"content": chunk.choices[0].delta.content}}],
+        }
+        yield f"data: {json.dumps(body)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def chat_completions(deployment: str, request: Request):
+    body = await request.json()
+    plan = llm.plan(body.get("messages", []))
+
+    await asyncio.sleep(plan.delay_seconds)
+    if plan.error == "timeout":
+        return error_response("500")  # only reached if the client waits longer than the timeout
+    if plan.error:
+        return error_response(plan.error)
+
+    if body.get("stream"):
+        return StreamingResponse(sse_chunks(plan, deployment), media_type="text/event-stream")
+    completion = plan.completion(deployment)
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": deployment,
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": plan.reply},
+            }
+        ],
+        "usage": vars(completion.usage),
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return llm.stats()
@@ -0,0 +1,139 @@
+"""
+E-transfer contacts: SQLite (WAL) for persistence, records in memory for matchers.
+
+The recipient step used to hardcode three contacts as classifier options. Real
+contact lists run to hundreds or thousands of people, so contacts now live here,
+unique by email like payees are by account, and OptionRetriever
+(option_retrieval.py) keeps its own phonetic and trigram index over records().
+
+Like PayeeStore, every worker watches PRAGMA data_version and loads only rows
+with a higher id when another connection has committed.
+"""
+from bisect import bisect_left
+from dataclasses import dataclass
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from payee_store import normalize_name
+
+
+@dataclass(frozen=True)
+class ContactRecord:
+    id: int
+    name: str
+    email: str
+    name_norm: str
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "name": self.name, "email": self.email}
+
+
+class ContactStore:
+    def __init__(self, path: str, clock=time.time):
+        self.clock = clock
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS contacts ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, email TEXT NOT NULL UNIQUE, "
+            "name_norm TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._by_id = {}
+        self._ordered_ids = []
+        self._by_email = {}
+        self._last_id = 0
+        self._data_version = None
+        self._refresh()
+
+    def _refresh(self):
+        """Loads rows committed by other workers since the last look."""
+        with self._lock:
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return
+            rows = self._conn.execute(
+                "SELECT id, name, email, name_norm FROM contacts WHERE id > ? ORDER BY id", (self._last_id,)
+            ).fetchall()
+            for row in rows:
+                record = ContactRecord(*row)
+                self._by_id[record.id] = record
+                self._ordered_ids.append(record.id)
+                self._by_email[record.email] = record
+                self._last_id = record.id
+            self._data_version = version
+
+    # --- writes ---
+
+    def add(self, name: str, email: str):
+        """Returns (contact, created). A known email isn't added twice."""
+        name, email = name.strip(), email.strip().lower()
+        with self._lock:
+            self._refresh()
+            existing = self._by_email.get(email)
+            if existing is not None:
+                return existing, False
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO contacts (name, email, name_norm, created_at) VALUES (?, ?, ?, ?)",
+                (name, email, normalize_name(name), self.clock()),
+            )
+            # Our own commits don't move data_version, so force the incremental reload
+            self._data_version = None
+            self._refresh()
+            return self._by_email[email], cursor.rowcount == 1
+
+    def add_many(self, contacts):
+        """Bulk load of (name, email) pairs in one transaction; known emails are skipped."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO contacts (name, email, name_norm, created_at) VALUES (?, ?, ?, ?)",
+                    [(n.strip(), e.strip().lower(), normalize_name(n), self.clock()) for n, e in contacts],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._data_version = None
+            self._refresh()
+
+    # --- reads ---
+
+    def get(self, contact_id: int) -> Optional[ContactRecord]:
+        self._refresh()
+        return self._by_id.get(contact_id)
+
+    def get_by_email(self, email: str) -> Optional[ContactRecord]:
+        self._refresh()
+        return self._by_email.get((email or "").strip().lower())
+
+    def records(self, after_id: int = 0) -> list:
+        """Contacts added after after_id, in id order, for matchers that keep their own index."""
+        self._refresh()
+        with self._lock:
+            start = bisect_left(self._ordered_ids, after_id + 1)
+            return [self._by_id[i] for i in self._ordered_ids[start:]]
+
+    def list(self, offset: int = 0, limit: int = 50) -> dict:
+        self._refresh()
+        with self._lock:
+            ids = self._ordered_ids[offset:offset + limit]
+            total = len(self._ordered_ids)
+            return {
+                "contacts": [self._by_id[i].to_dict() for i in ids],
+                "total": total,
+                "offset": offset,
+                "limit": limit,
+                "next_offset": offset + limit if offset + limit < total else None,
+            }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"contacts": len(self._by_id)}
+
+    def __len__(self):
+        self._refresh()
+        return len(self._by_id)
@@ -0,0 +1,169 @@
+"""
+Context window and token budget for every prompt sent by api_call.
+
+Each prompt kind ("intent", "yesno", "fill", "generation", ...) gets a Budget:
+- max_messages: how many of the latest raw messages the prompt may see
+- max_tokens: token budget for the system prompt plus messages
+
+When a conversation is over budget, the oldest turns are dropped and replaced by
+a short extractive summary of what the user said in them, so long sessions keep
+constant-size prompts. Tokens are counted with tiktoken when it is installed and
+with a word/punctuation approximation otherwise.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, replace
+import json
+import re
+import threading
+from typing import Optional
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken missing or its encoding file can't be loaded offline
+    _encoding = None
+
+# Chat format overhead per message and per request (OpenAI's accounting for gpt-3.5/4 models)
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REQUEST = 3
+
+SUMMARY_PREFIX = "Earlier in the conversation the user said: "
+
+
+def count_text_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text or ""))
+    return len(re.findall(r"\w+|[^\w\s]", text or ""))
+
+
+def count_prompt_tokens(system_prompt: str, messages: list) -> int:
+    total = TOKENS_PER_REQUEST + TOKENS_PER_MESSAGE + count_text_tokens(system_prompt)
+    for m in messages:
+        total += TOKENS_PER_MESSAGE + count_text_tokens(m.get("content", ""))
+    return total
+
+
+@dataclass(frozen=True)
+class Budget:
+    max_tokens: int
+    max_messages: Optional[int] = None  # None: no window, only the token budget applies
+    summary_tokens: int = 60            # 0 disables summarizing dropped turns
+
+
+DEFAULT_BUDGETS = {
+    "intent": Budget(max_tokens=1200),
+    "classification": Budget(max_tokens=1500),
+    "selection": Budget(max_tokens=600, max_messages=1),
+    # The question, a clarifying exchange ("what does that mean?" and the answer) and the reply
+    "yesno": Budget(max_tokens=600, max_messages=4),
+    "checkbox": Budget(max_tokens=600, max_messages=4),
+    "confirmation": Budget(max_tokens=600),
+    "go_back": Budget(max_tokens=1000, max_messages=6),
+    "combined": Budget(max_tokens=1500),
+    "fill": Budget(max_tokens=1000, max_messages=5),
+    # A payee name and its spelling can come over several turns: no window, only the token budget
+    "payee_name": Budget(max_tokens=1000),
+    "form_state": Budget(max_tokens=2500),
+    "generation": Budget(max_tokens=2500),
+}
+
+
+def budgets_from_env(raw: str) -> dict:
+    """Overrides like '{"fill": {"max_tokens": 800}, "intent": {"max_messages": 8}}' on top of the defaults."""
+    budgets = dict(DEFAULT_BUDGETS)
+    for kind, overrides in (json.loads(raw) if raw else {}).items():
+        budgets[kind] = replace(budgets.get(kind, DEFAULT_BUDGETS["generation"]), **overrides)
+    return budgets
+
+
+def _summarize(dropped: list, summary_tokens: int) -> str:
+    """Extractive summary: the user's words from the dropped turns, newest kept when it doesn't all fit."""
+    said = [m["content"].strip() for m in dropped if m.get("role") == "user" and m.get("content", "").strip()]
+    summary = ""
+    for text in reversed(said):
+        candidate = text if not summary else text + " | " + summary
+        if count_text_tokens(candidate) > summary_tokens:
+            break
+        summary = candidate
+    return summary
+
+
+class ContextBudgetManager:
+    def __init__(self, budgets: dict):
+        self.budgets = budgets
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {
+            "calls": 0, "prompt_tokens": 0, "max_prompt_tokens": 0, "trimmed_calls": 0,
+            "usage_prompt_tokens": 0, "usage_completion_tokens": 0,
+        })
+
+    def budget_for(self, kind) -> Budget:
+        return self.budgets.get(kind) or self.budgets["generation"]
+
+    def window(self, kind, messages: list) -> list:
+        """Keeps the latest max_messages raw messages (before consecutive roles are merged)."""
+        max_messages = self.budget_for(kind).max_messages
+        if max_messages is None or len(messages) <= max_messages:
+            return messages
+        return messages[-max_messages:] if max_messages else []
+
+    def fit(self, kind, system_prompt: str, messages: list):
+        """
+        Drops the oldest messages until the prompt fits the kind's token budget.
+        Returns (messages, report) where report has the prompt token count for this call.
+        """
+        budget = self.budget_for(kind)
+        kept = list(messages)
+        dropped = []
+        tokens = count_prompt_tokens(system_prompt, kept)
+        target = budget.max_tokens
+        if tokens > target and budget.summary_tokens:
+            # Leave room for the summary of whatever gets dropped
+            target -= budget.summary_tokens + TOKENS_PER_MESSAGE + count_text_tokens(SUMMARY_PREFIX)
+        while tokens > target and len(kept) > 1:
+            dropped.append(kept.pop(0))
+            tokens = count_prompt_tokens(system_prompt, kept)
+
+        if dropped and budget.summary_tokens:
+            summary = _summarize(dropped, budget.summary_tokens)
+            if summary:
+                summary_message = {"role": "system", "content": SUMMARY_PREFIX + summary}
+                with_summary = count_prompt_tokens(system_prompt, [summary_message] + kept)
+                if with_summary <= budget.max_tokens:
+                    kept.insert(0, summary_message)
+                    tokens = with_summary
+
+        report = {
+            "kind": kind,
+            "prompt_tokens": tokens,
+            "messages_in": len(messages),
+            "messages_sent": len(kept),
+            "dropped": len(dropped),
+        }
+        self._record(report)
+        return kept, report
+
+    def _record(self, report):
+        with self._lock:
+            stats = self._stats[report["kind"]]
+            stats["calls"] += 1
+            stats["prompt_tokens"] += report["prompt_tokens"]
+            stats["max_prompt_tokens"] = max(stats["max_prompt_tokens"], report["prompt_tokens"])
+            if report["dropped"]:
+                stats["trimmed_calls"] += 1
+
+    def record_usage(self, kind, usage):
+        """Adds the token counts the API reported for a completion, when it reports them."""
+        if usage is None:
+            return
+        with self._lock:
+            stats = self._stats[kind]
+            stats["usage_prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            stats["usage_completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                kind: {**s, "avg_prompt_tokens": s["prompt_tokens"] / s["calls"] if s["calls"] else 0.0}
+                for kind, s in self._stats.items()
+            }
@@ -0,0 +1,485 @@
+"""
+Recorded completions behind OpenAI-compatible clients, for load tests without Azure.
+
+FakeLLM answers chat.completions.create() from fixtures: JSONL lines, one per
+completion, recorded from real traffic by RecordingClient or written by hand.
+
+    {"template": "YESNO_CLASSIFIER_PROMPT", "labels": null, "user": "yes please", "reply": "yes", "latency_ms": 412.5}
+
+A fixture is keyed by the prompt template the system prompt was formatted from
+(matched against the module's *PROMPT* constants, so CLASSIFICATION_DECISION_PROMPT
+with any label list is still CLASSIFICATION_DECISION_PROMPT), its label set (the
+filled-in fields: label_list for the classifiers, field/value for FILL_PROMPT)
+and the user's message. Lookups fall back from the exact message to the
+template + label set ("user": null), then to the template alone; several
+fixtures under one key are served in turn.
+
+Each call waits for a delay drawn from a LatencyModel and may fail the way
+Azure does (ErrorInjector: 429, 500, timeouts). FakeLLM.client() and
+async_client() stand in for AzureOpenAI / AsyncAzureOpenAI in-process;
+benchmarks/fake_completion_server.py serves the same over HTTP.
+"""
+import ast
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import string
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Mapping, Optional
+
+TEMPLATE_NAME = re.compile(r"^[A-Z][A-Z0-9_]*PROMPT[A-Z0-9_]*$")
+ERROR_KINDS = ("429", "500", "timeout")
+
+
+def normalize_user(text) -> Optional[str]:
+    if not isinstance(text, str) or not text.strip():
+        return None
+    return " ".join(text.lower().split())
+
+
+def templates_from_source(path: str) -> dict:
+    """The *PROMPT* string constants of a module, read without importing it (for the fake server)."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    templates = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and TEMPLATE_NAME.match(target.id):
+                    templates[target.id] = node.value.value
+    return templates
+
+
+def compile_template(template: str):
+    """A regex matching the template with any field values; fields become named groups."""
+    pattern, fields = [], []
+    for literal, field, _, _ in string.Formatter().parse(template.strip()):
+        pattern.append(re.escape(literal))
+        if field is None:
+            continue
+        if field in fields:
+            pattern.append(f"(?P={field})")
+        else:
+            fields.append(field)
+            pattern.append(f"(?P<{field}>.*?)")
+    return re.compile("".join(pattern), re.DOTALL)
+
+
+class PromptKeyer:
+    """
+    Maps a request's messages to its fixture key: (template name, label set, user message).
+    templates may be a module's globals(): only *PROMPT* string values are used, and they are
+    compiled on first use, so a module can pass its namespace before its prompts are defined.
+    """
+
+    def __init__(self, templates: Mapping, max_cached: int = 4096):
+        self._source = templates
+        self._compiled = None
+        self._cache = {}
+        self._max_cached = max_cached
+        self._lock = threading.Lock()
+
+    def _templates(self):
+        if self._compiled is None:
+            named = [(name, value) for name, value in list(self._source.items())
+                     if TEMPLATE_NAME.match(name) and isinstance(value, str)]
+            # Most literal text first, so a short template never shadows a longer one
+            named.sort(key=lambda item: -len(re.sub(r"\{[^{}]*\}", "", item[1])))
+            self._compiled = [(name, compile_template(value)) for name, value in named]
+        return self._compiled
+
+    def match(self, system_prompt: str):
+        """(template name, fields) for a system prompt; unknown prompts are named by their hash."""
+        prompt = (system_prompt or "").strip()
+        with self._lock:
+            hit = self._cache.get(prompt)
+        if hit is not None:
+            return hit
+        hit = None
+        for name, regex in self._templates():
+            found = regex.fullmatch(prompt)
+            if found:
+                hit = (name, found.groupdict())
+                break
+        if hit is None:
+            hit = ("unregistered:" + hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12], {})
+        with self._lock:
+            if len(self._cache) >= self._max_cached:
+                self._cache.clear()
+            self._cache[prompt] = hit
+        return hit
+
+    def key(self, messages):
+        system = messages[0]["content"] if messages and messages[0].get("role") == "system" else ""
+        name, fields = self.match(system)
+        fields = dict(fields)
+        # confirmation_handler puts the user's message inside its prompt
+        user = fields.pop("user_message", None)
+        if user is None:
+            user = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), None)
+        if "label_list" in fields:
+            labels = fields["label_list"]
+        else:
+            labels = " | ".join(f"{k}={v}" for k, v in fields.items()) or None
+        return name, labels, normalize_user(user)
+
+
+class FixtureStore:
+    def __init__(self, entries=()):
+        self._replies = {}  # (template, labels, user) -> [fixture, ...]
+        self._turn = {}
+        self._lock = threading.Lock()
+        for entry in entries:
+            self.add(entry)
+
+    @classmethod
+    def load(cls, path: str) -> "FixtureStore":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.loads(line) for line in f if line.strip())
+
+    def add(self, entry: dict):
+        key = (entry["template"], entry.get("labels"), normalize_user(entry.get("user")))
+        self._replies.setdefault(key, []).append(entry)
+
+    def __len__(self):
+        return sum(len(v) for v in self._replies.values())
+
+    def lookup(self, template, labels, user) -> Optional[dict]:
+        for key in ((template, labels, user), (template, labels, None), (template, None, None)):
+            entries = self._replies.get(key)
+            if entries:
+                with self._lock:
+                    turn = self._turn.get(key, 0)
+                    self._turn[key] = turn + 1
+                return entries[turn % len(entries)]
+        return None
+
+
+class LatencyModel:
+    """
+    Delay before a reply, from a spec string:
+      fixed:MS, uniform:LO:HI, normal:MEAN:SD, lognormal:MEDIAN:SIGMA
+      recorded[:<spec>]  the fixture's recorded latency_ms, else <spec> (default fixed:0)
+    """
+
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+
+    def __init__(self, kind: str = "fixed", params=(0.0,), use_recorded: bool = False, seed: Optional[int] = None):
+        if kind not in self.KINDS or len(params) != self.KINDS[kind]:
+            raise ValueError(f"Bad latency model {kind}{list(params)}")
+        self.kind = kind
+        self.params = tuple(float(p) for p in params)
+        self.use_recorded = use_recorded
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: Optional[str], seed: Optional[int] = None) -> "LatencyModel":
+        parts = (spec or "fixed:0").strip().split(":")
+        use_recorded = parts[0] == "recorded"
+        if use_recorded:
+            parts = parts[1:] or ["fixed", "0"]
+        try:
+            return cls(parts[0], [float(p) for p in parts[1:]], use_recorded, seed)
+        except ValueError:
+            raise ValueError(f"Bad latency spec {spec!r}; expected e.g. fixed:300, uniform:200:400, "
+                             "normal:300:50, lognormal:300:0.5 or recorded:lognormal:300:0.5") from None
+
+    def sample_ms(self, recorded_ms: Optional[float] = None) -> float:
+        if self.use_recorded and recorded_ms is not None:
+            return float(recorded_ms)
+        with self._lock:
+            if self.kind == "fixed":
+                value = self.params[0]
+            elif self.kind == "uniform":
+                value = self._rng.uniform(*self.params)
+            elif self.kind == "normal":
+                value = self._rng.gauss(*self.params)
+            else:
+                median, sigma = self.params
+                value = self._rng.lognormvariate(math.log(max(median, 1e-6)), sigma)
+        return max(0.0, value)
+
+
+class ErrorInjector:
+    """The share of calls that fail, by kind: '429:0.02,timeout:0.01,500:0.005'."""
+
+    def __init__(self, rates: Optional[dict] = None, seed: Optional[int] = None):
+        self.rates = dict(rates or {})
+        unknown = set(self.rates) - set(ERROR_KINDS)
+        if unknown:
+            raise ValueError(f"Unknown error kinds {sorted(unknown)}; expected {ERROR_KINDS}")
+        if sum(self.rates.values()) > 1:
+            raise ValueError("Error rates add up to more than 1")
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: Optional[str], seed: Optional[int] = None) -> "ErrorInjector":
+        rates = {}
+        for item in (spec or "").split(","):
+            if item.strip():
+                kind, _, rate = item.strip().partition(":")
+                rates[kind] = float(rate)
+        return cls(rates, seed)
+
+    def pick(self) -> Optional[str]:
+        if not self.rates:
+            return None
+        with self._lock:
+            draw = self._rng.random()
+        for kind, rate in self.rates.items():
+            if draw < rate:
+                return kind
+            draw -= rate
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text or "") // 4)
+
+
+def openai_error(kind: str):
+    """The exception the openai SDK raises for an injected failure."""
+    import httpx
+    import openai
+
+    request = httpx.Request("POST", "http://fake-llm/chat/completions")
+    if kind == "timeout":
+        return openai.APITimeoutError(request=request)
+    status = int(kind)
+    response = httpx.Response(status, request=request, headers={"retry-after": "1"})
+    error = openai.RateLimitError if status == 429 else openai.InternalServerError
+    return error(f"Injected {status} from fake_llm", response=response, body=None)
+
+
+class Plan:
+    """What one call will do: wait delay_seconds, then fail with error or return reply."""
+
+    def __init__(self, reply: str, delay_seconds: float, error: Optional[str], prompt_tokens: int):
+        self.reply = reply
+        self.delay_seconds = delay_seconds
+        self.error = error
+        self.prompt_tokens = prompt_tokens
+
+    def completion(self, model: str = "fake"):
+        return SimpleNamespace(
+            id="chatcmpl-fake",
+            model=model,
+            choices=[SimpleNamespace(index=0, finish_reason="stop",
+                                     message=SimpleNamespace(role="assistant", content=self.reply))],
+            usage=SimpleNamespace(prompt_tokens=self.prompt_tokens, completion_tokens=estimate_tokens(self.reply),
+                                  total_tokens=self.prompt_tokens + estimate_tokens(self.reply)),
+        )
+
+    def chunks(self, model: str = "fake"):
+        for piece in re.findall(r"\S+\s*|\s+", self.reply) or [""]:
+            yield SimpleNamespace(id="chatcmpl-fake", model=model, choices=[
+                SimpleNamespace(index=0, finish_reason=None, delta=SimpleNamespace(role="assistant", content=piece))])
+
+
+class FakeLLM:
+    """
+    Serves completions from fixtures; a miss goes to responder(messages) when given, else default_reply.
+    A timeout waits timeout_seconds before raising, as a client with that timeout would.
+    """
+
+    def __init__(self, fixtures: Optional[FixtureStore] = None, templates: Mapping = None,
+                 latency: Optional[LatencyModel] = None, errors: Optional[ErrorInjector] = None,
+                 responder: Optional[Callable] = None, default_reply: str = "clarification_required",
+                 timeout_seconds: float = 60.0):
+        self.fixtures = fixtures or FixtureStore()
+        self.keyer = PromptKeyer(templates or {})
+        self.latency = latency or LatencyModel()
+        self.errors = errors or ErrorInjector()
+        self.responder = responder
+        self.default_reply = default_reply
+        self.timeout_seconds = timeout_seconds
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "fixture_hits": 0, "responder_replies": 0, "default_replies": 0}
+        self._errors = {kind: 0 for kind in ERROR_KINDS}
+        self._templates = {}
+
+    def plan(self, messages) -> Plan:
+        messages = list(messages)
+        template, labels, user = self.keyer.key(messages)
+        fixture = self.fixtures.lookup(template, labels, user)
+        if fixture is not None:
+            reply, source = fixture["reply"], "fixture_hits"
+        else:
+            reply = self.responder(messages) if self.responder else None
+            source = "responder_replies" if reply is not None else "default_replies"
+            if reply is None:
+                reply = self.default_reply
+        error = self.errors.pick()
+        if error == "timeout":
+            delay = self.timeout_seconds
+        else:
+            delay = self.latency.sample_ms(fixture.get("latency_ms") if fixture else None) / 1000
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats[source] += 1
+            self._templates[template] = self._templates.get(template, 0) + 1
+            if error:
+                self._errors[error] += 1
+        prompt_tokens = sum(estimate_tokens(m.get("content")) for m in messages if isinstance(m.get("content"), str))
+        return Plan(reply, delay, error, prompt_tokens)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "fixtures": len(self.fixtures), "errors": dict(self._errors),
+                    "by_template": dict(self._templates)}
+
+    def client(self) -> "FakeClient":
+        return FakeClient(self)
+
+    def async_client(self) -> "AsyncFakeClient":
+        return AsyncFakeClient(self)
+
+
+class _Completions:
+    def __init__(self, llm: FakeLLM):
+        self.llm = llm
+
+    def create(self, model: str = "fake", messages=(), stream: bool = False, **kwargs):
+        plan = self.llm.plan(messages)
+        time.sleep(plan.delay_seconds)
+        if plan.error:
+            raise openai_error(plan.error)
+        return plan.chunks(model) if stream else plan.completion(model)
+
+
+class _AsyncCompletions:
+    def __init__(self, llm: FakeLLM):
+        self.llm = llm
+
+    async def create(self, model: str = "fake", messages=(), stream: bool = False, **kwargs):
+        plan = self.llm.plan(messages)
+        await asyncio.sleep(plan.delay_seconds)
+        if plan.error:
+            raise openai_error(plan.error)
+        if not stream:
+            return plan.completion(model)
+
+        async def relay():
+            for chunk in plan.chunks(model):
+                yield chunk
+        return relay()
+
+
+class FakeClient:
+    """Stands in for AzureOpenAI: client.chat.completions.create(model=, messages=, stream=)."""
+
+    def __init__(self, llm: FakeLLM):
+        self.llm = llm
+        self.chat = SimpleNamespace(completions=_Completions(llm))
+
+    def close(self):
+        pass
+
+
+class AsyncFakeClient:
+    """Stands in for AsyncAzureOpenAI."""
+
+    def __init__(self, llm: FakeLLM):
+        self.llm = llm
+        self.chat = SimpleNamespace(completions=_AsyncCompletions(llm))
+
+    async def close(self):
+        pass
+
+
+class FixtureRecorder:
+    """Appends one fixture line per completion, so recorded traffic can be replayed by FakeLLM."""
+
+    def __init__(self, path: str, templates: Mapping):
+        self.path = path
+        self.keyer = PromptKeyer(templates)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def record(self, messages, reply: str, latency_ms: float):
+        template, labels, user = self.keyer.key(list(messages))
+        line = json.dumps({"template": template, "labels": labels, "user": user, "reply": reply,
+                           "latency_ms": round(latency_ms, 1)}, ensure_ascii=False)
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.recorded += 1
+
+    def stats(self) -> dict:
+        return {"path": self.path, "recorded": self.recorded}
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class _RecordingCompletions:
+    def __init__(self, inner, recorder: FixtureRecorder):
+        self.inner = inner
+        self.recorder = recorder
+
+    def create(self, *args, messages=(), stream: bool = False, **kwargs):
+        started = time.perf_counter()
+        response = self.inner.create(*args, messages=messages, stream=stream, **kwargs)
+        if stream:
+            return self._relay(response, messages, started)
+        self.recorder.record(messages, response.choices[0].message.content or "", (time.perf_counter() - started) * 1000)
+        return response
+
+    def _relay(self, stream, messages, started):
+        parts = []
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        self.recorder.record(messages, "".join(parts), (time.perf_counter() - started) * 1000)
+
+
+class _AsyncRecordingCompletions(_RecordingCompletions):
+    async def create(self, *args, messages=(), stream: bool = False, **kwargs):
+        started = time.perf_counter()
+        response = await self.inner.create(*args, messages=messages, stream=stream, **kwargs)
+        if stream:
+            return self._relay_async(response, messages, started)
+        self.recorder.record(messages, response.choices[0].message.content or "", (time.perf_counter() - started) * 1000)
+        return response
+
+    async def _relay_async(self, stream, messages, started):
+        parts = []
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        self.recorder.record(messages, "".join(parts), (time.perf_counter() - started) * 1000)
+
+
+class RecordingClient:
+    """Wraps an AzureOpenAI client: completions pass through and are appended to the recorder."""
+
+    def __init__(self, inner, recorder: FixtureRecorder):
+        self.inner = inner
+        self.chat = SimpleNamespace(completions=_RecordingCompletions(inner.chat.completions, recorder))
+
+    def close(self):
+        self.inner.close()
+
+
+class AsyncRecordingClient:
+    """Wraps an AsyncAzureOpenAI client."""
+
+    def __init__(self, inner, recorder: FixtureRecorder):
+        self.inner = inner
+        self.chat = SimpleNamespace(completions=_AsyncRecordingCompletions(inner.chat.completions, recorder))
+
+    async def close(self):
+        await self.inner.close()
@@ -0,0 +1,126 @@
+"""
+Deterministic fast-path for short yes/no and selection replies.
+
+Most answers to "Would you like to download the statement?" or "Which account do you
+want to pay from?" are one or two words. The matcher builds a small lexicon from the
+substep's option labels plus synonym lists and answers locally when the reply is one
+of those phrases, or is made only of one label's phrases and filler words. Anything
+ambiguous, negated ("don't cancel"), long, or with words of its own ("no problem")
+returns None so the caller falls back to the LLM.
+"""
+from collections import defaultdict
+import re
+import threading
+
+# Replies longer than this are left to the LLM
+MAX_TOKENS = 6
+
+# Tokens that flip the meaning of whatever they precede ("don't cancel", "not yes"); only an exact phrase may contain one
+NEGATORS = {"not", "dont", "never", "cant", "wont", "shouldnt", "didnt", "doesnt"}
+
+# Words that never identify an option on their own
+FILLER = {"the", "a", "an", "my", "i", "want", "to", "please", "um", "uh", "would", "like", "from", "use", "it", "one",
+          "just", "thanks", "im"}
+
+# Synonyms keyed by normalized option label. Substeps can extend these with a "synonyms" key.
+SYNONYMS = {
+    "yes": ["yes", "yeah", "yep", "yup", "sure", "ok", "okay", "correct", "confirm", "confirmed",
+            "absolutely", "of course", "please do", "go ahead", "do it", "that's right", "right", "affirmative"],
+    "no": ["no", "nope", "nah", "no thanks", "no thank you", "not now", "cancel", "stop", "negative"],
+    "chequing account": ["chequing", "checking", "cheque account", "check account"],
+    "savings account": ["savings", "saving", "save account"],
+    "cancel": ["cancel", "cancel it", "stop", "abort", "never mind", "nevermind"],
+    "continue": ["continue", "proceed", "go ahead", "next", "keep going", "send it"],
+    "add payee": ["add payee", "add the payee", "add it", "add"],
+}
+
+
+def normalize(text: str) -> list:
+    """Lowercase, drop apostrophes and punctuation, and split into tokens."""
+    text = (text or "").lower().replace("'", "").replace("’", "")
+    return re.sub(r"[^a-z0-9]+", " ", text).split()
+
+
+class FastPathMatcher:
+    def __init__(self, synonyms=None, max_tokens=MAX_TOKENS):
+        self.synonyms = synonyms if synonyms is not None else SYNONYMS
+        self.max_tokens = max_tokens
+        self._tables = {}
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: {"calls": 0, "hits": 0})
+
+    def _phrase_table(self, labels, extra_synonyms=None):
+        """
+        Returns a tuple of (phrase_tokens, label) pairs for a label set.
+        Tables for substeps without extra synonyms are cached by label set.
+        """
+        key = tuple(labels)
+        if not extra_synonyms and key in self._tables:
+            return self._tables[key]
+
+        label_tokens = {label: normalize(label.replace("_", " ")) for label in labels}
+        table = []
+        for label, tokens in label_tokens.items():
+            normalized_label = " ".join(tokens)
+            phrases = {tuple(tokens)}
+            phrases.update(tuple(normalize(s)) for s in self.synonyms.get(normalized_label, []))
+            if extra_synonyms:
+                phrases.update(tuple(normalize(s)) for s in extra_synonyms.get(label, []))
+            # A token that only this label uses is enough on its own ("savings" for "savings account")
+            other_tokens = {t for other, toks in label_tokens.items() if other != label for t in toks}
+            phrases.update((t,) for t in tokens if t not in other_tokens and t not in FILLER)
+            table.extend((phrase, label) for phrase in phrases if phrase)
+        table = tuple(table)
+
+        if not extra_synonyms:
+            self._tables[key] = table
+        return table
+
+    def match(self, text, labels, extra_synonyms=None):
+        """Returns the single matching label, or None when the reply is not clear-cut."""
+        tokens = normalize(text)
+        if not tokens or len(tokens) > self.max_tokens:
+            return None
+
+        table = self._phrase_table(labels, extra_synonyms)
+        exact = {label for phrase, label in table if phrase == tuple(tokens)}
+        if len(exact) == 1:
+            return exact.pop()  # the whole reply is one label's phrase ("not now", "no thank you")
+        # "don't cancel", "I don't want to cancel": a negator anywhere else may invert what it's next to
+        if NEGATORS.intersection(tokens):
+            return None
+
+        matched, covered = set(), set()
+        for phrase, label in table:
+            n = len(phrase)
+            for i in range(len(tokens) - n + 1):
+                if tuple(tokens[i:i + n]) == phrase:
+                    matched.add(label)
+                    covered.update(range(i, i + n))
+        if len(matched) != 1:
+            return None
+        # Every other word must be filler: "no problem" and "no worries" aren't answers to the question
+        if any(i not in covered and token not in FILLER for i, token in enumerate(tokens)):
+            return None
+        return matched.pop()
+
+    def classify(self, handler, text, labels, extra_synonyms=None):
+        """match() plus per-handler hit counting."""
+        label = self.match(text, labels, extra_synonyms)
+        with self._lock:
+            counter = self._counters[handler]
+            counter["calls"] += 1
+            if label is not None:
+                counter["hits"] += 1
+        return label
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                handler: {
+                    **counter,
+                    "llm_fallbacks": counter["calls"] - counter["hits"],
+                    "hit_rate": counter["hits"] / counter["calls"] if counter["calls"] else 0.0,
+                }
+                for handler, counter in self._counters.items()
+            }
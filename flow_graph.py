@@ -0,0 +1,131 @@
+"""
+Flows compiled into an immutable, indexed graph at startup.
+
+The OrderedDict flows in main.py stay the source of truth for authoring. At import
+time they are compiled so that a turn's routing is a fixed number of dict lookups
+and integer operations:
+
+- pages are indexed by (intent, assistant, page name)
+- each substep gets a bit; completion flags fold into a bitmask and a per-page
+  table maps every mask to the first incomplete substep
+- each substep carries its handler from a dispatch table, plus any strings the
+  caller precomputes for it (label lists, formatted prompts)
+"""
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Mapping, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class CompiledSubstep:
+    name: str
+    index: int
+    condition: str          # completion flag name, "" when the substep never completes on its own
+    handler_name: str
+    handler: Callable       # async handler(substep, messages, intent, new_page_loaded, label=None)
+    spec: Mapping           # read-only view of the substep dict plus precomputed keys
+
+
+@dataclass(frozen=True)
+class CompiledPage:
+    intent: str
+    assistant: str
+    page: str
+    substeps: Tuple[CompiledSubstep, ...]
+    condition_bits: Tuple[Tuple[str, int], ...]  # (flag name, bits of the substeps it completes)
+    full_mask: int
+
+    # lowest_clear_bit[mask] -> index of the first incomplete substep, or None when all are complete
+    lowest_clear_bit: Tuple[Optional[int], ...]
+
+    def first_incomplete(self, substep_flags) -> Optional[CompiledSubstep]:
+        mask = 0
+        for condition, bits in self.condition_bits:
+            if substep_flags.get(condition):
+                mask |= bits
+        index = self.lowest_clear_bit[mask]
+        return None if index is None else self.substeps[index]
+
+
+class FlowGraph:
+    def __init__(self, pages):
+        self._pages = pages  # (intent, assistant, page name) -> CompiledPage, never mutated after compile
+
+    def page(self, intent, assistant, page) -> Optional[CompiledPage]:
+        return self._pages.get((intent, assistant, page))
+
+    def route(self, intent, assistant, page, substep_flags) -> Optional[CompiledSubstep]:
+        compiled_page = self._pages.get((intent, assistant, page))
+        if compiled_page is None:
+            return None
+        return compiled_page.first_incomplete(substep_flags)
+
+    def pages(self):
+        return iter(self._pages.values())
+
+    def substeps(self):
+        for compiled_page in self.pages():
+            yield from compiled_page.substeps
+
+
+def _lowest_clear_bit(mask, full_mask):
+    incomplete = ~mask & full_mask
+    return (incomplete & -incomplete).bit_length() - 1 if incomplete else None
+
+
+def _freeze_substep(substep: dict, extra: dict) -> Mapping:
+    spec = dict(substep)
+    if "options" in spec:
+        spec["options"] = MappingProxyType({
+            label: MappingProxyType({
+                **option,
+                **({"action": tuple(option["action"])} if "action" in option else {}),
+            })
+            for label, option in spec["options"].items()
+        })
+    if isinstance(spec.get("action"), list):
+        spec["action"] = tuple(spec["action"])
+    spec.update(extra)
+    return MappingProxyType(spec)
+
+
+def compile_flows(flows, handlers, default_handler, precompute=None) -> FlowGraph:
+    """
+    flows: intent -> assistant -> page -> {"substeps": OrderedDict(name -> substep)}
+    handlers: dispatch table from "dynamic_handler" names to handler callables
+    default_handler: handler for substeps without a "dynamic_handler"
+    precompute: optional fn(name, substep) -> dict of extra keys stored on each substep
+    """
+    pages_by_key = {}
+    for intent, assistants in flows.items():
+        for assistant, pages in assistants.items():
+            for page_name, page in pages.items():
+                compiled_substeps = []
+                condition_bits = {}
+                for i, (name, substep) in enumerate(page.get("substeps", {}).items()):
+                    handler_name = substep.get("dynamic_handler", "")
+                    if handler_name and handler_name not in handlers:
+                        raise ValueError(f"Unknown dynamic_handler '{handler_name}' in {intent}/{assistant}/{page_name}/{name}")
+                    condition = substep.get("completion_condition") or ""
+                    if condition:
+                        condition_bits[condition] = condition_bits.get(condition, 0) | (1 << i)
+                    extra = precompute(name, substep) if precompute else {}
+                    compiled_substeps.append(CompiledSubstep(
+                        name=name,
+                        index=i,
+                        condition=condition,
+                        handler_name=handler_name,
+                        handler=handlers[handler_name] if handler_name else default_handler,
+                        spec=_freeze_substep(substep, extra),
+                    ))
+                full_mask = (1 << len(compiled_substeps)) - 1
+                pages_by_key[(intent, assistant, page_name)] = CompiledPage(
+                    intent=intent,
+                    assistant=assistant,
+                    page=page_name,
+                    substeps=tuple(compiled_substeps),
+                    condition_bits=tuple(condition_bits.items()),
+                    full_mask=full_mask,
+                    lowest_clear_bit=tuple(_lowest_clear_bit(mask, full_mask) for mask in range(full_mask + 1)),
+                )
+    return FlowGraph(pages_by_key)
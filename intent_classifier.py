@@ -0,0 +1,194 @@
+"""
+Local intent classifier: hashed n-gram TF-IDF and nearest centroid, in NumPy.
+
+Every new conversation used to start with an INTENT_PROMPT completion, although
+there are only three intents (e_transfer, check_activity, pay_bill) plus
+clarification_required and most openings are phrased the same few ways. This
+model answers those locally and routes only uncertain inputs to the LLM:
+
+- features: word unigrams and bigrams plus character 3-5-grams (so "etransfer",
+  "e-transfer" and "e transfer" land close), hashed into a fixed number of
+  buckets with crc32 (stable across processes), weighted by sublinear TF-IDF
+  and L2-normalized
+- one centroid per label, the normalized mean of its training vectors
+- scores are cosine similarities; confidence is their softmax at a fixed
+  temperature. A prediction below the threshold, or whose best similarity is
+  too low to be about banking at all, is returned as uncertain.
+
+Training data is a seed file ({label: [utterances]}, intent_seed.json) plus
+logged traffic: fixture/recording files from fake_llm, whose INTENT_PROMPT
+lines pair a user message with the label the LLM gave it.
+
+Scoring is vectorized over a batch: the features of all texts are flattened
+into (bucket, weight) arrays, and the scores are one gather from the centroid
+matrix and one np.add.reduceat.
+"""
+import json
+import re
+import threading
+import zlib
+from typing import Iterable, Optional
+
+import numpy as np
+
+LABELS = ("e_transfer", "check_activity", "pay_bill", "clarification_required")
+
+
+def tokenize(text: str) -> list:
+    text = (text or "").lower().replace("'", "").replace("’", "")
+    return [re.sub(r"\d+", "0", token) for token in re.findall(r"[a-z0-9]+", text)]
+
+
+def ngrams(text: str, char_range=(3, 5)) -> list:
+    tokens = tokenize(text)
+    grams = [f"w:{t}" for t in tokens]
+    grams += [f"b:{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    joined = f" {' '.join(tokens)} "
+    lo, hi = char_range
+    for n in range(lo, hi + 1):
+        grams += [f"c:{joined[i:i + n]}" for i in range(len(joined) - n + 1)]
+    return grams
+
+
+class IntentClassifier:
+    def __init__(self, buckets: int = 1 << 15, threshold: float = 0.7, min_similarity: float = 0.1,
+                 temperature: float = 0.05):
+        self.buckets = buckets
+        self.threshold = threshold
+        self.min_similarity = min_similarity
+        self.temperature = temperature
+        self.labels = ()
+        self.idf = None          # (buckets,) float32
+        self.centroids_t = None  # (buckets, labels) float32: transposed so a bucket's scores are one row
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "local": 0, "deferred": 0}
+
+    # Features
+
+    def _hashed(self, text: str):
+        counts = {}
+        for gram in ngrams(text):
+            bucket = zlib.crc32(gram.encode("utf-8")) % self.buckets
+            counts[bucket] = counts.get(bucket, 0) + 1
+        return counts
+
+    def _features(self, texts):
+        """Flattened sparse TF-IDF rows: (buckets, weights, row offsets), each row L2-normalized."""
+        indices, tfs, lengths = [], [], []
+        for text in texts:
+            counts = self._hashed(text)
+            indices.extend(counts)
+            tfs.extend(counts.values())
+            lengths.append(len(counts))
+        indices = np.fromiter(indices, dtype=np.int64, count=len(indices))
+        weights = 1.0 + np.log(np.fromiter(tfs, dtype=np.float32, count=len(tfs)))
+        if self.idf is not None:
+            weights *= self.idf[indices]
+        lengths = np.asarray(lengths, dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        norms = np.sqrt(np.bincount(rows, weights=weights.astype(np.float64) ** 2, minlength=len(lengths)))
+        weights /= np.maximum(norms, 1e-12)[rows].astype(np.float32)
+        return indices, weights, offsets, lengths
+
+    # Training
+
+    def fit(self, texts: list, labels: list) -> "IntentClassifier":
+        label_set = [label for label in LABELS if label in set(labels)]
+        label_set += sorted(set(labels) - set(label_set))
+        label_ids = np.array([label_set.index(label) for label in labels])
+
+        self.idf = None
+        indices, _, offsets, lengths = self._features(texts)
+        rows = np.repeat(np.arange(len(texts)), lengths)
+        document_frequency = np.bincount(indices, minlength=self.buckets)
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        indices, weights, offsets, lengths = self._features(texts)
+        centroids = np.zeros((len(label_set), self.buckets), dtype=np.float64)
+        np.add.at(centroids, (label_ids[rows], indices), weights)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        self.labels = tuple(label_set)
+        self.centroids_t = np.ascontiguousarray(centroids.T, dtype=np.float32)
+        return self
+
+    @classmethod
+    def train(cls, seed_path: str, log_paths: Iterable[str] = (), **options) -> "IntentClassifier":
+        texts, labels = load_seed(seed_path)
+        for path in log_paths:
+            logged_texts, logged_labels = load_logged(path)
+            texts += logged_texts
+            labels += logged_labels
+        return cls(**options).fit(texts, labels)
+
+    # Scoring
+
+    def scores(self, texts: list) -> np.ndarray:
+        """Cosine similarity of each text to each label's centroid, shape (len(texts), len(labels))."""
+        indices, weights, offsets, lengths = self._features(texts)
+        result = np.zeros((len(texts), len(self.labels)), dtype=np.float32)
+        if len(indices):
+            contributions = self.centroids_t[indices] * weights[:, None]
+            nonempty = lengths > 0
+            result[nonempty] = np.add.reduceat(contributions, offsets[nonempty], axis=0)
+        return result
+
+    def predict_batch(self, texts: list):
+        """(labels, confidences, confident): the best label per text, its softmax confidence, and whether to trust it."""
+        scores = self.scores(texts)
+        scaled = (scores - scores.max(axis=1, keepdims=True)) / self.temperature
+        probabilities = np.exp(scaled)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        best = probabilities.argmax(axis=1)
+        confidences = probabilities[np.arange(len(texts)), best]
+        confident = (confidences >= self.threshold) & (scores.max(axis=1) >= self.min_similarity)
+        return [self.labels[i] for i in best], confidences, confident
+
+    def predict(self, text: str):
+        """(label, confidence), with label None when the input should go to the LLM."""
+        labels, confidences, confident = self.predict_batch([text])
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["local" if confident[0] else "deferred"] += 1
+        return (labels[0] if confident[0] else None), float(confidences[0])
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls = self._stats["calls"]
+            return {**self._stats, "local_rate": self._stats["local"] / calls if calls else 0.0,
+                    "threshold": self.threshold}
+
+
+def load_seed(path: str):
+    with open(path, encoding="utf-8") as f:
+        seed = json.load(f)
+    texts, labels = [], []
+    for label, utterances in seed.items():
+        texts += utterances
+        labels += [label] * len(utterances)
+    return texts, labels
+
+
+def load_logged(path: str, template: str = "INTENT_PROMPT"):
+    """(texts, labels) from a fake_llm fixture/recording file: the user message and the intent the LLM answered."""
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            reply = (entry.get("reply") or "").strip().lower()
+            if entry.get("template") == template and entry.get("user") and reply in LABELS:
+                texts.append(entry["user"])
+                labels.append(reply)
+    return texts, labels
+
+
+def pending_user_text(messages) -> Optional[str]:
+    """The user's messages since the bot last spoke, joined; what the intent is read from."""
+    parts = []
+    for message in reversed(messages or []):
+        if message.get("role") != "user":
+            break
+        parts.append(message.get("content") or "")
+    return " ".join(reversed(parts)).strip() or None
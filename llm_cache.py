@@ -0,0 +1,164 @@
+"""
+Bounded LRU + TTL cache for classifier-style LLM responses.
+
+Keys are a hash of the system prompt and the normalized conversation, so
+"send money to Bob" from two different sessions resolves to the same entry.
+Two interchangeable backends are provided: an in-process OrderedDict and a
+local SQLite file that survives restarts and is shared by workers on one host.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def normalize_content(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def cache_key(prompt: str, messages: list) -> str:
+    """Hashes the system prompt plus the (already merged) messages."""
+    payload = {
+        "prompt": normalize_content(prompt),
+        "messages": [[m.get("role", ""), normalize_content(m.get("content", ""))] for m in messages],
+    }
+    encoded = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class MemoryCacheBackend:
+    """In-process LRU dict. Fast, but every worker has its own copy."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        """Returns (value, expired). value is None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None, True
+            self._entries.move_to_end(key)
+            return value, False
+
+    def set(self, key, value, now, expires_at):
+        """Stores the value and returns how many entries were evicted to make room."""
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCacheBackend:
+    """SQLite-backed LRU store on local disk."""
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+
+    def get(self, key, now):
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None, False
+            value, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None, True
+            self._conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+            return value, False
+
+    def set(self, key, value, now, expires_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+            if overflow <= 0:
+                return 0
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+            return overflow
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl_seconds: float, clock=time.time):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def get(self, prompt, messages):
+        value, expired = self.backend.get(cache_key(prompt, messages), self.clock())
+        if expired:
+            self._count("expirations")
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def set(self, prompt, messages, value):
+        now = self.clock()
+        evicted = self.backend.set(cache_key(prompt, messages), value, now, now + self.ttl_seconds)
+        if evicted:
+            self._count("evictions", evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = len(self.backend)
+        stats["backend"] = type(self.backend).__name__
+        return stats
+
+
+def create_cache(backend: str, max_entries: int, ttl_seconds: float, path: str = ".llm_cache.sqlite3"):
+    """Builds a ResponseCache from config. Returns None when caching is off."""
+    if backend == "memory":
+        return ResponseCache(MemoryCacheBackend(max_entries), ttl_seconds)
+    if backend == "disk":
+        return ResponseCache(DiskCacheBackend(path, max_entries), ttl_seconds)
+    if backend in ("off", "", None):
+        return None
+    raise ValueError(f"Unknown LLM cache backend: {backend}")
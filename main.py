@@ -1,18 +1,64 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from openai import AzureOpenAI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from dotenv import load_dotenv
-from collections import OrderedDict
-import azure.cognitiveservices.speech as speechsdk
+from collections import OrderedDict, deque
+from dataclasses import asdict
+from datetime import date
+from typing import Optional
+from contextvars import ContextVar
+from fake_llm import AsyncRecordingClient, ErrorInjector, FakeLLM, FixtureRecorder, FixtureStore, LatencyModel, RecordingClient
+from fastpath import FastPathMatcher
+from intent_classifier import IntentClassifier, pending_user_text
+from tracing import Tracer, TracingMiddleware, create_exporter
+from structured_logging import sampling_from_env, setup_logging
+from llm_cache import create_cache
+from flow_graph import compile_flows
+from sessions import Session, create_session_store
+from singleflight import SingleFlight, request_key
+from context_budget import ContextBudgetManager, budgets_from_env, count_prompt_tokens, count_text_tokens
+from tts import TTSError, create_tts_service
+from turn_queue import SessionTurnQueue
+from payee_store import PayeeStore
+from payee_resolver import PayeeNameResolver
+from contact_store import ContactStore
+from option_retrieval import OptionRetriever
+from spoken_numbers import parse_amount, parse_digits
+from statements import TransactionStore, statement_csv
+from mutations import IdempotencyConflict, MutationStore
+from autopay_scheduler import AutopayScheduler, SQLiteExecutionLog
+from alert_engine import AlertEngine, AlertIndex, AlertRule, CardTransaction, JsonlFileSink, LogSink, MemorySink
 from pydantic import BaseModel
+import httpx
+import asyncio
 import ast
+import functools
 import os
 import json
+import logging
 import re
 
 load_dotenv(override=True)
 
+# Leveled logging through a queue: the request path only enqueues records, a background thread writes them.
+# LOG_LEVEL=DEBUG shows per-turn detail (handlers, LLM replies); LOG_FORMAT=text|json;
+# LOG_SAMPLING='{"bankbot.flow": 0.1}' keeps a share of a category's DEBUG/INFO records;
+# amounts, account numbers and emails are masked unless LOG_REDACT=0
+logging_setup = setup_logging(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    fmt=os.getenv("LOG_FORMAT", "text"),
+    sampling=sampling_from_env(os.getenv("LOG_SAMPLING")),
+    redact_pii=os.getenv("LOG_REDACT", "1") == "1",
+)
+llm_log = logging.getLogger("bankbot.llm")
+flow_log = logging.getLogger("bankbot.flow")
+turn_log = logging.getLogger("bankbot.turn")
+tts_log = logging.getLogger("bankbot.tts")
+autopay_log = logging.getLogger("bankbot.autopay")
+
 app = FastAPI()
 
 app.add_middleware(
@@ -23,6 +69,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# A span per request and pipeline stage; TRACE_EXPORTER=stdout|file (OTLP/JSON, TRACE_FILE) exports them,
+# and every span feeds the latency histograms served at GET /metrics
+tracer = Tracer(exporters=[create_exporter(os.getenv("TRACE_EXPORTER", "none"), os.getenv("TRACE_FILE", "traces.jsonl"))])
+tracer.metrics.describe("http_request_duration_seconds", "HTTP request duration (to the last body byte), by endpoint")
+tracer.metrics.describe("handler_duration_seconds", "Substep handler duration, by handler")
+tracer.metrics.describe("llm_request_duration_seconds", "api_call duration, by prompt kind (cache hits included)")
+tracer.metrics.describe("llm_tokens_total", "Prompt and completion tokens sent to the LLM, by prompt kind")
+tracer.metrics.describe("llm_completions_total", "Non-streamed completions by prompt kind; shared=true rode on an identical in-flight request")
+app.add_middleware(TracingMiddleware, tracer=tracer)
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 model_name = "gpt-35-turbo"
@@ -31,11 +87,86 @@ api_version = "2024-12-01-preview"
 endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "")
 subscription_key = os.getenv("AZURE_OPENAI_API_KEY", "")
 
-client = AzureOpenAI(
-    api_version=api_version,
-    azure_endpoint=endpoint,
-    api_key=subscription_key,
-)
+# "async" awaits AsyncAzureOpenAI on the event loop; "sync" runs the blocking client in the threadpool.
+llm_client_mode = os.getenv("LLM_CLIENT_MODE", "async")
+llm_max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+llm_max_keepalive = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+llm_timeout = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+
+# LLM_BACKEND=azure (default) or fake: fake_llm answers from recorded fixtures (LLM_FIXTURES, JSONL) after a delay
+# from LLM_FAKE_LATENCY (e.g. lognormal:350:0.5) and fails a share of calls per LLM_FAKE_ERRORS (e.g. 429:0.02,timeout:0.01).
+# LLM_RECORD_PATH appends every completion to a fixture file, keyed by prompt template, label set and user message.
+llm_backend = os.getenv("LLM_BACKEND", "azure")
+fake_llm = None
+llm_recorder = None
+
+if llm_backend == "fake":
+    fake_llm = FakeLLM(
+        fixtures=FixtureStore.load(os.environ["LLM_FIXTURES"]) if os.getenv("LLM_FIXTURES") else None,
+        templates=globals(),  # the *PROMPT* constants below; read on the first call
+        latency=LatencyModel.parse(os.getenv("LLM_FAKE_LATENCY", "recorded:fixed:0")),
+        errors=ErrorInjector.parse(os.getenv("LLM_FAKE_ERRORS")),
+        timeout_seconds=llm_timeout,
+    )
+    client = fake_llm.client()
+    async_client = fake_llm.async_client()
+else:
+    client = AzureOpenAI(
+        api_version=api_version,
+        azure_endpoint=endpoint,
+        api_key=subscription_key,
+    )
+
+    # One connection pool shared by every request on this worker
+    async_client = AsyncAzureOpenAI(
+        api_version=api_version,
+        azure_endpoint=endpoint,
+        api_key=subscription_key,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=llm_max_connections,
+                max_keepalive_connections=llm_max_keepalive,
+            ),
+            timeout=llm_timeout,
+        ),
+    )
+
+if os.getenv("LLM_RECORD_PATH"):
+    llm_recorder = FixtureRecorder(os.environ["LLM_RECORD_PATH"], globals())
+    client = RecordingClient(client, llm_recorder)
+    async_client = AsyncRecordingClient(async_client, llm_recorder)
+
+
+# Identical payloads in flight at the same time (e.g. the same yes/no answer from many sessions) share one
+# upstream request; LLM_SINGLEFLIGHT=0 sends each on its own. Streamed completions are never shared.
+llm_flight = SingleFlight() if os.getenv("LLM_SINGLEFLIGHT", "1") == "1" else None
+
+
+def use_llm_clients(sync_client, async_llm_client):
+    """
+    Points api_call and streaming at other OpenAI-compatible clients (a FakeLLM's, a benchmark's own).
+    Both must provide chat.completions.create(model=, messages=, stream=) and close().
+    """
+    global client, async_client
+    client, async_client = sync_client, async_llm_client
+
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    await async_client.close()
+    client.close()
+    if llm_recorder is not None:
+        llm_recorder.close()
+
+
+@app.on_event("shutdown")
+async def stop_tracing():
+    tracer.close()  # writes out traces still queued for export
+
+
+@app.on_event("shutdown")
+async def stop_logging():
+    logging_setup.stop()  # writes out what is still queued
 
 
 # CLICK_ETRANSFER_BTN_PROMPT = '''
@@ -180,18 +311,123 @@ Answer:
 """
 
 
-def wants_navigation_back(messages) -> bool:
+async def wants_navigation_back(messages) -> bool:
     """
     Uses GPT to decide if the user wants to navigate back.
     Returns True if GPT says 'go_back'; otherwise False.
     """
     try:
-        label = (api_call(GO_BACK_PROMPT, messages) or "").strip().lower()
+        label = (await api_call(GO_BACK_PROMPT, messages, kind="go_back") or "").strip().lower()
         return label.startswith("go_back")
     except Exception:
         return False  # fail safe: if classifier fails, don't navigate
 
 
+# --- Combined classifier: intent, go-back and the current substep's label in one completion ---
+INTENT_LABELS = ("e_transfer", "pay_bill", "check_activity")
+
+COMBINED_CLASSIFIER_PROMPT = """
+You are the classifier for a banking assistant. Read the conversation (latest message last) and answer with a single JSON object with the keys {keys} and nothing else.
+
+{fields}
+
+Do not guess. Do not explain. Do not add any text outside the JSON object.
+"""
+
+COMBINED_FIELDS = {
+    "intent": (
+        '- "intent": the user\'s goal, exactly one of "e_transfer" (to send people money), "check_activity" '
+        '(check account activity/balance or download statement) or "pay_bill" (pay bill to some company or organization). '
+        'If the goal is unclear, ambiguous, or missing, use "clarification_required".'
+    ),
+    "question": (
+        '- "question": when "intent" is "clarification_required", a single short, polite question (no longer than 20 words) '
+        "that helps determine whether the user wants to transfer money, pay a bill, or check their balance; otherwise null."
+    ),
+    "go_back": (
+        '- "go_back": true if the user is asking to go back to the previous screen ("go back", "previous page", '
+        '"take me back", "back to accounts", "undo last step"), otherwise false. Unrelated uses of "back" '
+        '("back pain", "background", "cashback", "back soon") are false.'
+    ),
+}
+
+COMBINED_LABEL_FIELDS = {
+    "yesno_handler": '- "label": does the user say yes to the last yes/no question? Exactly one of "yes", "no" or "unclear".',
+    "checkbox_handler": '- "label": does the user say yes to the last yes/no question? Exactly one of "yes", "no" or "unclear".',
+    "confirmation_handler": (
+        '- "label": the user is asked to confirm an action: {action_description}. "yes" if the reply is clear and affirmative '
+        '(such as "confirm"), "no" if it is clear and negative (such as "cancel"), otherwise "unclear".'
+    ),
+    "classification_handler": (
+        '- "label": the user\'s choice, exactly one of \'{label_list}\', or "clarification_required" if it is unclear, ambiguous, or missing.'
+    ),
+    "selection_handler": (
+        '- "label": the option closest to the user\'s selection, exactly one of \'{label_list}\', '
+        'or "clarification_required" if it is unclear, ambiguous, or missing.'
+    ),
+}
+
+
+def combined_label_field(handler_name, substep):
+    """Returns (prompt line, accepted labels) for a substep the combined classifier can label, else (None, ())."""
+    template = COMBINED_LABEL_FIELDS.get(handler_name)
+    if template is None:
+        return None, ()
+    if handler_name in ("yesno_handler", "checkbox_handler", "confirmation_handler"):
+        labels = ("yes", "no", "unclear")
+    else:
+        labels = tuple(substep.get("options", {}).keys()) + ("clarification_required",)
+    field = template.format(
+        action_description=substep.get("action_description", "proceed with this action"),
+        label_list="', '".join(substep.get("options", {}).keys()),
+    )
+    if handler_name == "classification_handler" and substep.get("prompt"):
+        field += " " + substep["prompt"]
+    return field, labels
+
+
+def build_combined_prompt(fields: list) -> str:
+    keys = ", ".join(f'"{name}"' for name, _ in fields)
+    return COMBINED_CLASSIFIER_PROMPT.format(keys=keys, fields="\n".join(line for _, line in fields))
+
+
+def parse_combined_verdict(text, want_intent, want_go_back, labels=()):
+    """
+    Validates the combined classifier's JSON against the known label sets.
+    Returns {"intent", "question", "go_back", "label"} or None when the individual prompts should run instead.
+    An unknown substep label only drops the label; the handler then classifies on its own.
+    """
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    verdict = {"intent": None, "question": None, "go_back": False, "label": None}
+    if want_intent:
+        intent = str(data.get("intent") or "").strip()
+        if intent not in INTENT_LABELS and intent != "clarification_required":
+            return None
+        if intent == "clarification_required":
+            question = data.get("question")
+            if not isinstance(question, str) or not question.strip():
+                return None
+            verdict["question"] = question.strip()
+        verdict["intent"] = intent
+    if want_go_back:
+        if not isinstance(data.get("go_back"), bool):
+            return None
+        verdict["go_back"] = data["go_back"]
+    if labels and isinstance(data.get("label"), str):
+        by_lower = {label.lower(): label for label in labels}
+        verdict["label"] = by_lower.get(data["label"].strip().lower())
+    return verdict
+
+
 # Grace - Alex
 e_transfer_tutor = OrderedDict({
     "index.html": {
@@ -276,19 +512,15 @@ e_transfer_teller = OrderedDict({
                 "desc": "Selected the recipient",
                 "immediate_reply": "Who would you like to send money to?",
                 "dynamic_handler": "classification_handler",
-                "prompt": "The user is on the page of selecting a recipient of a potential eTransfer. There are 3 users on the page. Your goal is to guide the user through selecting the intended recipient.",
-                "options": {
-                    "Bob Chen": {
-                        "action": [{"action": "highlight", "selector": "#contact-bob", "immediate_reply": "Can you confirm that you're sending money to Bob Chen?"}]
-                    },
-                    "Sophia Smith": {},
-                    "David Kim": {}
-                },
+                "prompt": "The user is on the page of selecting a recipient of a potential eTransfer. Your goal is to guide the user through selecting the intended recipient.",
+                # Options are the contacts closest to what the user said, retrieved per turn (see option_retrieval.py)
+                "option_provider": "contacts",
+                "option_action": [{"action": "highlight", "selector": "#contact-{id}", "immediate_reply": "Can you confirm that you're sending money to {name}?"}],
                 "completion_condition": "select_recipient",  # flag name
             },
             "confirm_recipient": {
                 "dynamic_handler": "confirmation_handler",
-                "action": [{"action": "click", "selector": "#contact-bob", "immediate_reply": "Thank you for confirming. I'm selecting Bob Chen for you."}],  # You can generate this dynamically too
+                "action": [{"action": "click", "immediate_reply": "Thank you for confirming. I'm selecting the contact for you."}],  # clicks the highlighted contact
                 "completion_condition": "confirm_recipient"
             },
         })
@@ -315,6 +547,7 @@ e_transfer_teller = OrderedDict({
                 "dynamic_handler": "fill_handler",
                 "field": "Amount ($):",
                 "value": "Numbers only, it could be a whole number or a decimal.", 
+                "resolver": "amount",  # spoken/typed amounts are parsed locally (spoken_numbers.py) before asking the LLM
                 "action": [{"action": "fill", "selector": "#amount", "immediate_reply": "I'm filling in the amount for you."}],
                 "desc": "Filled in amount",
                 "completion_condition": "amount_entered",  # flag name
@@ -488,13 +721,11 @@ pay_bill_teller = OrderedDict({
                 "desc": "Selected the recipient",
                 "immediate_reply": "Who would you like to pay your bill to? I can add a new payee for you too.",
                 "dynamic_handler": "classification_handler",
-                "prompt": "The user is on the page of selecting a recipient of a potential bill payment. There are 3 recipients on the page. Your goal is to guide the user through selecting the intended recipient.",
+                "prompt": "The user is on the page of selecting a recipient of a potential bill payment. Your goal is to guide the user through selecting the intended recipient.",
+                # Saved payees closest to what the user said, plus the fixed options below
+                "option_provider": "payees",
+                "option_action": [{"action": "highlight", "selector": "#payee-{id}", "immediate_reply": "Can you confirm that you're paying your bill to {name}?"}],
                 "options": {
-                    "Bell": {
-                        "action": [{"action": "highlight", "selector": "#bell", "immediate_reply": "Can you confirm that you're paying your bill to Bell?"}]
-                    },
-                    "BC Hydro": {},
-                    "Telus Mobile": {},
                     "Add New Payee": {
                         "action": [{"action": "highlight", "selector": "#add-contact", "immediate_reply": "Can you confirm that you're adding a new payee?"}]
                     }
@@ -530,6 +761,7 @@ pay_bill_teller = OrderedDict({
                 "dynamic_handler": "fill_handler",
                 "field": "Amount ($):",
                 "value": "Numbers only, it could be a whole number or a decimal.", 
+                "resolver": "amount",  # spoken/typed amounts are parsed locally (spoken_numbers.py) before asking the LLM
                 "action": [{"action": "fill", "selector": "#amount", "immediate_reply": "I'm filling in the amount for you."}],
                 "completion_condition": "amount_entered",  # flag name
             },
@@ -588,6 +820,7 @@ pay_bill_teller = OrderedDict({
                 "field": "Payee's name",
                 "value": "It will be an organization name.", 
                 "example": "e.g. Bell, BC Hydro, Telus Mobile",
+                "resolver": "payee_name",  # matched against the payee directory before asking the LLM
                 "action": [{"action": "fill", "selector": "#payee-name", "immediate_reply": "I'm filling in the name for you."}],  # Grace will highlight the account selector for the user
                 "completion_condition": "name_filled",  # flag name
             },
@@ -596,6 +829,8 @@ pay_bill_teller = OrderedDict({
                 "dynamic_handler": "fill_handler",
                 "field": "Account number",
                 "value": "It will be numbers or space only.", 
+                "resolver": "digits",  # spoken/typed digits are parsed locally before asking the LLM
+                "digits": 11,
                 "action": [{"action": "fill", "selector": "#account-number", "immediate_reply": "I'm filling in the account number for you."}],  # Grace will highlight the amount input for the user
                 "completion_condition": "account_filled",
             },
@@ -789,25 +1024,298 @@ def merge_consecutive_messages(messages):
     if not messages:
         return []
 
-    merged = [messages[0]]
+    # Copies, so merging never rewrites the caller's (or a stored session's) messages
+    merged = [dict(messages[0])]
     for msg in messages[1:]:
         last = merged[-1]
         if msg["role"] == last["role"]:
             last["content"] += " " + msg["content"]
         else:
-            merged.append(msg)
+            merged.append(dict(msg))
     return merged
 
-def api_call(prompt, messages=[]):
-    cleaned_messages = merge_consecutive_messages(messages)
-    # print("API prompt", prompt)
-    # print("API cleaned_messages", cleaned_messages)
-    response = client.chat.completions.create(
+def latest_user_message(messages) -> str:
+    # messages is a list of dicts like {"role": "user", "content": "..."}
+    return next(
+        (m["content"] for m in reversed(messages) if m.get("role") == "user"),
+        ""
+    )
+
+# Local matcher for clear-cut yes/no and option replies, so they skip the LLM round trip
+fastpath_enabled = os.getenv("FASTPATH_ENABLED", "1") == "1"
+fastpath_matcher = FastPathMatcher()
+
+# Local intent classifier (hashed n-gram TF-IDF, nearest centroid) trained at startup from INTENT_SEED_PATH plus any
+# INTENT_TRAINING_LOGS (comma-separated fake_llm recordings); only inputs under INTENT_CLASSIFIER_THRESHOLD go to INTENT_PROMPT
+intent_classifier = (
+    IntentClassifier.train(
+        os.getenv("INTENT_SEED_PATH", "intent_seed.json"),
+        [path for path in os.getenv("INTENT_TRAINING_LOGS", "").split(",") if path],
+        threshold=float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", "0.7")),
+    )
+    if os.getenv("INTENT_CLASSIFIER_ENABLED", "1") == "1" else None
+)
+
+# COMBINED_CLASSIFIER=1 asks for intent, go-back and the substep label in one JSON verdict instead of one prompt each
+combined_classifier_enabled = os.getenv("COMBINED_CLASSIFIER", "0") == "1"
+# NAVIGATION_BACK_ENABLED=1 turns on the "go back" check before every user turn
+navigation_back_enabled = os.getenv("NAVIGATION_BACK_ENABLED", "0") == "1"
+combined_classifier_stats = {"calls": 0, "fallbacks": 0, "llm_calls_saved": 0}
+# SPECULATIVE_CLARIFICATION=1 sends a classifier prompt and its clarification prompt at the same time
+speculative_clarification_enabled = os.getenv("SPECULATIVE_CLARIFICATION", "0") == "1"
+speculation_stats = {
+    "speculations": 0, "clarifications_used": 0, "clarifications_discarded": 0,
+    "wasted_prompt_tokens": 0, "wasted_completion_tokens": 0,
+}
+
+# Only prompts that answer with a fixed label are cached; free-text generation never is.
+# Replies of these kinds are the values users gave (amounts, account numbers, names): logged by length only
+VALUE_KINDS = {"fill", "payee_name", "form_state"}
+CACHEABLE_KINDS = {"intent", "classification", "selection", "yesno", "checkbox", "confirmation", "go_back", "combined"}
+# Per-kind message windows and token budgets; CONTEXT_BUDGETS='{"fill": {"max_tokens": 800}}' overrides
+context_budget = ContextBudgetManager(budgets_from_env(os.getenv("CONTEXT_BUDGETS", "")))
+
+llm_cache = create_cache(
+    os.getenv("LLM_CACHE_BACKEND", "memory"),
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048")),
+    ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600")),
+    path=os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite3"),
+)
+
+def local_intent(messages):
+    """The intent of the user's latest messages when the local classifier is confident, else None (ask the LLM)."""
+    text = pending_user_text(messages)
+    if intent_classifier is None or text is None:
+        return None
+    with tracer.span("intent.local") as span:
+        intent, confidence = intent_classifier.predict(text)
+        span.set(intent=intent, confidence=round(confidence, 3))
+    return intent
+
+def fastpath_label(handler_name, substep, messages, labels):
+    """Returns the option label for the latest user reply, or None when the LLM should decide."""
+    if not fastpath_enabled:
+        return None
+    return fastpath_matcher.classify(handler_name, latest_user_message(messages), labels, substep.get("synonyms"))
+
+# Set by the /stream endpoints: api_call pushes generation tokens here and handlers push the substep prelude
+stream_sink = ContextVar("stream_sink", default=None)
+STREAMED_KINDS = {"generation"}
+
+def emit_stream_event(event):
+    sink = stream_sink.get()
+    if sink is not None and event:
+        sink.put_nowait(event)
+
+def substep_prelude(name, substep, new_page_loaded):
+    """
+    The part of a substep the browser can show before any LLM call finishes:
+    its instruction and highlights, when the substep is being presented.
+    """
+    if not new_page_loaded and substep.get("dynamic_handler"):
+        return {"event": "prelude", "substep": name, "immediate_reply": "", "action": []}
+    highlights = [
+        {"action": "highlight", "selector": a["selector"]}
+        for a in substep.get("action") or []
+        if a.get("action") == "highlight" and a.get("selector")
+    ]
+    return {
+        "event": "prelude",
+        "substep": name,
+        "immediate_reply": substep.get("immediate_reply", ""),
+        "action": highlights,
+    }
+
+async def stream_completion(payload, sink):
+    parts = []
+    stream = await async_client.chat.completions.create(
         model=deployment_name,
-        messages=[{"role": "system", "content": (prompt)}] + cleaned_messages
+        messages=payload,
+        stream=True
     )
-    print("API response:", response.choices[0].message.content.strip())
-    return response.choices[0].message.content.strip()
+    async for chunk in stream:
+        if not chunk.choices:  # Azure sends content-filter chunks without choices
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            sink.put_nowait({"event": "token", "text": delta})
+    return "".join(parts)
+
+async def stream_turn(turn, body):
+    """
+    Runs one bot turn and yields NDJSON events as they happen:
+    prelude (instruction + highlights), token (LLM text deltas), then final (the usual JSON response).
+    """
+    queue = asyncio.Queue()
+
+    async def run():
+        stream_sink.set(queue)  # the task has its own context, so this never leaks to other requests
+        try:
+            result = await turn(body)
+            queue.put_nowait({"event": "final", "data": result or {}})
+        except Exception as e:
+            turn_log.warning("Streaming turn failed: %s", e)
+            queue.put_nowait({"event": "error", "message": "Sorry, something went wrong. Please try again."})
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            event = await queue.get()
+            yield json.dumps(event) + "\n"
+            if event["event"] in ("final", "error"):
+                break
+    finally:
+        if not task.done():
+            task.cancel()
+
+async def request_completion(payload, kind):
+    """
+    One non-streamed completion, through the sync or async client. Returns (response, shared):
+    with LLM_SINGLEFLIGHT on, identical payloads in flight together share one upstream request.
+    """
+    if llm_client_mode == "sync":
+        call = functools.partial(client.chat.completions.create, model=deployment_name, messages=payload)
+        if llm_flight is None:
+            return await run_in_threadpool(call), False
+        return await run_in_threadpool(llm_flight.call, request_key(deployment_name, payload), call, kind)
+
+    def create():
+        return async_client.chat.completions.create(model=deployment_name, messages=payload)
+    if llm_flight is None:
+        return await create(), False
+    return await llm_flight.acall(request_key(deployment_name, payload), create, kind)
+
+async def api_call(prompt, messages=[], kind="generation"):
+    """
+    Sends the system prompt plus the conversation to the LLM and returns the stripped reply.
+    kind names the prompt type (e.g. "intent", "yesno", "generation"); classifier kinds are served from llm_cache.
+    """
+    with tracer.span("llm.call", metric=("llm_request_duration_seconds", {"kind": kind}), kind=kind) as span:
+        cleaned_messages = merge_consecutive_messages(context_budget.window(kind, messages))
+        cleaned_messages, budget_report = context_budget.fit(kind, prompt, cleaned_messages)
+        llm_log.debug("prompt tokens (%s): %d", kind, budget_report["prompt_tokens"])
+        span.set(prompt_tokens=budget_report["prompt_tokens"])
+        cacheable = llm_cache is not None and kind in CACHEABLE_KINDS
+        if cacheable:
+            cached = llm_cache.get(prompt, cleaned_messages)
+            if cached is not None:
+                span.set(cached=True)
+                return cached
+
+        # print("API prompt", prompt)
+        # print("API cleaned_messages", cleaned_messages)
+        payload = [{"role": "system", "content": (prompt)}] + cleaned_messages
+        sink = stream_sink.get()
+        usage = None
+        shared = False
+        try:
+            if sink is not None and kind in STREAMED_KINDS and llm_client_mode != "sync":
+                reply = (await stream_completion(payload, sink)).strip()
+                span.set(streamed=True)
+            else:
+                response, shared = await request_completion(payload, kind)
+                tracer.metrics.inc("llm_completions_total", {"kind": kind, "shared": "true" if shared else "false"})
+                if shared:
+                    span.set(shared=True)  # another request's completion: no tokens spent on this one
+                else:
+                    usage = response.usage
+                    context_budget.record_usage(kind, usage)
+                reply = response.choices[0].message.content.strip()
+        except asyncio.CancelledError:
+            if turn_queue is not None:
+                turn_queue.record_cancelled_llm_call()
+            raise
+        if not shared:
+            # Streamed replies carry no usage; fall back to the local estimates
+            prompt_tokens = getattr(usage, "prompt_tokens", None) or budget_report["prompt_tokens"]
+            completion_tokens = getattr(usage, "completion_tokens", None) or count_text_tokens(reply)
+            span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            tracer.metrics.inc("llm_tokens_total", {"kind": kind, "type": "prompt"}, prompt_tokens)
+            tracer.metrics.inc("llm_tokens_total", {"kind": kind, "type": "completion"}, completion_tokens)
+        if kind in VALUE_KINDS:
+            llm_log.debug("response (%s): %d characters", kind, len(reply or ""))
+        else:
+            llm_log.debug("response (%s): %s", kind, reply)
+        if cacheable:
+            llm_cache.set(prompt, cleaned_messages, reply)
+        return reply
+
+class HeldSink:
+    """Stream sink for a speculative call: buffers its events until release() says they should be shown."""
+
+    def __init__(self):
+        self.events = []
+        self.target = None
+
+    def put_nowait(self, event):
+        if self.target is not None:
+            self.target.put_nowait(event)
+        else:
+            self.events.append(event)
+
+    def release(self, target):
+        for event in self.events:
+            target.put_nowait(event)
+        self.events = []
+        self.target = target
+
+async def speculative_classify(prompt, clarification_prompt, messages, kind):
+    """
+    Sends the classifier and the clarification prompt concurrently, so an ambiguous turn costs one round trip.
+    The clarification is cancelled (or discarded, if it already finished) when the classifier returns a label;
+    the tokens it spent are counted in speculation_stats.
+    """
+    sink = stream_sink.get()
+    held = HeldSink() if sink is not None else None
+    sent = []
+
+    async def clarify():
+        if held is not None:
+            stream_sink.set(held)  # task-local: the real sink only sees these tokens once released
+        sent.append(True)
+        return await api_call(clarification_prompt, messages)
+
+    task = asyncio.create_task(clarify())
+    try:
+        label = await api_call(prompt, messages, kind=kind)
+    except BaseException:
+        task.cancel()
+        raise
+    speculation_stats["speculations"] += 1
+
+    if label.strip().lower() == "clarification_required":
+        speculation_stats["clarifications_used"] += 1
+        if held is not None:
+            held.release(sink)
+        return label, await task
+
+    speculation_stats["clarifications_discarded"] += 1
+    if task.done() and not task.cancelled() and task.exception() is None:
+        speculation_stats["wasted_completion_tokens"] += count_text_tokens(task.result())
+    else:
+        # In sync client mode the threadpool call keeps running; only its result is dropped
+        task.cancel()
+    if sent:  # a classifier answered from llm_cache can return before the clarification was ever sent
+        speculation_stats["wasted_prompt_tokens"] += count_prompt_tokens(clarification_prompt, messages)
+    return label, None
+
+async def classify_or_clarify(prompt, clarification_prompt, messages, kind, label=None):
+    """
+    Returns (label, clarification question); the question is only asked for when the label is clarification_required.
+    label: already classified this turn (e.g. by the combined classifier), so only the clarification may be needed.
+    """
+    with tracer.span("classify", kind=kind) as span:
+        if label is None and speculative_clarification_enabled:
+            label, question = await speculative_classify(prompt, clarification_prompt, messages, kind)
+        else:
+            if label is None:
+                label = await api_call(prompt, messages, kind=kind)
+            question = None
+            if label.strip().lower() == "clarification_required":
+                question = await api_call(clarification_prompt, messages)
+        span.set(label=label, clarified=question is not None)
+        return label, question
 
 def extract_bot_message_and_state(text: str) -> tuple:
     """
@@ -841,7 +1349,7 @@ def extract_bot_message_and_state(text: str) -> tuple:
         try:
             state = json.loads(state_str)
         except json.JSONDecodeError as e:
-            print("⚠️ JSON decode error:", e)
+            llm_log.warning("Form state JSON decode error: %s", e)
             state = {}
 
     return botMessage, state     
@@ -891,13 +1399,13 @@ def generate_actions_from_state(state: dict) -> list:
 
     return actions
 
-def run_conversational_agent(messages, current_state, currentPage, intent, prompt):
+async def run_conversational_agent(messages, current_state, currentPage, intent, prompt):
     prompt = build_state_prompt(current_state, currentPage, intent, prompt=prompt)
-    gpt_output = api_call(prompt=prompt, messages=messages)
+    gpt_output = await api_call(prompt=prompt, messages=messages, kind="form_state")
 
     # Extract state from the GPT response
     botMessage, new_state = extract_bot_message_and_state(gpt_output)
-    print("state from GPT:", new_state)
+    flow_log.debug("state from GPT, fields: %s", sorted(new_state) if isinstance(new_state, dict) else None)
     return {
         "botMessage": botMessage,
         "state": new_state
@@ -906,14 +1414,13 @@ def run_conversational_agent(messages, current_state, currentPage, intent, promp
 def format_fields_for_prompt(state: dict) -> str:
     return '\n'.join(f"- {k}: {v}" for k, v in state.items())
 
-def run_confirmation_agent(messages, state):
+async def run_confirmation_agent(messages, state):
     formatted_fields = format_fields_for_prompt(state)
     prompt = CONFIRMATION_PROMPT.format(formatted_fields=formatted_fields)
 
-    gpt_output = api_call(prompt=prompt, messages=messages)
+    gpt_output = await api_call(prompt=prompt, messages=messages, kind="form_state")
     botMessage, new_state = extract_bot_message_and_state(gpt_output)
-    print("botMessage:", botMessage)
-    print("extracted:", new_state)
+    flow_log.debug("botMessage: %s, extracted fields: %s", botMessage, sorted(new_state) if isinstance(new_state, dict) else None)
 
     # ✅ Merge the confirmed value into state
     updated_state = merge_state(state, new_state)
@@ -928,22 +1435,24 @@ def run_confirmation_agent(messages, state):
 
 
 # Grace - Alex
-def yesno_handler(new_page_loaded, messages, substep, intent):
+async def yesno_handler(substep, messages, intent, new_page_loaded, label=None):
     # 1. Ask the yes/no question if newPageLoaded
-    print("====Yes/No classification handler called")
+    flow_log.debug("Yes/No classification handler called")
     # print("substep", substep)
     if new_page_loaded:
-        print("New page loaded, asking yes/no question...")
+        flow_log.debug("New page loaded, asking yes/no question...")
         return {
             "intent": intent,
             "botMessage": substep["immediate_reply"]
             # "botMessage": "test"
         }
 
-    # 2. Classify user response
-    recent_messages = messages[-2:] if len(messages) >= 2 else messages
-    classification = api_call(YESNO_CLASSIFIER_PROMPT, recent_messages)
-    print("Classification result:", classification)
+    # 2. Classify user response, locally when the reply is clear-cut
+    classification = fastpath_label("yesno_handler", substep, messages, substep["option_labels"])
+    if classification is None:
+        # The "yesno" context budget keeps the question, any clarifying exchange and the answer
+        classification = label or await api_call(YESNO_CLASSIFIER_PROMPT, messages, kind="yesno")
+    flow_log.debug("Classification result: %s", classification)
     # print("Substep:", substep)
 
     if classification.lower() == "yes":
@@ -965,33 +1474,71 @@ def yesno_handler(new_page_loaded, messages, substep, intent):
         }
 
 # Grace - Alex
-def classification_handler(substep, messages, intent, new_page_loaded=False):
-    print("====Classification handler called")
+def option_action(template, record):
+    """A provider option's actions: the substep's "option_action" filled in from the directory record."""
+    # {id} is the record id the pages put in their button ids ("#payee-12", "#contact-3"), so namesakes
+    # get different selectors; pages render a record that isn't on their first page before acting on it
+    fields = {"name": record.name, "id": record.id}
+    return [
+        {key: value.format(**fields) if isinstance(value, str) else value for key, value in act.items()}
+        for act in template
+    ]
+
+def substep_options(substep, messages):
+    """
+    The substep with the options and prompts to classify over this turn. Fixed options are precomputed;
+    an "option_provider" substep gets the directory entries closest to what the user just said
+    (at most option_retrieval_k), followed by its fixed "options".
+    """
+    provider = substep.get("option_provider")
+    if not provider:
+        return substep
+    retriever, detail_field = option_providers[provider]
+    with tracer.span("options.retrieve", provider=provider) as span:
+        retrieval = retriever.retrieve(pending_user_text(messages) or "", k=option_retrieval_k)
+        span.set(candidates=len(retrieval.candidates), scored=retrieval.scored)
+    names = [candidate.record.name for candidate in retrieval.candidates]
+    options = {}
+    for candidate in retrieval.candidates:
+        record = candidate.record
+        # Two "David Kim"s in the shortlist are told apart by their email/account
+        label = record.name if names.count(record.name) == 1 else f"{record.name} ({getattr(record, detail_field)})"
+        options[label] = {"action": option_action(substep.get("option_action", []), record)}
+    options.update(substep.get("options") or {})
+    flow_log.debug("Retrieved %s for %r: %s", provider, retrieval.words, [(c.record.name, c.score) for c in retrieval.candidates])
+    return {**substep, "options": options, **option_prompts(substep, options)}
+
+async def classification_handler(substep, messages, intent, new_page_loaded=False, label=None):
+    flow_log.debug("Classification handler called")
     # 1. Ask the yes/no question if newPageLoaded
     # print("substep", substep)
     if new_page_loaded:
-        print("New page loaded, asking yes/no question...")
+        flow_log.debug("New page loaded, asking yes/no question...")
         return {
             "intent": intent,
             "botMessage": substep["immediate_reply"]
         }
 
+    substep = substep_options(substep, messages)
     options = substep.get("options", {})
     if not options:
-        raise ValueError("Substep is missing 'options' for classification.")
-
-    label_list = "', '".join(options.keys())
-    print(f"Classifying what user wants with options: {label_list}")
-    classification_prompt = CLASSIFICATION_DECISION_PROMPT.format(label_list=label_list)
-    if substep.get("prompt"):
-        classification_prompt += "\n\n" + substep["prompt"]
+        if not substep.get("option_provider"):
+            raise ValueError("Substep is missing 'options' for classification.")
+        flow_log.info("No %s match what the user said", substep["option_provider"])
+        return {
+            "intent": intent,
+            "action": "",
+            "botMessage": "Sorry, I couldn’t find that name. Can you say the full name again?",
+        }
 
-    result = api_call(classification_prompt, messages).strip().lower()
+    flow_log.debug("Classifying what user wants with options: %s", substep["label_list"])
+    # label: already classified by the combined classifier this turn
+    result, clarification_question = await classify_or_clarify(
+        substep["classification_prompt"], substep["clarification_prompt"], messages, "classification", label=label
+    )
+    result = result.strip().lower()
 
     if result == "clarification_required":
-        clarification_prompt = CLARIFICATION_PROMPT.format(label_list=label_list)
-        clarification_question = api_call(clarification_prompt, messages)
-
         return {
             "intent": intent,
             "action": "",
@@ -1007,7 +1554,7 @@ def classification_handler(substep, messages, intent, new_page_loaded=False):
                 "action": option.get("action", []),  # e.g., [{"action": "click", "selector": "#view_checking_activity"}]
                 "substep_flags": {substep.get("completion_condition"): True}
             }
-    print(f"No match found for classification result: {result}")
+    flow_log.info("No match found for classification result: %s", result)
     # No match and not clarification_required
     return {
         "intent": intent,
@@ -1029,14 +1576,14 @@ SELECTION_CLARIFICATION_PROMPT = (
     "that will help determine whether the user wants to choose: {label_list}."
 )
 
-def selection_handler(substep, messages, intent, new_page_loaded):
+async def selection_handler(substep, messages, intent, new_page_loaded, label=None):
     """
     Handles selection of options from a list, e.g., account selection.
     """
-    print("====Selection handler called")
+    flow_log.debug("Selection handler called")
     # 1. Ask the selection question if newPageLoaded
     if new_page_loaded:
-        print("New page loaded, asking selection question...")
+        flow_log.debug("New page loaded, asking selection question...")
         return {
             "intent": intent,
             "botMessage": substep["immediate_reply"]
@@ -1045,18 +1592,19 @@ def selection_handler(substep, messages, intent, new_page_loaded):
     options = substep.get("options", {})
     if not options:
         raise ValueError("Substep is missing 'options' for selection.")
-    label_list = "', '".join(options.keys())
 
     # 2. Classify user response
-    print(f"Classifying what user wants with options: {label_list}")
-    recent_messages = messages[-1:] if len(messages) >= 1 else messages
-    selection = api_call(SELECTION_PROMPT.format(label_list=label_list), recent_messages)
-    print("Selection result:", selection)
+    flow_log.debug("Classifying what user wants with options: %s", substep["label_list"])
+    selection = fastpath_label("selection_handler", substep, messages, substep["option_labels"])
+    clarification_question = None
+    if selection is None:
+        # The "selection" context budget keeps only the latest message
+        selection, clarification_question = await classify_or_clarify(
+            substep["selection_prompt"], substep["clarification_prompt"], messages, "selection", label=label
+        )
+    flow_log.debug("Selection result: %s", selection)
 
     if selection == "clarification_required":
-        clarification_prompt = CLARIFICATION_PROMPT.format(label_list=label_list)
-        clarification_question = api_call(clarification_prompt, messages)
-
         return {
             "intent": intent,
             "action": "",
@@ -1064,7 +1612,7 @@ def selection_handler(substep, messages, intent, new_page_loaded):
         }
 
     if selection in options:
-        print(f"User selected: {selection}")
+        flow_log.debug("User selected: %s", selection)
         option = options[selection.lower()]
         return {
             "intent": intent,
@@ -1107,71 +1655,91 @@ def extract_number(text: str) -> str:
     match = re.search(r"\d+(?:\.\d+)?", text.replace(",", ""))
     return match.group(0) if match else ""
 
-def fill_handler(substep, messages, intent, new_page_loaded):
+# Fill values resolved locally vs. left to FILL_PROMPT, by resolver
+fill_resolver_stats = {}
+
+def resolve_fill_value(substep, messages):
+    """The value for a fill substep from its local resolver, or None when the LLM should extract it."""
+    resolver = substep.get("resolver")
+    if not resolver:
+        return None
+    text = latest_user_message(messages)
+    value = None
+    if resolver == "payee_name":
+        resolution = payee_resolver.resolve(text)
+        flow_log.debug("Payee name candidates: %s", resolution.matches)
+        if resolution.confident:
+            value = resolution.best.name
+    elif resolver == "amount":
+        value = parse_amount(text)
+    elif resolver == "digits":
+        value = parse_digits(text, length=substep.get("digits"))
+    counts = fill_resolver_stats.setdefault(resolver, {"local": 0, "llm": 0})
+    counts["llm" if value is None else "local"] += 1
+    # Outcomes only: the text and value are what the user is filling in, and short numbers escape redaction
+    flow_log.debug("Resolver %s -> %s (message of %d characters)", resolver, "llm" if value is None else "local", len(text or ""))
+    return value
+
+async def fill_handler(substep, messages, intent, new_page_loaded, label=None):
     """
     Handles filling in a field, e.g., entering an amount.
     """
-    print("====Fill handler called")
+    flow_log.debug("Fill handler called")
     # 1. Ask the fill question if newPageLoaded
     if new_page_loaded:
-        print("New page loaded, asking immediate reply...")
+        flow_log.debug("New page loaded, asking immediate reply...")
         return {
             "intent": intent,
             "botMessage": substep["immediate_reply"]
         }
 
-    # 2. Classify user response
-    # messages is a list of dicts like {"role": "user", "content": "..."}
-    recent_messages = messages[-5:] if len(messages) >= 5 else messages
-    recent_messages = [
-        {
-            **m,
-            "content": re.sub(r'(?<=\d) (?=\d)', '', m["content"])  # remove spaces between digits
-        }
-        for m in recent_messages
-    ]
-    print("User message:", recent_messages)
-    
-    field=substep.get("field", "")
-    value = substep.get("value", "")
-    print("calling API 1")
-
-    prompt = FILL_PROMPT.format(field=field, value=value)
-
-    example = substep.get("example")
-    if example:
-        prompt += "\n\nExample qualified answers are: " + example
-
-    filled_value = api_call(prompt, recent_messages)
-    print("Filled value:", filled_value)
-
-    # extract just the number
-    if "numbers" in value.lower():
-        filled_value = extract_number(filled_value)
-    if not filled_value or "clarification_required" in filled_value:
-        # ask for clarification if no number found
-        # print("calling API 2")
-        # print("field:", field)
-        # print("value:", value)
-        # clarification_question = api_call(
-        #     FILL_CLARIFICATION_PROMPT.format(field=field, value=value),
-        #     messages
-        # )
-        return {
-            "intent": intent,
-            "action": "",
-            "botMessage": "Sorry, I couldn’t understand very well. Could you please clarify? Feel free to type to me by the keyboard",
-        }
+    # 2. Resolve the value locally when the substep has a resolver and it's confident
+    filled_value = resolve_fill_value(substep, messages)
+
+    # 3. Otherwise ask the LLM
+    if filled_value is None:
+        # messages is a list of dicts like {"role": "user", "content": "..."}
+        # The "fill" context budget keeps the last 5 messages
+        recent_messages = [
+            {
+                **m,
+                "content": re.sub(r'(?<=\d) (?=\d)', '', m["content"])  # remove spaces between digits
+            }
+            for m in messages
+        ]
+        flow_log.debug("Asking FILL_PROMPT with %d messages", len(recent_messages))
+
+        value = substep.get("value", "")
+        filled_value = await api_call(substep["fill_prompt"], recent_messages, kind="fill")
+        flow_log.debug("Filled value: %d characters", len(filled_value or ""))
+
+        # extract just the number
+        if "numbers" in value.lower():
+            filled_value = extract_number(filled_value)
+        if not filled_value or "clarification_required" in filled_value:
+            # ask for clarification if no number found
+            # print("calling API 2")
+            # print("field:", field)
+            # print("value:", value)
+            # clarification_question = api_call(
+            #     FILL_CLARIFICATION_PROMPT.format(field=field, value=value),
+            #     messages
+            # )
+            return {
+                "intent": intent,
+                "action": "",
+                "botMessage": "Sorry, I couldn’t understand very well. Could you please clarify? Feel free to type to me by the keyboard",
+            }
 
-    if "name" in value:
-        print("calling API 3, PAYEE_NAME_CLEAN_PROMPT")
-        # validate the payee name
-        filled_value = api_call(PAYEE_NAME_CLEAN_PROMPT, messages)
+        if "name" in value:
+            flow_log.debug("Cleaning the payee name with PAYEE_NAME_CLEAN_PROMPT")
+            # validate the payee name
+            filled_value = await api_call(PAYEE_NAME_CLEAN_PROMPT, messages, kind="payee_name")
     
-    action = substep.get("action", [])
-    # add the filled value to the action if it requires a value
+    action = list(substep.get("action", []))
+    # add the filled value to the action if it requires a value (copied: the compiled flow is shared by every request)
     if action :
-        action[0]["value"] = filled_value
+        action[0] = {**action[0], "value": filled_value}
 
     return {
         "intent": intent,
@@ -1179,20 +1747,22 @@ def fill_handler(substep, messages, intent, new_page_loaded):
         "substep_flags": {substep.get("completion_condition"): True},
     }
 
-def checkbox_handler(substep, messages, intent, new_page_loaded):
+async def checkbox_handler(substep, messages, intent, new_page_loaded, label=None):
     # 1. Ask the yes/no question if newPageLoaded
-    print("====Yes/No classification handler called")
+    flow_log.debug("Checkbox handler called")
     # print("substep", substep)
     if new_page_loaded:
-        print("New page loaded, asking immediate reply...")
+        flow_log.debug("New page loaded, asking immediate reply...")
         return {
             "intent": intent,
             "botMessage": substep["immediate_reply"]
         }
 
-    # 2. Classify user response
-    classification = api_call(YESNO_CLASSIFIER_PROMPT, messages)
-    print("Classification result:", classification)
+    # 2. Classify user response, locally when the reply is clear-cut
+    classification = fastpath_label("checkbox_handler", substep, messages, substep["option_labels"])
+    if classification is None:
+        classification = label or await api_call(YESNO_CLASSIFIER_PROMPT, messages, kind="checkbox")
+    flow_log.debug("Classification result: %s", classification)
     # print("Substep:", substep)
 
     if classification.lower() == "yes":
@@ -1213,7 +1783,24 @@ def checkbox_handler(substep, messages, intent, new_page_loaded):
             "botMessage": "Sorry, could you please clarify if you need to set up auto pay?"
         }
 
-def confirmation_handler(substep, messages, intent, new_page_loaded) -> str:
+CONFIRMATION_CLASSIFIER_PROMPT = """
+You are a confirmation assistant helping to interpret user's response as 'yes', 'no', or 'unclear'.
+
+The user is asked to confirm an action: {action_description}
+
+User message is: "{user_message}"
+
+Does the user confirm the action? If the user's response is clear and affirmative (such as 'confirm'), respond with "yes". If the user's response is clear and negative (such as 'cancel'), respond with "no".
+
+Respond with exactly one word:
+- yes
+- no
+- unclear
+
+Do NOT explain or include any other text.
+"""
+
+async def confirmation_handler(substep, messages, intent, new_page_loaded, label=None) -> str:
     """
     Uses GPT to classify a user response as 'yes', 'no', or 'unclear'.
 
@@ -1224,9 +1811,9 @@ def confirmation_handler(substep, messages, intent, new_page_loaded) -> str:
     Returns:
         One of: "yes", "no", "unclear"
     """
-    print("===Confirmation handler called")
+    flow_log.debug("Confirmation handler called")
     if new_page_loaded:
-        print("New page loaded, asking yes/no question...")
+        flow_log.debug("New page loaded, asking yes/no question...")
         return {
             "intent": intent,
             "botMessage": substep["immediate_reply"]
@@ -1234,29 +1821,12 @@ def confirmation_handler(substep, messages, intent, new_page_loaded) -> str:
         }
 
     action_description = substep.get("action_description", "proceed with this action")
-    # messages is a list of dicts like {"role": "user", "content": "..."}
-    user_message = next(
-        (m["content"] for m in reversed(messages) if m.get("role") == "user"),
-        ""
-    )
-    prompt = f"""
-You are a confirmation assistant helping to interpret user's response as 'yes', 'no', or 'unclear'.
-
-The user is asked to confirm an action: {action_description}
-
-User message is: "{user_message}"
-
-Does the user confirm the action? If the user's response is clear and affirmative (such as 'confirm'), respond with "yes". If the user's response is clear and negative (such as 'cancel'), respond with "no".
+    user_message = latest_user_message(messages)
+    prompt = CONFIRMATION_CLASSIFIER_PROMPT.strip().format(action_description=action_description, user_message=user_message)
 
-Respond with exactly one word:
-- yes
-- no
-- unclear
-
-Do NOT explain or include any other text.
-""".strip()
-
-    result = api_call(prompt, [])
+    result = fastpath_label("confirmation_handler", substep, messages, ("yes", "no"))
+    if result is None:
+        result = label or await api_call(prompt, [], kind="confirmation")
     if result.lower() == "yes":
         return {
             "intent": intent,
@@ -1275,91 +1845,279 @@ Do NOT explain or include any other text.
         }
 
 
+# Substeps without a dynamic_handler just send their instruction and actions
+async def instruction_handler(substep, messages, intent, new_page_loaded, label=None):
+    flow_log.debug("No dynamic handler for current step, sending instruction directly...")
+    return {
+        "intent": intent,
+        "botMessage": substep.get("immediate_reply", ""),
+        "substep_flags": {substep.get("completion_condition"): True},
+        "action": substep.get("action", ""),
+    }
+
+SUBSTEP_HANDLERS = {
+    "yesno_handler": yesno_handler,
+    "classification_handler": classification_handler,
+    "confirmation_handler": confirmation_handler,
+    "selection_handler": selection_handler,
+    "fill_handler": fill_handler,
+    "checkbox_handler": checkbox_handler,
+}
+
+def option_prompts(substep, options):
+    """The label list and the classifier prompts over a substep's options."""
+    label_list = "', '".join(options.keys())
+    classification_prompt = CLASSIFICATION_DECISION_PROMPT.format(label_list=label_list)
+    if substep.get("prompt"):
+        classification_prompt += "\n\n" + substep["prompt"]
+    return {
+        "option_labels": tuple(options.keys()),
+        "label_list": label_list,
+        "classification_prompt": classification_prompt,
+        "selection_prompt": SELECTION_PROMPT.format(label_list=label_list),
+        "clarification_prompt": CLARIFICATION_PROMPT.format(label_list=label_list),
+    }
+
+def precompute_substep(name, substep):
+    """Strings the handlers would otherwise rebuild on every turn."""
+    extra = {"prelude": substep_prelude(name, substep, new_page_loaded=True)}
+    # A provider's options depend on what the user says, so substep_options() builds these per turn
+    if not substep.get("option_provider"):
+        options = substep.get("options")
+        if options:
+            extra.update(option_prompts(substep, options))
+        combined_field, combined_labels = combined_label_field(substep.get("dynamic_handler", ""), substep)
+        if combined_field:
+            extra.update({"combined_label_field": combined_field, "combined_labels": combined_labels})
+    if substep.get("dynamic_handler") == "fill_handler":
+        fill_prompt = FILL_PROMPT.format(field=substep.get("field", ""), value=substep.get("value", ""))
+        if substep.get("example"):
+            fill_prompt += "\n\nExample qualified answers are: " + substep["example"]
+        extra["fill_prompt"] = fill_prompt
+    return extra
+
+flow_graph = compile_flows(flows, SUBSTEP_HANDLERS, instruction_handler, precompute=precompute_substep)
+
+
 # Grace - Alex
-def handle_first_incomplete_substep(substeps, substep_flags, messages, intent, new_page_loaded, state={}):
-    # Check the completion conditions of each substep
-    # and handle the first uncompleted substep
-    print("===Handling first incomplete substep...")
-    print("===substep_flags:", substep_flags)
-    for name, substep in substeps.items():
-        condition = substep.get("completion_condition", "") # e.g., "account_chosen"
-        print("Checking condition:", condition)
-        if not substep_flags.get(condition, ""): # substep_flags looks like this: {"account_chosen": True} => {"account_chosen": True, "amount_entered": False}
-            print("Found first incomplete substep:", name)
-            handler_type = substep.get("dynamic_handler", "")
-            print("Dynamic handler type:", handler_type)
-            # Need to return intent for every handler condition
-            if not handler_type:
-                print("No dynamic handler for current step, sending instruction directly...")
-                return {
-                    "intent": intent,
-                    "botMessage": substep.get("immediate_reply", ""),
-                    "substep_flags": {substep.get("completion_condition"): True},
-                    "action": substep.get("action", ""),
-                }
-            elif handler_type == "yesno_handler":
-                return yesno_handler(new_page_loaded, messages, substep, intent)
-            elif handler_type == "classification_handler":
-                return classification_handler(substep, messages, intent, new_page_loaded)
-            elif handler_type == "confirmation_handler":
-                return confirmation_handler(substep, messages, intent, new_page_loaded)
-            elif handler_type == "selection_handler":
-                return selection_handler(substep, messages, intent, new_page_loaded)
-            elif handler_type == "fill_handler":
-                return fill_handler(substep, messages, intent, new_page_loaded)
-            elif handler_type == "checkbox_handler":
-                return checkbox_handler(substep, messages, intent, new_page_loaded)
+async def handle_first_incomplete_substep(page, substep_flags, messages, intent, new_page_loaded, state={}, label=None):
+    # The first substep whose completion condition isn't set yet, from the compiled completion bitmask
+    with tracer.span("flow.route", intent=intent) as span:
+        node = page.first_incomplete(substep_flags)
+        span.set(substep=node.name if node else None)
+    if node is None:
+        return None
+    flow_log.debug("Found first incomplete substep: %s %s", node.name, node.handler_name)
+    if stream_sink.get() is not None:
+        presenting = new_page_loaded or not node.handler_name
+        emit_stream_event(node.spec["prelude"] if presenting else substep_prelude(node.name, node.spec, False))
+    handler_name = node.handler_name or "instruction_handler"
+    with tracer.span("handler", metric=("handler_duration_seconds", {"handler": handler_name}),
+                     handler=handler_name, substep=node.name):
+        return await node.handler(node.spec, messages, intent, new_page_loaded, label=label)
 
 
 # Grace - Alex and Frank - Sam    
-def handle_known_intent(intent, current_page, substep_flags, messages, new_page_loaded, state={}, assistant="grace"):
-    print("==Handling known intent:", intent)
-    if intent in flows and current_page in flows[intent][assistant]:
-        current_step = flows[intent][assistant][current_page]
-        substeps = current_step.get("substeps", {})
-        print("====substeps:", substeps.keys())
-        return handle_first_incomplete_substep(
-            substeps, substep_flags, messages, intent, new_page_loaded, state
-        )
-    else:
-        print("====WIP: Intent or current page not found in flows for intent:", intent, current_page)
+async def handle_known_intent(intent, current_page, substep_flags, messages, new_page_loaded, state={}, assistant="grace", label=None):
+    flow_log.debug("Handling known intent: %s", intent)
+    page = flow_graph.page(intent, assistant, current_page)
+    if page is None:
+        flow_log.warning("Intent or current page not found in flows: %s %s", intent, current_page)
         return None
+    return await handle_first_incomplete_substep(
+        page, substep_flags, messages, intent, new_page_loaded, state, label=label
+    )
+
 
+GO_BACK_RESPONSE = {
+    "botMessage": "Okay — going back to the previous page.",
+    "action": [{"action": "navigate", "value": "back"}],
+}
 
+async def classify_turn(messages, intent, assistant, current_page, substep_flags):
+    """
+    One completion for every classifier question this turn would otherwise ask separately:
+    the intent (with a clarification question) when it's unknown, go-back, and the current substep's label.
+    Returns None when there's nothing to combine or the verdict doesn't validate; callers then run the individual prompts.
+    """
+    want_intent = not intent
+    # With only the substep label left to ask, the handler's own call is just as cheap (and may use the fastpath)
+    if not want_intent and not navigation_back_enabled:
+        return None
+
+    fields = []
+    if want_intent:
+        fields += [("intent", COMBINED_FIELDS["intent"]), ("question", COMBINED_FIELDS["question"])]
+    if navigation_back_enabled:
+        fields.append(("go_back", COMBINED_FIELDS["go_back"]))
+    labels = ()
+    node = flow_graph.route(intent, assistant, current_page, substep_flags) if intent else None
+    if node is not None and "combined_label_field" in node.spec:
+        fields.append(("label", node.spec["combined_label_field"]))
+        labels = node.spec["combined_labels"]
+    elif node is not None and node.spec.get("option_provider") and pending_user_text(messages):
+        field, labels = combined_label_field(node.handler_name, substep_options(node.spec, messages))
+        fields.append(("label", field))
+
+    combined_classifier_stats["calls"] += 1
+    with tracer.span("classify", kind="combined") as span:
+        reply = await api_call(build_combined_prompt(fields), messages, kind="combined")
+        verdict = parse_combined_verdict(reply, want_intent, navigation_back_enabled, labels)
+        span.set(valid=verdict is not None)
+    if verdict is None:
+        flow_log.info("Combined classifier verdict didn't validate, using the individual prompts: %s", reply)
+        combined_classifier_stats["fallbacks"] += 1
+        return None
+    # Counted conservatively: the substep label isn't, since the handler's fastpath might have answered it for free
+    separate_calls = int(want_intent) + int(verdict["question"] is not None) + int(navigation_back_enabled)
+    combined_classifier_stats["llm_calls_saved"] += separate_calls - 1
+    return verdict
+
+
+
+# Text-to-speech: TTS_BACKEND=auto (Azure when the SDK and AZURE_SPEECH_KEY are available, else an offline stub), azure or stub
+tts_service = create_tts_service(
+    os.getenv("TTS_BACKEND", "auto"),
+    cache_dir=os.getenv("TTS_CACHE_DIR", ".tts_cache"),
+    workers=int(os.getenv("TTS_WORKERS", "4")),
+    # GET /speak renders any text, so the disk cache drops least recently used audio past TTS_CACHE_MAX_MB
+    max_cache_bytes=int(float(os.getenv("TTS_CACHE_MAX_MB", "256")) * 1024 * 1024),
+    key=os.getenv("AZURE_SPEECH_KEY", ""),
+    region=os.getenv("AZURE_SPEECH_REGION", "westus"),
+    voice="en-US-FableTurboMultilingualNeural",
+    language="en-CA",  # Force Canadian English accent
+)
+
+def static_spoken_texts():
+    """Every fixed string the bots say: substep immediate_reply and the immediate_reply of their actions."""
+    for node in flow_graph.substeps():
+        spec = node.spec
+        yield spec.get("immediate_reply", "")
+        actions = list(spec.get("action") or [])
+        for option in (spec.get("options") or {}).values():
+            actions += list(option.get("action") or [])
+        for act in actions:
+            if isinstance(act, dict):
+                yield act.get("immediate_reply", "")
+
+@app.on_event("startup")
+async def prerender_speech():
+    if os.getenv("TTS_PRERENDER", "1") == "1":
+        queued = tts_service.prerender(t.strip() for t in static_spoken_texts())
+        tts_log.info("Pre-rendering %d static replies in the background", queued)
+
+@app.on_event("shutdown")
+async def close_tts():
+    tts_service.close()
+
+async def speech_response(text: str):
+    text = (text or "").strip()
+    if not text:
+        return JSONResponse({"status": "error", "reason": "No text"}, status_code=400)
+    audio = tts_service.stream(text)
+    # Pull the first chunk before answering, so a synthesis failure is still a clean JSON error
+    try:
+        with tracer.span("tts.first_chunk", characters=len(text)):
+            first = await audio.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    except TTSError as e:
+        tts_log.warning("Speech synthesis failed: %s", e)
+        return JSONResponse({"status": "error", "reason": str(e)}, status_code=502)
+
+    async def body():
+        yield first
+        async for chunk in audio:
+            yield chunk
+
+    return StreamingResponse(body(), media_type=tts_service.media_type)
 
 @app.post("/speak")
 async def speak_text(request: Request):
-    data = await request.json()
-    text = data.get("text", "")
+    data = await read_json(request)
+    return await speech_response(data.get("text", ""))
+
+# GET so an <audio> element can play the response progressively while it's synthesized
+@app.get("/speak")
+async def speak_text_get(text: str = ""):
+    return await speech_response(text)
+
+# Conversations held server-side, so clients send only their session id and the new message
+session_store = create_session_store(
+    os.getenv("SESSION_BACKEND", "memory"),
+    ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", "1800")),
+    path=os.getenv("SESSION_DB_PATH", "sessions.sqlite3"),
+)
 
-    # Configure Azure TTS
-    speech_config = speechsdk.SpeechConfig(subscription=os.getenv("AZURE_SPEECH_KEY"), region="westus" )
-    speech_config.speech_synthesis_voice_name = "en-US-FableTurboMultilingualNeural"
-    speech_config.speech_synthesis_language = "en-CA"  # Force Canadian English accent
+# Turns of one session run in order; a page-load/field-change turn replaces the one queued (or running) just before it.
+# TURN_QUEUE_ENABLED=0 runs session turns concurrently as before; TURN_COALESCE_WINDOW_MS delays those turns so a burst
+# of field changes is merged before any of it runs.
+turn_queue = (
+    SessionTurnQueue(coalesce_window_seconds=float(os.getenv("TURN_COALESCE_WINDOW_MS", "0")) / 1000)
+    if os.getenv("TURN_QUEUE_ENABLED", "1") == "1" else None
+)
+
+async def session_turn(turn, body: dict):
+    """
+    Runs a turn for a client that sends {"session_id", "message", "logs", ...} instead of the full chatHistory.
+    The session supplies messages, intent, flags and state, and records the bot's replies.
+    """
+    session_id = body["session_id"]
+    session = session_store.get(session_id) or Session(session_id=session_id)
+
+    # User actions logged by the page (e.g. "✅ You plan to send $10 ...") come in before the new message
+    for text in body.get("logs") or []:
+        session.messages.append({"role": "user", "content": text})
+    if body.get("message"):
+        session.messages.append({"role": "user", "content": body["message"]})
+
+    try:
+        result = await turn({
+            **body,
+            "messages": session.messages,
+            "intent": session.intent or body.get("intent"),
+            # Form pages send flags read from the DOM; everywhere else the session's flags are used
+            "substep_flags": body["substep_flags"] if "substep_flags" in body else session.substep_flags,
+            "state": body.get("state") or session.state,
+        })
+    except asyncio.CancelledError:
+        session_store.save(session)  # a newer turn replaced this one; keep the logs it already added
+        raise
+
+    with tracer.span("turn.postprocess"):
+        save_session_turn(session, result)
+    return {**result, "session_id": session_id} if result else result
+
+def save_session_turn(session, result):
+    """Records the bot's reply (and the intent, flags and state it reached) in the session."""
+    if result:
+        if result.get("intent") not in (None, "unknown"):
+            session.intent = result["intent"]
+        session.messages.append({"role": "assistant", "content": result.get("botMessage") or ""})
+        for act in result.get("action") or []:
+            if isinstance(act, dict) and act.get("immediate_reply"):
+                session.messages.append({"role": "assistant", "content": act["immediate_reply"]})
+        if result.get("substep_flags"):
+            session.substep_flags = dict(result["substep_flags"])
+        if result.get("state"):
+            session.state = result["state"]
+    session_store.save(session)
+
+async def run_turn(turn, body: dict):
+    with tracer.span("turn", assistant=body.get("assistant"), page=body.get("currentPage")):
+        if "session_id" in body and "messages" not in body:
+            if turn_queue is not None:
+                return await turn_queue.submit(body["session_id"], body, functools.partial(session_turn, turn))
+            return await session_turn(turn, body)
+        return await turn(body)
+
+async def read_json(request: Request):
+    with tracer.span("request.parse"):
+        return await request.json()
 
-    
-    # Output to audio stream
-    audio_config = speechsdk.audio.AudioOutputConfig(use_default_speaker=True)
-    speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-
-    # Synthesize speech
-    speech_synthesis_result = speech_synthesizer.speak_text_async(text).get()   # The speech happens entirely inside this line. It triggers Azure TTS → it sends audio → plays on speaker.
-    if speech_synthesis_result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-        print("Speech synthesized for text [{}]".format(text))
-        return { "status": "success", "text": text }
-    elif speech_synthesis_result.reason == speechsdk.ResultReason.Canceled:
-        cancellation_details = speech_synthesis_result.cancellation_details
-        print("Speech synthesis canceled: {}".format(cancellation_details.reason))
-        if cancellation_details.reason == speechsdk.CancellationReason.Error:
-            if cancellation_details.error_details:
-                print("Error details: {}".format(cancellation_details.error_details))
-                print("Did you set the speech resource key and endpoint values?")
-        return { "status": "error", "reason": str(cancellation_details.reason) }
 
 # Grace - Alex
-@app.post("/tutorbot")
-async def chat(request: Request):
-    body = await request.json()
+async def tutor_turn(body: dict):
     messages = body.get("messages", [])
     new_page_loaded = body.get("newPageLoaded", False)
     intent = body.get("intent") or None
@@ -1370,30 +2128,57 @@ async def chat(request: Request):
     if intent in ["unknown", "null", "", "undefined", None]:
         intent = None
 
-    print("====Intent and current_page from frontend:", intent, current_page)
-
-    # 1. Intent Identification
-    if not intent:
-        # Ask questions until intent is identified
-        print("====Identifying intent...")
-        intent = api_call(INTENT_PROMPT, messages)
-        if intent == "clarification_required":
-            print("====Intent unclear, asking for clarification...")
-            follow_up = api_call(INTENT_CLARIFICATION_PROMPT, messages)
-            return {
-                "intent": "unknown",
-                "selector": "",
-                "botMessage": follow_up,
-            }
+    turn_log.debug("Intent and current_page from frontend: %s %s", intent, current_page)
+
+    verdict = None
+    if combined_classifier_enabled and not new_page_loaded:
+        verdict = await classify_turn(messages, intent, assistant, current_page, substep_flags)
+    if verdict is not None:
+        if verdict["go_back"]:
+            return GO_BACK_RESPONSE
+        if not intent:
+            intent = verdict["intent"]
+            if intent == "clarification_required":
+                return {
+                    "intent": "unknown",
+                    "selector": "",
+                    "botMessage": verdict["question"],
+                }
+    else:
+        # 🔙 GPT-powered back-intent check (runs before intent ID)
+        if navigation_back_enabled and not new_page_loaded and await wants_navigation_back(messages):
+            return GO_BACK_RESPONSE
+
+        # 1. Intent Identification
+        if not intent:
+            # Ask questions until intent is identified
+            turn_log.debug("Identifying intent...")
+            intent, follow_up = await classify_or_clarify(INTENT_PROMPT, INTENT_CLARIFICATION_PROMPT, messages, "intent",
+                                                          label=local_intent(messages))
+            if intent == "clarification_required":
+                turn_log.debug("Intent unclear, asking for clarification...")
+                return {
+                    "intent": "unknown",
+                    "selector": "",
+                    "botMessage": follow_up,
+                }
     # When an intent is identified (either just identified from above block, or passed from the frontend), we need to go to the next step and send the next instruction
-    return handle_known_intent(intent, current_page, substep_flags, messages, new_page_loaded, assistant=assistant)
+    label = verdict["label"] if verdict else None
+    return await handle_known_intent(intent, current_page, substep_flags, messages, new_page_loaded, assistant=assistant, label=label)
+
+@app.post("/tutorbot")
+async def chat(request: Request):
+    body = await read_json(request)
+    return await run_turn(tutor_turn, body)
+
+@app.post("/tutorbot/stream")
+async def chat_stream(request: Request):
+    body = await read_json(request)
+    return StreamingResponse(stream_turn(functools.partial(run_turn, tutor_turn), body), media_type="application/x-ndjson")
 
 
 # Frank - Sam
-@app.post("/tellerbot")
-async def chat(request: Request):
-    print("🔔 /tellerbot hit")
-    body = await request.json()
+async def teller_turn(body: dict):
     messages = body.get("messages", [])
     intent = body.get("intent") or None
     substep_flags = body.get("substep_flags", {})   # example: {"account_chosen": True}
@@ -1405,64 +2190,225 @@ async def chat(request: Request):
     if intent in ["unknown", "null", "", "undefined", None]:
         intent = None
 
-    print("====Intent and current_page from frontend:", intent, current_page)
-
-    # # 🔙 GPT-powered back-intent check (runs before intent ID)
-    # if wants_navigation_back(messages):
-    #     return {
-    #         "botMessage": "Okay — going back to the previous page.",
-    #         "action": [{"action": "navigate", "value": "back"}],
-    #     }
-
-    # 1. Intent Identification
-    if not intent:
-        # Ask questions until intent is identified
-        print("==Identifying intent...")
-        intent = api_call(INTENT_PROMPT, messages)
-        if intent == "clarification_required":
-            print("==Intent unclear, asking for clarification...")
-            follow_up = api_call(INTENT_CLARIFICATION_PROMPT, messages)
-            return {
-                "intent": "unknown",
-                "action": "",
-                "botMessage": follow_up,
-            }
+    turn_log.debug("Intent and current_page from frontend: %s %s", intent, current_page)
+
+    # With COMBINED_CLASSIFIER=1, intent, go-back and the substep label come from one completion
+    verdict = None
+    if combined_classifier_enabled and not new_page_loaded:
+        verdict = await classify_turn(messages, intent, assistant, current_page, substep_flags)
+    if verdict is not None:
+        if verdict["go_back"]:
+            return GO_BACK_RESPONSE
+        if not intent:
+            intent = verdict["intent"]
+            if intent == "clarification_required":
+                return {
+                    "intent": "unknown",
+                    "action": "",
+                    "botMessage": verdict["question"],
+                }
+    else:
+        # 🔙 GPT-powered back-intent check (runs before intent ID)
+        if navigation_back_enabled and not new_page_loaded and await wants_navigation_back(messages):
+            return GO_BACK_RESPONSE
+
+        # 1. Intent Identification
+        if not intent:
+            # Ask questions until intent is identified
+            turn_log.debug("Identifying intent...")
+            intent, follow_up = await classify_or_clarify(INTENT_PROMPT, INTENT_CLARIFICATION_PROMPT, messages, "intent",
+                                                          label=local_intent(messages))
+            if intent == "clarification_required":
+                turn_log.debug("Intent unclear, asking for clarification...")
+                return {
+                    "intent": "unknown",
+                    "action": "",
+                    "botMessage": follow_up,
+                }
     
     # When an intent is identified (either just identified from above block, or passed from the frontend), we need to go to the next step and send the next instruction
     # messages is a list of dicts like {"role": "user", "content": "..."}
-    user_message = next(
-        (m["content"] for m in reversed(messages) if m.get("role") == "user"),
-        ""
-    )
-    print("==User_message:", user_message)
-    res = handle_known_intent(intent, current_page, substep_flags, messages, new_page_loaded, state=state, assistant=assistant)
-    print("===Response from handle_known_intent:", res)
+    user_message = latest_user_message(messages)
+    turn_log.debug("User message: %d characters", len(user_message or ""))
+    label = verdict["label"] if verdict else None
+    res = await handle_known_intent(intent, current_page, substep_flags, messages, new_page_loaded, state=state, assistant=assistant, label=label)
+    # Action kinds, not their filled-in values
+    turn_log.debug("Response from handle_known_intent: intent %s, actions %s", res.get("intent"),
+                   [act.get("action") for act in res.get("action") or [] if isinstance(act, dict)])
     return res
 
+@app.post("/tellerbot")
+async def chat(request: Request):
+    body = await read_json(request)
+    return await run_turn(teller_turn, body)
+
+@app.post("/tellerbot/stream")
+async def chat_stream(request: Request):
+    body = await read_json(request)
+    return StreamingResponse(stream_turn(functools.partial(run_turn, teller_turn), body), media_type="application/x-ndjson")
+
 ### Another endpoint to add payees
 
-# Global list (prototype)
-payees = [
-    {"name": "BC Hydro", "account": "73738374622"},
-    {"name": "Telus Mobile", "account": "36379939374"},
-]
+# Mutations (payees, autopayments, alerts) are serialized across workers through one SQLite file, and a
+# retried POST with the same Idempotency-Key header gets the first result back instead of writing again
+mutation_store = MutationStore(os.getenv("MUTATIONS_DB_PATH", "mutations.sqlite3"))
+synced_versions = {}  # collection -> latest version applied to this worker's in-memory copy
+
+def sync_collection(collection: str, apply_record):
+    """Applies writes made by other workers (and replays of our own, harmlessly) to the in-memory copy."""
+    for version, record in mutation_store.changes(collection, synced_versions.get(collection, 0)):
+        apply_record(record)
+        synced_versions[collection] = version
+
+async def apply_mutation(collection: str, body: dict, write, idempotency_key: Optional[str], on_commit=None):
+    """(MutationResult, None) or (None, error response)."""
+    try:
+        return await run_in_threadpool(mutation_store.apply, collection, body, write, idempotency_key, on_commit), None
+    except IdempotencyConflict as e:
+        return None, JSONResponse({"status": "error", "reason": str(e)}, status_code=422)
+    except ValueError as e:
+        return None, JSONResponse({"status": "error", "reason": str(e)}, status_code=400)
+
+# Payees live in SQLite (PAYEE_DB_PATH) with per-worker in-memory indexes by account and name
+payee_store = PayeeStore(os.getenv("PAYEE_DB_PATH", "payees.sqlite3"))
+if not len(payee_store):
+    payee_store.add_many([
+        ("BC Hydro", "73738374622"),
+        ("Telus Mobile", "36379939374"),
+    ])
+
+# Spoken/spelled payee names resolved against the directory; PAYEE_MATCH_THRESHOLD is the confidence that skips the LLM
+payee_resolver = PayeeNameResolver(payee_store, threshold=float(os.getenv("PAYEE_MATCH_THRESHOLD", "0.85")))
+
+# E-transfer contacts live in SQLite (CONTACTS_DB_PATH) like payees
+contact_store = ContactStore(os.getenv("CONTACTS_DB_PATH", "contacts.sqlite3"))
+if not len(contact_store):
+    contact_store.add_many([
+        ("Bob Chen", "bob.chen@emailaddress.com"),
+        ("Sophia Smith", "sophia.smith@emailaddress.com"),
+        ("David Kim", "david.kim@emailaddress.com"),
+    ])
+
+# Substeps with an "option_provider" classify over the OPTION_RETRIEVAL_K directory entries closest to what the user said,
+# so the prompt stays the same size however many contacts or payees there are. Provider -> (retriever, field telling namesakes apart)
+option_retrieval_k = int(os.getenv("OPTION_RETRIEVAL_K", "8"))
+option_providers = {
+    "contacts": (OptionRetriever(contact_store), "email"),
+    "payees": (OptionRetriever(payee_store), "account"),
+}
 
 class Payee(BaseModel):
     name: str
     account: str
 
 @app.post("/api/add_payee")
-async def add_payee(payee: Payee):
-    payees.append({"name": payee.name, "account": payee.account})
-    return {"status": "success", "payees": payees}
+async def add_payee(payee: Payee, idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    def write(version):
+        existing = payee_store.get_by_account(payee.account)
+        if existing is not None:
+            return existing.account, {"name": existing.name, "account": existing.account}, False
+        # The mutation log decides "created" under the cross-worker lock, so two workers racing on one account don't both say so
+        return payee.account.strip(), {"name": payee.name.strip(), "account": payee.account.strip()}, None
+
+    def on_commit(result):
+        payee_store.add(result.record["name"], result.record["account"])
+
+    result, error = await apply_mutation("payees", payee.dict(), write, idempotency_key, on_commit)
+    if error:
+        return error
+    return {"status": "success", "payee": result.record, **result.to_dict()}
 
 @app.get("/api/payees")
-async def list_payees():
-    return {"payees": payees}
+async def list_payees(offset: int = 0, limit: int = 50):
+    return payee_store.list(max(offset, 0), min(max(limit, 1), 200))
 
+@app.get("/api/payees/resolve")
+async def resolve_payee(q: str = "", k: int = 5):
+    resolution = payee_resolver.resolve(q, k=min(max(k, 1), 20))
+    return {
+        "confident": resolution.confident,
+        "query": resolution.query,
+        "candidates": [{"name": m.name, "account": m.account, "score": m.score} for m in resolution.matches],
+    }
+
+@app.get("/api/payees/search")
+async def search_payees(q: str = "", offset: int = 0, limit: int = 20):
+    return payee_store.search(q, max(offset, 0), min(max(limit, 1), 100))
+
+# After /resolve and /search, so those aren't taken for an id
+@app.get("/api/payees/{payee_id}")
+async def get_payee(payee_id: int):
+    record = payee_store.get(payee_id)
+    if record is None:
+        return JSONResponse({"status": "error", "reason": f"Unknown payee: {payee_id}"}, status_code=404)
+    return record.to_dict()
+
+@app.get("/api/contacts")
+async def list_contacts(offset: int = 0, limit: int = 50):
+    return contact_store.list(max(offset, 0), min(max(limit, 1), 200))
+
+@app.get("/api/contacts/{contact_id}")
+async def get_contact(contact_id: int):
+    record = contact_store.get(contact_id)
+    if record is None:
+        return JSONResponse({"status": "error", "reason": f"Unknown contact: {contact_id}"}, status_code=404)
+    return record.to_dict()
+
+
+# Account activity: transactions in SQLite (STATEMENTS_DB_PATH), paged as JSON and exported as a streamed CSV
+STATEMENT_ACCOUNTS = ("chequing", "savings")
+transaction_store = TransactionStore(os.getenv("STATEMENTS_DB_PATH", "statements.sqlite3"))
+if transaction_store.count() == 0:
+    transaction_store.append("chequing", [
+        (date(2025, 8, 3), "CREDIT CARD CASHBACK", 50.00),
+        (date(2025, 8, 5), "GROCERIES", -100.00),
+        (date(2025, 8, 8), "GAS", -100.00),
+    ], opening_balance=3692.30)
+    transaction_store.append("savings", [(date(2025, 7, 31), "INTEREST", 0.05)], opening_balance=12874.05)
+
+def unknown_account(account: str):
+    return JSONResponse({"status": "error", "reason": f"Unknown account: {account}"}, status_code=404)
+
+@app.get("/api/accounts/{account}/transactions")
+async def account_transactions(account: str, start: Optional[date] = None, end: Optional[date] = None,
+                               cursor: Optional[str] = None, limit: int = 50):
+    if account not in STATEMENT_ACCOUNTS:
+        return unknown_account(account)
+    try:
+        page = await run_in_threadpool(transaction_store.page, account, start, end, cursor, limit)
+    except ValueError:
+        return JSONResponse({"status": "error", "reason": "Invalid cursor"}, status_code=400)
+    return {**page, "balance": await run_in_threadpool(transaction_store.balance, account)}
+
+@app.get("/api/accounts/{account}/statement.csv")
+async def download_statement(account: str, start: Optional[date] = None, end: Optional[date] = None):
+    if account not in STATEMENT_ACCOUNTS:
+        return unknown_account(account)
+    # A sync generator: Starlette iterates it in the threadpool, one block of rows at a time
+    rows = transaction_store.iter_transactions(account, start, end)
+    return StreamingResponse(
+        statement_csv(rows),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{account}_statement.csv"'},
+    )
 
-# Global list (prototype)
-autopayments = []
+
+# Autopayments: a timer wheel keyed by next run date; executions are recorded once per (autopayment, date)
+autopay_notifications = deque(maxlen=int(os.getenv("AUTOPAY_MEMORY_EVENTS", "1000")))
+
+def on_autopayment_executed(ap, record):
+    message = f"Autopayment of ${record.amount:,.2f} to {ap.name} from {ap.from_account} was made on {record.run_date.isoformat()}."
+    autopay_log.info(message)
+    for channel, wanted in (("sms", ap.notify_sms), ("email", ap.notify_email)):
+        if wanted:
+            autopay_notifications.append({"channel": channel, "autopayment_id": ap.id, "message": message})
+
+# Every worker runs the schedules; the shared execution log makes sure each run is paid once
+autopay_scheduler = AutopayScheduler(
+    execution_log=SQLiteExecutionLog(os.getenv("AUTOPAY_EXECUTIONS_PATH", "autopay_executions.sqlite3")),
+    on_execute=on_autopayment_executed,
+)
+autopay_tick_seconds = float(os.getenv("AUTOPAY_TICK_SECONDS", "60"))
 
 class AutoPayment(BaseModel):
     name: str
@@ -1470,23 +2416,101 @@ class AutoPayment(BaseModel):
     enabled: bool
     amount: float
     fromAccount: str
-    frequency: str
-    paymentDate: str
+    frequency: str        # "Once", "Weekly", "Bi-weekly" or "Monthly"
+    paymentDate: str      # first run, YYYY-MM-DD
     notify_sms: bool = False
     notify_email: bool = False
 
+def schedule_autopayment(record: dict):
+    return autopay_scheduler.add(
+        name=record["name"], account=record["account"], amount=record["amount"], from_account=record["from_account"],
+        frequency=record["frequency"], start=date.fromisoformat(record["start"]), enabled=record["enabled"],
+        notify_sms=record["notify_sms"], notify_email=record["notify_email"], autopayment_id=record["id"],
+        # Records saved before "created" existed were caught up on save; their executions are already logged
+        created=date.fromisoformat(record.get("created") or record["start"]),
+    )
+
+def sync_autopayments():
+    sync_collection("autopayments", schedule_autopayment)
+
+def run_due_autopayments():
+    sync_autopayments()
+    return autopay_scheduler.run_due()
+
+async def run_autopayments_forever():
+    while True:
+        try:
+            await run_in_threadpool(run_due_autopayments)
+        except Exception as e:
+            autopay_log.exception("Autopayment run failed: %s", e)
+        await asyncio.sleep(autopay_tick_seconds)
+
+@app.on_event("startup")
+async def start_autopay_scheduler():
+    if autopay_tick_seconds > 0:
+        app.state.autopay_task = asyncio.create_task(run_autopayments_forever())
+
+@app.on_event("shutdown")
+async def stop_autopay_scheduler():
+    task = getattr(app.state, "autopay_task", None)
+    if task is not None:
+        task.cancel()
+
 @app.post("/api/autopayments")
-async def save_autopayment(ap: AutoPayment):
-    autopayments.append(ap.dict())
-    return {"status": "success", "autopayments": autopayments}
+async def save_autopayment(ap: AutoPayment, idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    def write(version):
+        # The collection version is unique across workers, so it doubles as the new autopayment's id
+        built = autopay_scheduler.build(
+            name=ap.name, account=ap.account, amount=ap.amount, from_account=ap.fromAccount,
+            frequency=ap.frequency, start=date.fromisoformat(ap.paymentDate), enabled=ap.enabled,
+            notify_sms=ap.notify_sms, notify_email=ap.notify_email, autopayment_id=version,
+        )
+        return str(built.id), built.to_dict(), True
+
+    result, error = await apply_mutation("autopayments", ap.dict(), write, idempotency_key,
+                                         lambda result: schedule_autopayment(result.record))
+    if error:
+        return error
+    # A payment dated today runs now rather than on the next tick (earlier dates were skipped when scheduled)
+    await run_in_threadpool(run_due_autopayments)
+    return {"status": "success", "autopayment": result.record, **result.to_dict()}
 
 @app.get("/api/autopayments")
-async def list_autopayments():
-    return {"autopayments": autopayments}
+async def list_autopayments(since: int = 0):
+    """Autopayments saved after version `since` (all by default), plus the current version to pass next time."""
+    await run_in_threadpool(sync_autopayments)
+    changed = [autopay_scheduler.get(record["id"]) for _, record in mutation_store.changes("autopayments", since)]
+    return {"version": mutation_store.version("autopayments"), "autopayments": [ap.to_dict() for ap in changed if ap]}
+
+@app.get("/api/autopayments/upcoming")
+async def upcoming_autopayments(days: int = 30):
+    await run_in_threadpool(sync_autopayments)
+    runs = autopay_scheduler.upcoming(min(max(days, 1), 366))
+    return {
+        "days": days,
+        "payments": [
+            {"date": run.isoformat(), "autopayment_id": ap.id, "name": ap.name, "amount": ap.amount, "fromAccount": ap.from_account}
+            for run, ap in runs
+        ],
+    }
+
+@app.get("/api/autopayments/executions")
+async def autopayment_executions(limit: int = 50):
+    return {
+        "executions": [
+            {**asdict(r), "run_date": r.run_date.isoformat()} for r in autopay_scheduler.execution_log.recent(limit)
+        ],
+        "notifications": list(autopay_notifications)[-limit:],
+    }
 
 
 # --- New Alerts Example ---
-alerts = []  # simple in-memory list for demo
+# Alert rules keyed by card; the engine evaluates card transactions against them in batches
+alert_index = AlertIndex()
+alert_notifications = MemorySink(max_events=int(os.getenv("ALERT_MEMORY_EVENTS", "1000")))
+alert_engine = AlertEngine(alert_index, sinks=[alert_notifications, LogSink(logging.getLogger("bankbot.alerts"))])
+if os.getenv("ALERT_EVENTS_PATH"):
+    alert_engine.add_sink(JsonlFileSink(os.getenv("ALERT_EVENTS_PATH")))
 
 class Alert(BaseModel):
     card_type: str        # e.g. "Credit Card"
@@ -1496,24 +2520,85 @@ class Alert(BaseModel):
     email: bool = False
     enabled: bool = False
 
+class Transaction(BaseModel):
+    card_type: str
+    last_digits: str
+    amount: float
+    merchant: str = ""
+    timestamp: float = 0.0
+    transaction_id: str = ""
+
 @app.post("/api/save_alert")
-async def save_alert(alert: Alert):
-    # replace existing alert for this card
-    for i, a in enumerate(alerts):
-        if a["card_type"] == alert.card_type and a["last_digits"] == alert.last_digits:
-            alerts[i] = alert.dict()
-            return {"status": "updated", "alerts": alerts}
-    alerts.append(alert.dict())
-    return {"status": "created", "alerts": alerts}
+async def save_alert(alert: Alert, idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    # replaces the existing alert for this card
+    def write(version):
+        rule = AlertRule(**alert.dict())
+        return f"{rule.card_type}:{rule.last_digits}", asdict(rule), None
+
+    result, error = await apply_mutation("alerts", alert.dict(), write, idempotency_key,
+                                         lambda result: alert_index.save(AlertRule(**result.record)))
+    if error:
+        return error
+    return {"status": "created" if result.created else "updated", "alert": result.record, **result.to_dict()}
+
+def sync_alerts():
+    sync_collection("alerts", lambda record: alert_index.save(AlertRule(**record)))
 
 
 @app.get("/api/alerts")
-async def get_alerts():
-    return {"alerts": alerts}
+async def get_alerts(since: int = 0):
+    """Alert rules saved after version `since` (all by default), plus the current version to pass next time."""
+    await run_in_threadpool(sync_alerts)
+    return {
+        "version": mutation_store.version("alerts"),
+        "alerts": [record for _, record in mutation_store.changes("alerts", since)],
+    }
 
 @app.get("/api/get_alert")
 async def get_alert(card_type: str, last_digits: str):
-    for alert in alerts:
-        if alert["card_type"] == card_type and alert["last_digits"] == last_digits:
-            return {"alert": alert}
-    return {"alert": None}
\ No newline at end of file
+    await run_in_threadpool(sync_alerts)
+    rule = alert_index.get(card_type, last_digits)
+    return {"alert": asdict(rule) if rule else None}
+
+@app.post("/api/alerts/evaluate")
+async def evaluate_alerts(transactions: list[Transaction]):
+    """Runs a batch of card transactions through the alert rules; notifications go to the sinks."""
+    collected = MemorySink(max_events=None)
+    await run_in_threadpool(sync_alerts)
+    run = await run_in_threadpool(alert_engine.process, [CardTransaction(**t.dict()) for t in transactions], [collected])
+    return {**run, "notifications": [e.to_dict() for e in collected.events]}
+
+@app.get("/api/alerts/notifications")
+async def get_alert_notifications(limit: int = 50):
+    return {"notifications": [e.to_dict() for e in list(alert_notifications.events)[-limit:]]}
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(tracer.metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/stats")
+async def get_stats():
+    return {
+        "fastpath": fastpath_matcher.stats(),
+        "intent_classifier": intent_classifier.stats() if intent_classifier else None,
+        "llm_cache": llm_cache.stats() if llm_cache else None,
+        "context": context_budget.stats(),
+        "combined_classifier": {**combined_classifier_stats, "enabled": combined_classifier_enabled},
+        "speculation": {**speculation_stats, "enabled": speculative_clarification_enabled},
+        "tts": tts_service.stats(),
+        "mutations": mutation_store.stats(),
+        "payees": payee_store.stats(),
+        "payee_resolver": payee_resolver.stats(),
+        "fill_resolvers": fill_resolver_stats,
+        "contacts": contact_store.stats(),
+        "option_retrieval": {name: retriever.stats() for name, (retriever, _) in option_providers.items()},
+        "autopayments": autopay_scheduler.stats(),
+        "alerts": alert_engine.stats(),
+        "logging": logging_setup.stats(),
+        "turn_queue": turn_queue.stats() if turn_queue else None,
+        "singleflight": llm_flight.stats() if llm_flight else None,
+        "fake_llm": fake_llm.stats() if fake_llm else None,
+        "llm_recorder": llm_recorder.stats() if llm_recorder else None,
+    }
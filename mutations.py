@@ -0,0 +1,157 @@
+"""
+Idempotent, versioned writes for the mutation endpoints (payees, autopayments, alerts).
+
+Voice-driven clients retry, so the same POST can arrive twice, possibly on two
+uvicorn workers. Every write goes through MutationStore.apply():
+
+- the write runs inside BEGIN IMMEDIATE on a shared SQLite file, which serializes
+  writers across workers; a write holds it for a few milliseconds
+- with an Idempotency-Key the first result is stored; a retry with the same key and
+  body gets that result back without writing again, and the same key with another
+  body is refused (IdempotencyConflict)
+- each collection has a version bumped by every write; the result carries only the
+  written record and the new version, never the whole collection
+- written records are kept by (collection, record key), so a worker whose in-memory
+  index is behind reads changes(collection, since_version) and applies just those
+- write only builds the record; in-memory state (scheduler, indexes) is changed by
+  on_commit once the transaction has committed, so a rolled-back write leaves no trace
+"""
+from dataclasses import dataclass
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+KEY_TTL_SECONDS = 24 * 3600   # how long a retry can still be recognised
+PURGE_EVERY = 500             # writes between sweeps of expired keys
+
+
+class IdempotencyConflict(Exception):
+    """The Idempotency-Key was already used for a different request body."""
+
+
+@dataclass(frozen=True)
+class MutationResult:
+    collection: str
+    record: dict
+    version: int
+    created: bool
+    replayed: bool = False    # True when this is the stored result of an earlier request with the same key
+
+    def to_dict(self) -> dict:
+        return {"created": self.created, "version": self.version, "replayed": self.replayed}
+
+
+def fingerprint(body) -> str:
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class MutationStore:
+    def __init__(self, path: str, clock=time.time, key_ttl: float = KEY_TTL_SECONDS):
+        self.clock = clock
+        self.key_ttl = key_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")  # wait for another worker's write instead of failing
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS collection_versions (collection TEXT PRIMARY KEY, version INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS collection_records ("
+            " collection TEXT NOT NULL, record_key TEXT NOT NULL, version INTEGER NOT NULL, body TEXT NOT NULL,"
+            " PRIMARY KEY (collection, record_key));"
+            "CREATE INDEX IF NOT EXISTS collection_records_by_version ON collection_records (collection, version);"
+            "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+            " collection TEXT NOT NULL, key TEXT NOT NULL, fingerprint TEXT NOT NULL, result TEXT NOT NULL,"
+            " created_at REAL NOT NULL, PRIMARY KEY (collection, key));"
+        )
+        self._writes = 0
+        self._stats = {"writes": 0, "replays": 0, "conflicts": 0}
+
+    def apply(self, collection: str, body: dict, write: Callable[[int], Tuple[str, dict, Optional[bool]]],
+              idempotency_key: Optional[str] = None,
+              on_commit: Optional[Callable[[MutationResult], None]] = None) -> MutationResult:
+        """
+        Runs write(version) under the cross-worker write lock, where version is the one this
+        write will get. write returns (record key, record, created); created=None means "created unless
+        a record with this key exists". A known idempotency_key returns the stored result instead.
+        write must not touch in-memory state: on_commit(result) does that after COMMIT, still in
+        version order for this worker, and isn't called for replays or rolled-back writes.
+        """
+        digest = fingerprint(body)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if idempotency_key:
+                    row = self._conn.execute(
+                        "SELECT fingerprint, result FROM idempotency_keys WHERE collection = ? AND key = ? AND created_at > ?",
+                        (collection, idempotency_key, self.clock() - self.key_ttl),
+                    ).fetchone()
+                    if row is not None:
+                        self._conn.execute("COMMIT")
+                        if row[0] != digest:
+                            self._stats["conflicts"] += 1
+                            raise IdempotencyConflict(f"Idempotency-Key {idempotency_key!r} was used for a different request")
+                        self._stats["replays"] += 1
+                        return MutationResult(**{**json.loads(row[1]), "replayed": True})
+
+                row = self._conn.execute(
+                    "SELECT version FROM collection_versions WHERE collection = ?", (collection,)
+                ).fetchone()
+                version = (row[0] if row else 0) + 1
+                record_key, record, created = write(version)
+                if created is None:
+                    created = self._conn.execute(
+                        "SELECT 1 FROM collection_records WHERE collection = ? AND record_key = ?", (collection, record_key)
+                    ).fetchone() is None
+                self._conn.execute(
+                    "INSERT INTO collection_versions (collection, version) VALUES (?, ?) "
+                    "ON CONFLICT (collection) DO UPDATE SET version = excluded.version",
+                    (collection, version),
+                )
+                self._conn.execute(
+                    "INSERT INTO collection_records (collection, record_key, version, body) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (collection, record_key) DO UPDATE SET version = excluded.version, body = excluded.body",
+                    (collection, record_key, version, json.dumps(record)),
+                )
+                result = MutationResult(collection, record, version, created)
+                if idempotency_key:
+                    stored = {"collection": collection, "record": record, "version": version, "created": created}
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO idempotency_keys VALUES (?, ?, ?, ?, ?)",
+                        (collection, idempotency_key, digest, json.dumps(stored), self.clock()),
+                    )
+                self._writes += 1
+                if self._writes % PURGE_EVERY == 0:
+                    self._conn.execute("DELETE FROM idempotency_keys WHERE created_at <= ?", (self.clock() - self.key_ttl,))
+                self._conn.execute("COMMIT")
+            except IdempotencyConflict:
+                raise
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._stats["writes"] += 1
+            if on_commit is not None:
+                on_commit(result)
+            return result
+
+    def version(self, collection: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM collection_versions WHERE collection = ?", (collection,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def changes(self, collection: str, since_version: int = 0) -> List[Tuple[int, dict]]:
+        """(version, record) written after since_version, oldest first; each record appears once, latest body."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, body FROM collection_records WHERE collection = ? AND version > ? ORDER BY version",
+                (collection, since_version),
+            ).fetchall()
+        return [(version, json.loads(body)) for version, body in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,198 @@
+"""
+Local candidate retrieval for classification over large directories (contacts, payees).
+
+The recipient steps used to put every option into CLASSIFICATION_DECISION_PROMPT,
+which is fine for three contacts and not for three thousand: prompt size and
+latency grow with the directory. OptionRetriever narrows the choice to the top-k
+names before any LLM call, so the prompt has at most k options however big the
+directory is:
+
+1. the user's words, minus filler ("send money to", "pay my", amounts), with
+   spelled-out letters joined ("b c hydro" -> "bc", "hydro")
+2. candidates from two indexes over each name's words: a phonetic key
+   (a small Metaphone-style code, so "Sofia" finds "Sophia" and "Chan" finds
+   "Chen") and trigrams (typos, partial words). Only the query's rarest
+   trigrams are looked up, so gathering costs about the same at any size.
+3. the best RERANK candidates by index hits are scored: for each word of the
+   name, its best match among the query words (edit similarity, prefix or
+   phonetic match), blended as 0.6 * best + 0.4 * mean, or the edit similarity
+   of the whole name against runs of query words, whichever is higher
+
+A directory with no more than k names is returned whole, ranked, so small
+directories keep today's behaviour. The LLM still makes the decision; this only
+chooses what it decides between.
+"""
+from collections import Counter
+from dataclasses import dataclass
+from itertools import islice
+import re
+import threading
+from typing import List
+
+from payee_resolver import FILLER_WORDS, edit_similarity
+from payee_store import normalize_name, trigrams
+
+OPTION_FILLER_WORDS = FILLER_WORDS | {
+    "send", "sending", "sent", "money", "cash", "funds", "transfer", "transferring", "etransfer", "interac",
+    "dollars", "dollar", "bucks", "cents", "bill", "bills", "paying", "payment", "contact", "contacts",
+    "recipient", "person", "for", "him", "her", "them", "me", "one", "would", "id", "im", "choose", "select",
+    "pick", "go", "with", "of", "on", "from", "do", "can", "you", "he", "she", "they", "his", "their", "no", "not",
+    "actually", "instead", "oh", "hi", "hey", "thanks", "thank", "need", "wanna", "let", "lets", "hello", "be",
+}
+# Applied in order; upper case marks sounds already coded, so later rules leave them alone
+PHONETIC_RULES = (
+    (r"^(kn|gn|pn)", "n"), (r"^wr", "r"), (r"^ps", "s"), (r"^x", "s"), (r"^wh", "w"),
+    (r"ph", "f"), (r"ck", "k"), (r"sch", "sk"), (r"tch", "X"), (r"ch|sh", "X"), (r"th", "0"),
+    (r"dg(?=[eiy])", "J"), (r"c(?=[eiy])", "s"), (r"c", "k"), (r"q", "k"), (r"x", "ks"), (r"z", "s"),
+    (r"g(?=[eiy])", "J"), (r"v", "f"),
+)
+CANDIDATE_TRIGRAMS = 3     # rarest trigrams looked up per query word
+MAX_CANDIDATES = 2000      # ids taken from any one posting list
+RERANK = 30                # candidates scored exactly
+PHONETIC_HITS = 3          # a phonetic match counts like this many shared trigrams when gathering
+PHONETIC_SCORE = 0.85
+PREFIX_SCORE = 0.8         # "soph" -> "sophia"
+MIN_SCORE = 0.45
+
+
+def phonetic_key(word: str) -> str:
+    """
+    A Metaphone-style code: digraphs and soft c/g rewritten, vowels dropped after the
+    first letter, repeats collapsed. "sophia", "sofia" -> "sf"; "chen", "chan" -> "Xn".
+    """
+    word = re.sub(r"[^a-z]", "", (word or "").lower())
+    if not word:
+        return ""
+    for pattern, replacement in PHONETIC_RULES:
+        word = re.sub(pattern, replacement, word)
+    head = "a" if word[0] in "aeiouy" else word[0]
+    return re.sub(r"(.)\1+", r"\1", head + re.sub(r"[aeiouyhw]", "", word[1:]))
+
+
+def query_words(text: str) -> List[str]:
+    """The words of a message that could be part of a name: filler, amounts and lone letters dropped."""
+    words, spelled = [], False
+    for token in normalize_name(text).split():
+        letter = len(token) == 1 and token.isalpha()
+        if letter and spelled:
+            words[-1] += token  # "b c hydro" -> "bc", "hydro"
+        else:
+            words.append(token)
+        spelled = letter
+    return [w for w in dict.fromkeys(words)
+            if len(w) >= 2 and w not in OPTION_FILLER_WORDS and not any(c.isdigit() for c in w)]
+
+
+def word_similarity(query: str, query_key: str, word: str, word_key: str, floor: float = 0.0) -> float:
+    """Edit similarity, raised for a prefix or a phonetic match. Anything at or below floor may come back as floor."""
+    score = floor
+    if len(query) >= 3 and word.startswith(query):
+        score = max(score, PREFIX_SCORE)
+    if len(word_key) >= 2 and query_key == word_key:  # one-letter codes ("bob", "bea" -> "b") say too little
+        score = max(score, PHONETIC_SCORE)
+    # Edit similarity can't exceed shorter length / longer length; skip the edit distance when that can't win
+    if min(len(query), len(word)) / max(len(query), len(word)) > score:
+        score = max(score, edit_similarity(query, word))
+    return score
+
+
+@dataclass(frozen=True)
+class Candidate:
+    record: object      # the store's record (PayeeRecord, ContactRecord)
+    score: float
+
+
+@dataclass(frozen=True)
+class Retrieval:
+    words: tuple        # the query words the candidates were matched against
+    candidates: tuple   # up to k Candidate, best first
+    scored: int         # records scored exactly
+
+
+class OptionRetriever:
+    def __init__(self, store, min_score: float = MIN_SCORE):
+        self.store = store
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self._records = {}     # id -> record
+        self._words = {}       # id -> ((word, phonetic key), ...) of the name
+        self._compact = {}     # id -> the name without spaces or punctuation
+        self._postings = {}    # trigram of a name word or of the compact name -> set of ids
+        self._phonetic = {}    # phonetic key of a name word -> set of ids
+        self._last_id = 0
+        self._stats = {"retrievals": 0, "empty": 0, "scored": 0, "returned": 0}
+
+    def _refresh(self):
+        """Indexes records added to the store since the last call."""
+        with self._lock:
+            for record in self.store.records(self._last_id):
+                words = record.name_norm.split()
+                self._records[record.id] = record
+                self._words[record.id] = tuple((w, phonetic_key(w)) for w in words)
+                self._compact[record.id] = "".join(words)
+                for gram in set().union(trigrams(self._compact[record.id]), *(trigrams(w) for w in words)):
+                    self._postings.setdefault(gram, set()).add(record.id)
+                for _, key in self._words[record.id]:
+                    if len(key) >= 2:
+                        self._phonetic.setdefault(key, set()).add(record.id)
+                self._last_id = max(self._last_id, record.id)
+
+    def _gather(self, words) -> list:
+        """Ids sharing a phonetic key or rare trigrams with the query, most hits first."""
+        hits = {}
+        for word, key in words:
+            for record_id in islice(self._phonetic.get(key, ()), MAX_CANDIDATES):
+                hits[record_id] = hits.get(record_id, 0) + PHONETIC_HITS
+            grams = sorted((g for g in trigrams(word) if g in self._postings), key=lambda g: len(self._postings[g]))
+            for gram in grams[:CANDIDATE_TRIGRAMS]:
+                for record_id in islice(self._postings[gram], MAX_CANDIDATES):
+                    hits[record_id] = hits.get(record_id, 0) + 1
+        return sorted(hits, key=hits.get, reverse=True)[:RERANK]
+
+    def _score(self, record_id, words, runs, memo) -> float:
+        best = []
+        for word, word_key in self._words[record_id]:
+            if word not in memo:  # first names repeat across candidates; score each name word once per query
+                similarity = 0.0
+                for query, query_key in words:
+                    similarity = word_similarity(query, query_key, word, word_key, floor=similarity)
+                memo[word] = similarity
+            best.append(memo[word])
+        score = 0.6 * max(best, default=0.0) + 0.4 * (sum(best) / len(best) if best else 0.0)
+        compact = self._compact[record_id]
+        letters = Counter(compact)
+        for run, run_letters in runs:
+            # Every letter one side lacks costs an edit, so shared letters bound the similarity; skip runs that can't win
+            if sum((letters & run_letters).values()) / max(len(run), len(compact)) > score:
+                score = max(score, edit_similarity(run, compact))
+        return score
+
+    def retrieve(self, text: str, k: int = 8) -> Retrieval:
+        self._refresh()
+        names = query_words(text)
+        words = tuple((w, phonetic_key(w)) for w in names)
+        # Runs of words spoken as one name: "bob chen" -> "bobchen", "b c hydro" -> "bchydro"
+        runs = ["".join(names[i:i + n]) for n in (2, 3) for i in range(len(names) - n + 1)]
+
+        small = len(self._records) <= k
+        if small:
+            ids = list(self._records)  # the whole directory fits in the prompt
+        else:
+            ids = self._gather(words + tuple((run, phonetic_key(run)) for run in runs)) if words else []
+        memo, run_letters = {}, [(run, Counter(run)) for run in runs]
+        scored = [(self._score(i, words, run_letters, memo) if words else 0.0, i) for i in ids]
+        if not small:
+            scored = [(score, i) for score, i in scored if score >= self.min_score]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        candidates = tuple(Candidate(self._records[i], round(score, 3)) for score, i in scored[:k])
+        with self._lock:
+            self._stats["retrievals"] += 1
+            self._stats["empty"] += not candidates
+            self._stats["scored"] += len(ids)
+            self._stats["returned"] += len(candidates)
+        return Retrieval(words=tuple(names), candidates=candidates, scored=len(ids))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "records": len(self._records), "trigrams": len(self._postings),
+                    "phonetic_keys": len(self._phonetic)}
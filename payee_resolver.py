@@ -0,0 +1,177 @@
+"""
+Local resolution of spoken/spelled payee names against the payee directory.
+
+On the add-payee step users say and spell names ("It's BC Hydro, B-C H-Y-D-R-O"),
+and fill_handler used to ask GPT to extract the value and then GPT again to drop
+the spelling. This resolver:
+
+1. collapses spelled-out letters into words ("B-C H-Y-D-R-O" -> "bchydro")
+2. builds a few candidate strings from the message (the spelled runs, the spoken words)
+3. looks them up in a trigram index of the directory's names, compared without
+   spaces or punctuation, and reranks the best hits by edit distance
+
+resolve() returns the top-k names with a 0..1 confidence. A match is confident
+when it clears the threshold and beats the next distinct name by a margin; only
+then does fill_handler skip the LLM.
+"""
+from dataclasses import dataclass
+from itertools import islice
+import re
+import threading
+from typing import List, Optional
+
+from payee_store import normalize_name, trigrams
+
+FILLER_WORDS = {
+    "a", "an", "the", "it", "its", "it's", "is", "name", "names", "payee", "payees", "called", "spell", "spelled",
+    "spelling", "that", "this", "i", "want", "to", "add", "pay", "my", "please", "yes", "ok", "okay", "sure",
+    "um", "uh", "so", "like", "and", "as", "in", "letters", "letter", "company", "organization",
+}
+SPELLING_SEPARATORS = {"space", "dash", "hyphen"}  # spoken between spelled words: "B C space H Y D R O"
+CANDIDATE_TRIGRAMS = 4
+MAX_CANDIDATES = 2000
+RERANK = 20
+
+
+def compact(text: str) -> str:
+    return normalize_name(text).replace(" ", "")
+
+
+def collapse_spelled_letters(text: str) -> List[str]:
+    """
+    Splits text into words with spelled-out letters collapsed into one word each:
+    "it's B-C H-Y-D-R-O" -> ["it's", "bchydro"], "b c hydro" -> ["bc", "hydro"].
+    A run is two or more letters given one at a time, or letters joined by - or . ("B-C", "B.C.").
+    """
+    words, run = [], []
+
+    def end_run():
+        if run:
+            words.append("".join(run))  # a lone letter ("a", "I") is kept as a word
+            run.clear()
+
+    for token in re.findall(r"[A-Za-z](?:[-.][A-Za-z])+\.?|[A-Za-z0-9']+", text):
+        lowered = token.lower().rstrip(".")
+        if re.fullmatch(r"[a-z](?:[-.][a-z])+", lowered):
+            run.append(re.sub(r"[-.]", "", lowered))
+        elif len(lowered) == 1 and lowered.isalpha():
+            run.append(lowered)
+        elif lowered in SPELLING_SEPARATORS and run:
+            end_run()
+        else:
+            end_run()
+            words.append(lowered)
+    end_run()
+    return words
+
+
+def query_variants(text: str, max_words: int = 4) -> List[str]:
+    """
+    Candidate names from a message, most specific first: word n-grams (spaces removed) of
+    what the user said and spelled, filler words dropped.
+    """
+    words = [w for w in collapse_spelled_letters(text) if w not in FILLER_WORDS]
+    variants = [
+        "".join(words[i:i + n])
+        for n in range(min(max_words, len(words)), 0, -1)
+        for i in range(len(words) - n + 1)
+    ]
+    return [v for v in dict.fromkeys(variants) if len(v) >= 2]
+
+
+def edit_similarity(a: str, b: str) -> float:
+    """1 - Levenshtein distance / longer length."""
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return 1.0 - previous[-1] / max(len(a), len(b))
+
+
+@dataclass(frozen=True)
+class PayeeMatch:
+    name: str
+    account: str
+    score: float
+
+
+@dataclass(frozen=True)
+class Resolution:
+    query: str                  # the candidate string that produced the best match
+    matches: tuple              # top-k PayeeMatch, best first
+    confident: bool
+
+    @property
+    def best(self) -> Optional[PayeeMatch]:
+        return self.matches[0] if self.matches else None
+
+
+class PayeeNameResolver:
+    def __init__(self, store, threshold: float = 0.85, margin: float = 0.1):
+        self.store = store
+        self.threshold = threshold
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._names = {}       # compact name -> PayeeRecord (first payee with that name)
+        self._postings = {}    # trigram of the compact name -> set of compact names
+        self._last_id = 0
+        self._stats = {"resolutions": 0, "confident": 0, "unresolved": 0}
+
+    def _refresh(self):
+        """Indexes payees added to the store since the last call."""
+        with self._lock:
+            for record in self.store.records(self._last_id):
+                key = compact(record.name)
+                if key and key not in self._names:
+                    self._names[key] = record
+                    for gram in trigrams(key):
+                        self._postings.setdefault(gram, set()).add(key)
+                self._last_id = max(self._last_id, record.id)
+
+    def _candidates(self, query: str) -> dict:
+        grams = trigrams(query)
+        present = sorted((g for g in grams if g in self._postings), key=lambda g: len(self._postings[g]))
+        keys = set()
+        for gram in present[:CANDIDATE_TRIGRAMS]:
+            keys.update(islice(self._postings[gram], MAX_CANDIDATES - len(keys)))
+            if len(keys) >= MAX_CANDIDATES:
+                break
+        dice = {key: 2 * len(grams & trigrams(key)) / (len(grams) + len(trigrams(key))) for key in keys}
+        best = sorted(dice, key=dice.get, reverse=True)[:RERANK]
+        return {key: edit_similarity(query, key) for key in best}
+
+    def resolve(self, text: str, k: int = 5) -> Resolution:
+        self._refresh()
+        scores, origin, exact = {}, {}, []
+        for query in query_variants(text):
+            # Variants come longest first; "bell" mustn't compete with an exact "bell canada"
+            if any(query in longer for longer in exact):
+                continue
+            if query in self._names:  # exact, ignoring spaces and punctuation
+                exact.append(query)
+                hits = {query: 1.0}
+            else:
+                hits = self._candidates(query)
+            for key, score in hits.items():
+                if score > scores.get(key, 0.0):
+                    scores[key], origin[key] = score, query
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        matches = tuple(PayeeMatch(self._names[key].name, self._names[key].account, round(score, 3)) for key, score in ranked)
+        confident = bool(matches) and matches[0].score >= self.threshold and (
+            len(matches) == 1 or matches[0].score - matches[1].score >= self.margin
+        )
+        with self._lock:
+            self._stats["resolutions"] += 1
+            self._stats["confident" if confident else "unresolved"] += 1
+        return Resolution(query=origin[ranked[0][0]] if ranked else "", matches=matches, confident=confident)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "names": len(self._names)}
@@ -0,0 +1,258 @@
+"""
+Payee repository: SQLite (WAL) for persistence, in-memory indexes for lookups.
+
+Replaces the module-level payees list, which had no dedup and was sent whole to
+the browser for client-side filtering. Here:
+
+- payees are unique by account number (adding a known account returns the existing payee)
+- by_account: account -> payee for exact lookups, plus a sorted account list for prefixes
+- a sorted list of (word-suffix of the normalized name, id) answers prefix searches
+  with bisect, so "hyd" finds "BC Hydro" in O(log n + k)
+- a trigram posting index answers fuzzy / substring searches; candidates come from
+  the query's rarest trigrams so a search costs about the same on 100 or 500k payees
+
+Every worker keeps its own indexes. Before each read, PRAGMA data_version tells
+whether another connection committed, and only rows with a higher id are loaded.
+"""
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from itertools import islice
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+MAX_CANDIDATES = 500       # results considered per search; pagination happens inside this window
+CANDIDATE_TRIGRAMS = 3     # rarest query trigrams used to gather fuzzy candidates
+FUZZY_MIN_SCORE = 0.6      # share of the query's trigrams a fuzzy match must contain
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", (name or "").lower()).split())
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True)
+class PayeeRecord:
+    id: int
+    name: str
+    account: str
+    name_norm: str
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "name": self.name, "account": self.account}
+
+
+class PayeeStore:
+    def __init__(self, path: str, clock=time.time):
+        self.clock = clock
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS payees ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, account TEXT NOT NULL UNIQUE, "
+            "name_norm TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._by_id = {}
+        self._ordered_ids = []    # insertion order, for plain listing
+        self._by_account = {}
+        self._accounts = []       # sorted (account, id)
+        self._name_keys = []      # sorted (word suffix of name_norm, id)
+        self._postings = {}       # trigram -> set of ids
+        self._last_id = 0
+        self._data_version = None
+        self._refresh()
+
+    # --- indexes ---
+
+    def _index(self, record: PayeeRecord, keep_sorted=True):
+        self._by_id[record.id] = record
+        self._ordered_ids.append(record.id)
+        self._by_account[record.account] = record
+        words = record.name_norm.split(" ")
+        for i in range(len(words)):
+            key = (" ".join(words[i:]), record.id)
+            if keep_sorted:
+                insort(self._name_keys, key)
+            else:
+                self._name_keys.append(key)
+        if keep_sorted:
+            insort(self._accounts, (record.account, record.id))
+        else:
+            self._accounts.append((record.account, record.id))
+        for gram in trigrams(record.name_norm):
+            self._postings.setdefault(gram, set()).add(record.id)
+        self._last_id = max(self._last_id, record.id)
+
+    def _refresh(self):
+        """Loads rows committed by other workers since the last look."""
+        with self._lock:
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return
+            rows = self._conn.execute(
+                "SELECT id, name, account, name_norm FROM payees WHERE id > ? ORDER BY id", (self._last_id,)
+            ).fetchall()
+            bulk = len(rows) > 64  # one sort beats many insorts on a big load
+            for row in rows:
+                self._index(PayeeRecord(*row), keep_sorted=not bulk)
+            if bulk:
+                self._name_keys.sort()
+                self._accounts.sort()
+            self._data_version = version
+
+    # --- writes ---
+
+    def add(self, name: str, account: str):
+        """Returns (payee, created). A known account isn't added twice."""
+        name, account = name.strip(), account.strip()
+        with self._lock:
+            self._refresh()
+            existing = self._by_account.get(account)
+            if existing is not None:
+                return existing, False
+            self._conn.execute("BEGIN IMMEDIATE")  # serializes writers across workers
+            try:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO payees (name, account, name_norm, created_at) VALUES (?, ?, ?, ?)",
+                    (name, account, normalize_name(name), self.clock()),
+                )
+                created = cursor.rowcount == 1  # 0 when another worker added this account first
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            # Our own commits don't move data_version, so force the incremental reload
+            self._data_version = None
+            self._refresh()
+            return self._by_account[account], created
+
+    def add_many(self, payees):
+        """Bulk load of (name, account) pairs in one transaction; known accounts are skipped."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO payees (name, account, name_norm, created_at) VALUES (?, ?, ?, ?)",
+                    [(n.strip(), a.strip(), normalize_name(n), self.clock()) for n, a in payees],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._data_version = None
+            self._refresh()
+
+    # --- reads ---
+
+    def get(self, payee_id: int) -> Optional[PayeeRecord]:
+        self._refresh()
+        return self._by_id.get(payee_id)
+
+    def get_by_account(self, account: str) -> Optional[PayeeRecord]:
+        self._refresh()
+        return self._by_account.get((account or "").strip())
+
+    def records(self, after_id: int = 0) -> list:
+        """Payees added after after_id, in id order, for matchers that keep their own index."""
+        self._refresh()
+        with self._lock:
+            start = bisect_left(self._ordered_ids, after_id + 1)
+            return [self._by_id[i] for i in self._ordered_ids[start:]]
+
+    def list(self, offset: int = 0, limit: int = 50) -> dict:
+        self._refresh()
+        with self._lock:
+            ids = self._ordered_ids[offset:offset + limit]
+            total = len(self._ordered_ids)
+            return self._page([self._by_id[i] for i in ids], total, offset, limit)
+
+    @staticmethod
+    def _prefix_ids(keys, query: str):
+        start = bisect_left(keys, (query,))
+        for key, payee_id in keys[start:start + MAX_CANDIDATES * 2]:
+            if not key.startswith(query):
+                break
+            yield payee_id
+
+    def _fuzzy_scores(self, query: str) -> dict:
+        grams = trigrams(query)
+        present = sorted((g for g in grams if g in self._postings), key=lambda g: len(self._postings[g]))
+        if not present:
+            return {}
+        candidates = set()
+        budget = MAX_CANDIDATES * 4  # a very common trigram mustn't make this scan the whole directory
+        for gram in present[:CANDIDATE_TRIGRAMS]:
+            candidates.update(islice(self._postings[gram], budget - len(candidates)))
+            if len(candidates) >= budget:
+                break
+        scores = {}
+        for payee_id in candidates:
+            shared = len(grams & trigrams(self._by_id[payee_id].name_norm))
+            score = shared / len(grams)
+            if score >= FUZZY_MIN_SCORE:
+                scores[payee_id] = score
+        return scores
+
+    def search(self, query: str, offset: int = 0, limit: int = 20) -> dict:
+        """
+        Name search: word-prefix matches first (alphabetical), then fuzzy trigram matches by score.
+        Digits also match account numbers by prefix. Results are paged within the first MAX_CANDIDATES.
+        """
+        self._refresh()
+        q = normalize_name(query)
+        if not q:
+            return self.list(offset, limit)
+        with self._lock:
+            ranked, seen = [], set()
+
+            def take(payee_id, score):
+                if payee_id not in seen and len(ranked) < MAX_CANDIDATES:
+                    seen.add(payee_id)
+                    ranked.append((self._by_id[payee_id], score))
+
+            if q.isdigit():
+                for payee_id in self._prefix_ids(self._accounts, q):
+                    take(payee_id, 1.0)
+            for payee_id in self._prefix_ids(self._name_keys, q):
+                take(payee_id, 1.0)
+            if len(q) >= 3 and len(ranked) < MAX_CANDIDATES:
+                scores = self._fuzzy_scores(q)
+                for payee_id, score in sorted(scores.items(), key=lambda item: (-item[1], self._by_id[item[0]].name_norm)):
+                    take(payee_id, score)
+
+            page = ranked[offset:offset + limit]
+            result = self._page([r for r, _ in page], len(ranked), offset, limit)
+            for payee, (_, score) in zip(result["payees"], page):
+                payee["score"] = round(score, 3)
+            result["truncated"] = len(ranked) >= MAX_CANDIDATES
+            return result
+
+    @staticmethod
+    def _page(records, total, offset, limit) -> dict:
+        next_offset = offset + limit if offset + limit < total else None
+        return {
+            "payees": [r.to_dict() for r in records],
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "next_offset": next_offset,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "payees": len(self._by_id),
+                "name_keys": len(self._name_keys),
+                "trigrams": len(self._postings),
+            }
+
+    def __len__(self):
+        self._refresh()
+        return len(self._by_id)
@@ -0,0 +1,117 @@
+"""
+Server-side conversation sessions.
+
+The bots used to post the whole chatHistory, state and substep_flags on every turn.
+With a session the server keeps the message log, intent, flags and form state,
+and the browser only sends its session id plus the new message.
+
+Two backends share one interface (get / save / delete):
+- InMemorySessionStore: per-process dict with TTL eviction
+- SQLiteSessionStore: survives restarts and is shared by workers on one host
+"""
+from dataclasses import dataclass, field, asdict
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+@dataclass
+class Session:
+    session_id: str
+    messages: list = field(default_factory=list)   # [{"role": "user", "content": "..."}]
+    intent: Optional[str] = None
+    substep_flags: dict = field(default_factory=dict)
+    state: dict = field(default_factory=dict)
+    updated_at: float = 0.0
+
+
+class InMemorySessionStore:
+    def __init__(self, ttl_seconds: float, sweep_every: int = 256, clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self.sweep_every = sweep_every
+        self.clock = clock
+        self._sessions = {}
+        self._ops = 0
+        self._lock = threading.Lock()
+
+    def _sweep(self, now):
+        expired = [sid for sid, s in self._sessions.items() if now - s.updated_at > self.ttl_seconds]
+        for sid in expired:
+            del self._sessions[sid]
+
+    def get(self, session_id) -> Optional[Session]:
+        now = self.clock()
+        with self._lock:
+            self._ops += 1
+            if self._ops % self.sweep_every == 0:
+                self._sweep(now)
+            session = self._sessions.get(session_id)
+            if session is not None and now - session.updated_at > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            return session
+
+    def save(self, session: Session):
+        session.updated_at = self.clock()
+        with self._lock:
+            self._sessions[session.session_id] = session
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    def __init__(self, path: str, ttl_seconds: float, clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def get(self, session_id) -> Optional[Session]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        data, updated_at = row
+        if self.clock() - updated_at > self.ttl_seconds:
+            self.delete(session_id)
+            return None
+        return Session(**json.loads(data))
+
+    def save(self, session: Session):
+        session.updated_at = now = self.clock()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
+                (session.session_id, json.dumps(asdict(session)), now),
+            )
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,))
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def create_session_store(backend: str, ttl_seconds: float, path: str = "sessions.sqlite3"):
+    if backend == "memory":
+        return InMemorySessionStore(ttl_seconds)
+    if backend == "sqlite":
+        return SQLiteSessionStore(path, ttl_seconds)
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,122 @@
+"""
+Single-flight deduplication of identical in-flight LLM requests.
+
+At peak, many sessions send byte-identical payloads at the same moment: the
+yes/no classifier over ["Would you like to download the statement?", "yes"],
+the recipient classification for the same options and answer. With
+SingleFlight the first such request (the leader) goes upstream and every
+identical request that arrives before it finishes (a follower) waits for the
+same completion instead of sending its own.
+
+This is not a cache: nothing is kept once the leader's call returns, so it also
+applies to prompts llm_cache never stores, and a result is only ever shared by
+requests that were in flight together. The fan-in ratio (requests per upstream
+call) says how much it saves.
+
+acall() is for the async client (followers await the leader's task; the call
+is only cancelled when every waiter has gone); call() is for the sync client
+running in the threadpool (followers block on the leader's event).
+"""
+import asyncio
+import hashlib
+import json
+import threading
+
+
+def request_key(model: str, payload: list) -> str:
+    """Hashes the exact request; unlike llm_cache.cache_key nothing is normalized."""
+    encoded = json.dumps([model, payload], separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}     # key -> _Call (sync)
+        self._flights = {}   # key -> _Flight (async, event loop only)
+        self._stats = {}     # kind -> {"requests": n, "upstream": n}
+
+    def _count(self, kind: str, leader: bool):
+        with self._lock:
+            counts = self._stats.setdefault(kind, {"requests": 0, "upstream": 0})
+            counts["requests"] += 1
+            counts["upstream"] += leader
+
+    def call(self, key: str, fn, kind: str = "generation"):
+        """Returns (fn(), shared): runs fn unless an identical call is in flight, then waits for that one."""
+        with self._lock:
+            pending = self._calls.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._calls[key] = _Call()
+        self._count(kind, leader)
+        if not leader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.result, True
+        try:
+            pending.result = fn()
+            return pending.result, False
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            pending.done.set()
+
+    async def acall(self, key: str, coro_fn, kind: str = "generation"):
+        """Async call(): coro_fn() runs as a task shared by every identical request that arrives while it runs."""
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(coro_fn()))
+            flight.task.add_done_callback(lambda _, key=key, flight=flight: self._land(key, flight))
+        self._count(kind, leader)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), not leader
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                # Nobody else is waiting for it; a request arriving from now on starts its own
+                flight.task.cancel()
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _land(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            flight.task.exception()  # retrieved here, so an error nobody awaited isn't logged as unhandled
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_kind = {kind: {**c, "fan_in": round(c["requests"] / c["upstream"], 3) if c["upstream"] else None}
+                       for kind, c in self._stats.items()}
+        requests = sum(c["requests"] for c in by_kind.values())
+        upstream = sum(c["upstream"] for c in by_kind.values())
+        return {
+            "requests": requests,
+            "upstream": upstream,
+            "shared": requests - upstream,
+            "fan_in": round(requests / upstream, 3) if upstream else None,
+            "in_flight": len(self._flights) + len(self._calls),
+            "by_kind": by_kind,
+        }
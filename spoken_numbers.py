@@ -0,0 +1,186 @@
+"""
+Deterministic parsing of spoken amounts and account numbers for fill_handler.
+
+Every amount and the payee's 11-digit account number used to go to FILL_PROMPT,
+then through extract_number and a regex that joins spaced digits. What users
+say and speech-to-text produces is regular enough to parse directly:
+
+- parse_amount: "$1,200.50", "a hundred and five", "one hundred fifty dollars
+  and twenty cents", "two point five", "fifty cents"
+- parse_digits: "7373 8374 622", "seven three seven three eight...",
+  "double five", "oh" for zero, "seventy three" and "seventy 3", digits and words mixed
+
+Both return None rather than guess: two different amounts ("not fifty,
+sixty"), run-together forms like "twelve fifty", fractions ("two and a half",
+"fifty and change"), negative amounts ("minus 50", "-50"), ordinals, a digit count
+other than the one required, or "double seventy three" (773 or 7373?).
+fill_handler then asks the LLM as before.
+"""
+from decimal import Decimal, InvalidOperation
+import re
+from typing import Optional
+
+UNITS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+    "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16,
+    "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+TENS = {"twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90}
+SCALES = {"thousand": 1000, "million": 1000000}
+DIGIT_WORDS = {**{word: str(value) for word, value in UNITS.items() if value < 10}, "oh": "0", "o": "0", "nought": "0"}
+REPEATS = {"double": 2, "triple": 3}
+DOLLAR_WORDS = {"dollar", "dollars", "buck", "bucks"}
+CENT_WORDS = {"cent", "cents"}
+# Number-ish words _phrases can't add up: an amount that has one isn't guessed
+FRACTION_WORDS = {"half", "halves", "quarter", "quarters", "third", "thirds", "change"}
+NEGATIVE_WORDS = {"minus", "negative"}
+NEGATIVE_SIGN = re.compile(r"(?<![\w.])-\s*\$?\s*\d")  # "-50", "-$50", "$-50", not "7373-8374"
+TOKEN = re.compile(r"\d+(?:\.\d+)?[a-z]*|[a-z]+")
+
+
+def tokens(text: str) -> list:
+    text = (text or "").lower().replace("$", " ")
+    text = re.sub(r"(?<=\d),(?=\d{3})", "", text)  # 1,200 -> 1200
+    return TOKEN.findall(text)
+
+
+def _phrases(words):
+    """
+    Groups the number words of a message into phrases: [(value, unit)], unit "dollars", "cents" or None.
+    Raises ValueError on anything that isn't a plain cardinal ("twelve fifty", "5th", "one two", "and a half", "minus").
+    """
+    phrases = []
+    total, current, last, decimals, seen = Decimal(0), Decimal(0), None, None, False
+
+    def close(unit=None):
+        nonlocal total, current, last, decimals, seen
+        if seen:
+            value = total + current
+            if decimals is not None:
+                if not decimals:
+                    raise ValueError("'point' without digits")
+                value += Decimal("0." + decimals)
+            phrases.append((value, unit))
+        elif unit and phrases and phrases[-1][1] is None:
+            phrases[-1] = (phrases[-1][0], unit)  # "fifty Canadian dollars"
+        total, current, last, decimals, seen = Decimal(0), Decimal(0), None, None, False
+
+    for i, word in enumerate(words):
+        following = words[i + 1] if i + 1 < len(words) else ""
+        if word[0].isdigit():
+            if not re.fullmatch(r"\d+(?:\.\d+)?", word):
+                raise ValueError(f"not a cardinal: {word}")
+            if decimals is not None:
+                decimals += word.replace(".", "")
+            elif last is not None:
+                raise ValueError("two numbers in a row")
+            else:
+                current, last = Decimal(word), "digits"
+            seen = True
+        elif decimals is not None and word in DIGIT_WORDS:
+            decimals += DIGIT_WORDS[word]
+        elif word in UNITS:
+            if last in ("unit", "digits") or (last == "tens" and UNITS[word] >= 10):
+                raise ValueError("two numbers in a row")
+            current += UNITS[word]
+            last, seen = "unit", True
+        elif word in TENS:
+            if last in ("unit", "tens", "digits"):
+                raise ValueError("two numbers in a row")
+            current += TENS[word]
+            last, seen = "tens", True
+        elif word == "hundred":
+            if last == "hundred":
+                raise ValueError("hundred hundred")
+            current = (current or 1) * 100
+            last, seen = "hundred", True
+        elif word in SCALES:
+            total += (current or 1) * SCALES[word]
+            current, last, seen = Decimal(0), None, True
+        elif word in ("a", "an") and following in ("hundred", *SCALES) and not seen:
+            continue
+        elif word == "and" and seen and (following in UNITS or following in TENS):
+            last = None if last == "hundred" or total else last  # "a hundred and five", "two thousand and ten"
+        elif word == "point" and seen and decimals is None:
+            decimals = ""
+        elif word in DOLLAR_WORDS:
+            close("dollars")
+        elif word in CENT_WORDS:
+            close("cents")
+        elif word in FRACTION_WORDS or word in NEGATIVE_WORDS:
+            raise ValueError(f"can't add up: {word}")
+        else:
+            close()
+    close()
+    return phrases
+
+
+def parse_amount(text: str) -> Optional[str]:
+    """A positive amount with at most two decimals, as digits ("105", "150.20"), or None when unsure."""
+    if NEGATIVE_SIGN.search(text or ""):
+        return None
+    words = tokens(text)
+    try:
+        phrases = _phrases(words)
+    except (ValueError, InvalidOperation):
+        return None
+    if len(phrases) == 1:
+        value, unit = phrases[0]
+        if unit == "cents":
+            value /= 100
+        elif unit is None and words.count("one") == 1 and value == 1 and not any(w[0].isdigit() for w in words):
+            return None  # "this one", "no one"
+    elif len(phrases) == 2 and phrases[0][1] in ("dollars", None) and phrases[1][0] < 100 and (
+            phrases[1][1] == "cents" or (phrases[0][1] == "dollars" and phrases[1][1] is None)):
+        value = phrases[0][0] + phrases[1][0] / 100  # "150 dollars and 20 cents", "150 dollars 20"
+    else:
+        return None
+    if value <= 0 or value != value.quantize(Decimal("0.01")):
+        return None
+    if value == value.to_integral_value():
+        return str(int(value))
+    return f"{value:.2f}"
+
+
+def _unit_digit(word: str) -> Optional[str]:
+    """"3" or "three" (not zero): the second digit of a pair after a tens word."""
+    digit = word if len(word) == 1 and word.isdigit() else DIGIT_WORDS.get(word)
+    return digit if digit and digit != "0" else None
+
+
+def parse_digits(text: str, length: Optional[int] = None) -> Optional[str]:
+    """
+    The digits of a spoken or typed number string (account, card, phone), or None when there are
+    none, when "hundred"/"thousand" or a repeated tens word ("double seventy three") make it
+    ambiguous, or when there aren't exactly length of them. "seventy three" and "seventy 3" are 73.
+    """
+    words = tokens(text)
+    digits, repeat = [], 1
+    for i, word in enumerate(words):
+        following = words[i + 1] if i + 1 < len(words) else ""
+        if word[0].isdigit():
+            if not word.isdigit():
+                return None  # "5th", "2.5"
+            digits.append(word[0] * repeat + word[1:])
+        elif word in DIGIT_WORDS and (word != "o" or digits or following in DIGIT_WORDS):
+            digits.append(DIGIT_WORDS[word] * repeat)
+        elif word in UNITS:  # ten to nineteen
+            digits.append(str(UNITS[word]) * repeat)
+        elif word in TENS:
+            if repeat != 1:
+                return None
+            if _unit_digit(following):
+                continue  # "seventy three" is one digit pair, written with the "three"
+            digits.append(str(TENS[word]))
+        elif word in REPEATS:
+            repeat = REPEATS[word]
+            continue
+        elif word == "hundred" or word in SCALES:
+            return None
+        if i and words[i - 1] in TENS and _unit_digit(word):
+            digits[-1] = str(TENS[words[i - 1]] // 10) + digits[-1]
+        repeat = 1
+    result = "".join(digits)
+    if not result or (length is not None and len(result) != length):
+        return None
+    return result
@@ -0,0 +1,188 @@
+"""
+Account activity and statements from a SQLite transaction store.
+
+The activity pages used to embed static rows and download_statement.js turned the
+DOM table into a CSV in the browser. Transactions now live in SQLite, indexed by
+(account, posted date, id), and everything reads them in keyset order (newest first):
+
+- page(): one page of a date range plus an opaque cursor for the next one, so page
+  N costs the same as page 1 (no OFFSET scans)
+- iter_transactions(): walks a date range chunk by chunk with the same cursor
+- statement_csv(): a generator of CSV text blocks over iter_transactions(), for a
+  streaming response; a multi-year statement never sits in memory whole
+
+Amounts are stored in cents; money out is negative. Each row keeps the account's
+running balance after it.
+"""
+from dataclasses import dataclass
+from datetime import date
+import csv
+import io
+import sqlite3
+import threading
+from typing import Iterable, Iterator, Optional
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+EXPORT_CHUNK_ROWS = 1000
+CSV_HEADER = ("Date", "Description", "Money out", "Money in", "Balance")
+
+
+def to_cents(amount) -> int:
+    return int(round(float(amount) * 100))
+
+
+@dataclass(frozen=True)
+class AccountTransaction:
+    id: int
+    account: str
+    posted: date
+    description: str
+    amount_cents: int
+    balance_cents: int
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "date": self.posted.isoformat(),
+            "description": self.description,
+            "amount": self.amount_cents / 100,
+            "balance": self.balance_cents / 100,
+        }
+
+
+def encode_cursor(txn: AccountTransaction) -> str:
+    return f"{txn.posted.isoformat()}:{txn.id}"
+
+
+def decode_cursor(cursor: str):
+    """(posted ISO date, id) from encode_cursor's format; ValueError if malformed."""
+    posted, _, txn_id = cursor.partition(":")
+    return date.fromisoformat(posted).isoformat(), int(txn_id)
+
+
+class TransactionStore:
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS account_transactions ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, account TEXT NOT NULL, posted TEXT NOT NULL, "
+            "description TEXT NOT NULL, amount_cents INTEGER NOT NULL, balance_cents INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS account_transactions_by_date ON account_transactions (account, posted, id)"
+        )
+
+    # --- writes ---
+
+    def append(self, account: str, transactions: Iterable, opening_balance: Optional[float] = None) -> int:
+        """
+        Appends (posted date, description, amount) in chronological order, keeping the running balance.
+        The balance continues from the account's latest row (or opening_balance for a new account).
+        Rows are streamed into one transaction, so a long history doesn't have to be a list first.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")  # the running balance must not interleave with another writer
+            try:
+                row = self._conn.execute(
+                    "SELECT balance_cents FROM account_transactions WHERE account = ? ORDER BY posted DESC, id DESC LIMIT 1",
+                    (account,),
+                ).fetchone()
+                balance = row[0] if row else to_cents(opening_balance or 0)
+
+                def rows():
+                    nonlocal balance
+                    for posted, description, amount in transactions:
+                        cents = to_cents(amount)
+                        balance += cents
+                        yield account, posted.isoformat(), description, cents, balance
+
+                cursor = self._conn.executemany(
+                    "INSERT INTO account_transactions (account, posted, description, amount_cents, balance_cents) "
+                    "VALUES (?, ?, ?, ?, ?)", rows(),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return cursor.rowcount
+
+    # --- reads ---
+
+    def _chunk(self, account, start, end, after, limit):
+        clauses, params = ["account = ?"], [account]
+        if start is not None:
+            clauses.append("posted >= ?")
+            params.append(start.isoformat())
+        if end is not None:
+            clauses.append("posted <= ?")
+            params.append(end.isoformat())
+        if after is not None:
+            clauses.append("(posted, id) < (?, ?)")  # a row value, so the index seeks straight to the cursor
+            params += [after[0], after[1]]
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, account, posted, description, amount_cents, balance_cents FROM account_transactions "
+                f"WHERE {' AND '.join(clauses)} ORDER BY posted DESC, id DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        return [AccountTransaction(r[0], r[1], date.fromisoformat(r[2]), r[3], r[4], r[5]) for r in rows]
+
+    def page(self, account: str, start: Optional[date] = None, end: Optional[date] = None,
+             cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+        """Newest-first page of [start, end] (inclusive dates); pass next_cursor back for the following page."""
+        limit = min(max(limit, 1), MAX_PAGE_SIZE)
+        rows = self._chunk(account, start, end, decode_cursor(cursor) if cursor else None, limit + 1)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "account": account,
+            "transactions": [t.to_dict() for t in rows],
+            "next_cursor": encode_cursor(rows[-1]) if more else None,
+        }
+
+    def iter_transactions(self, account: str, start: Optional[date] = None, end: Optional[date] = None,
+                          chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[AccountTransaction]:
+        after = None
+        while True:
+            rows = self._chunk(account, start, end, after, chunk_rows)
+            yield from rows
+            if len(rows) < chunk_rows:
+                return
+            after = (rows[-1].posted.isoformat(), rows[-1].id)
+
+    def balance(self, account: str) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT balance_cents FROM account_transactions WHERE account = ? ORDER BY posted DESC, id DESC LIMIT 1",
+                (account,),
+            ).fetchone()
+        return row[0] / 100 if row else None
+
+    def count(self, account: Optional[str] = None) -> int:
+        with self._lock:
+            if account is None:
+                return self._conn.execute("SELECT COUNT(*) FROM account_transactions").fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM account_transactions WHERE account = ?", (account,)
+            ).fetchone()[0]
+
+
+def statement_csv(transactions: Iterable[AccountTransaction], block_rows: int = 500) -> Iterator[str]:
+    """CSV text in blocks of block_rows lines, header first, for a streaming response."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    rows = 0
+    for t in transactions:
+        out = f"{-t.amount_cents / 100:.2f}" if t.amount_cents < 0 else ""
+        money_in = f"{t.amount_cents / 100:.2f}" if t.amount_cents > 0 else ""
+        writer.writerow((t.posted.isoformat(), t.description, out, money_in, f"{t.balance_cents / 100:.2f}"))
+        rows += 1
+        if rows % block_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
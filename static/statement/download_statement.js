@@ -1,15 +1,9 @@
-function downloadStatement(tableId, filename) {
-  const table = document.getElementById(tableId);
-  const rows = Array.from(table.querySelectorAll("tr"));
+// Activity rows come from the server a page at a time, and the statement is a
+// streamed CSV the browser saves as it arrives (nothing is built in page memory).
 
-  const csv = rows.map(row => {
-    const cells = Array.from(row.querySelectorAll("th, td"));
-    return cells.map(cell => '"' + cell.innerText.replace(/"/g, '""') + '"').join(",");
-  }).join("\n");
-
-  const blob = new Blob([csv], { type: "text/csv;charset=utf-8;" });
+function downloadStatement(account, filename) {
   const link = document.createElement("a");
-  link.href = URL.createObjectURL(blob);
+  link.href = `/api/accounts/${encodeURIComponent(account)}/statement.csv`;
   link.download = filename;
   link.style.display = "none";
   document.body.appendChild(link);
@@ -17,4 +11,57 @@ function downloadStatement(tableId, filename) {
   document.body.removeChild(link);
 }
 
+function formatMoney(value) {
+  return "$" + Math.abs(value).toLocaleString("en-US", { minimumFractionDigits: 2, maximumFractionDigits: 2 });
+}
 
+function formatDate(iso) {
+  // "2025-08-08" -> "August 08, 2025"; parsed as local time so the day doesn't shift
+  return new Date(iso + "T00:00:00").toLocaleDateString("en-US", { month: "long", day: "2-digit", year: "numeric" });
+}
+
+function activityRow(t) {
+  const row = document.createElement("tr");
+  const cells = [
+    [formatDate(t.date), ""],
+    [t.description, ""],
+    [t.amount < 0 ? "- " + formatMoney(t.amount) : "", t.amount < 0 ? "neg" : ""],
+    [t.amount > 0 ? "+ " + formatMoney(t.amount) : "", t.amount > 0 ? "pos" : ""],
+    [formatMoney(t.balance), ""],
+  ];
+  for (const [text, className] of cells) {
+    const cell = document.createElement("td");
+    cell.textContent = text;
+    if (className) cell.className = className;
+    row.appendChild(cell);
+  }
+  return row;
+}
+
+// Renders the first page into the table's tbody; "Show more" (moreId) appends the next pages.
+function loadActivity(account, tableId, moreId) {
+  const tbody = document.querySelector(`#${tableId} tbody`);
+  const moreEl = document.getElementById(moreId);
+  let nextCursor = null;
+
+  async function loadPage(cursor) {
+    const params = new URLSearchParams({ limit: 50 });
+    if (cursor) params.set("cursor", cursor);
+    try {
+      const res = await fetch(`/api/accounts/${encodeURIComponent(account)}/transactions?${params.toString()}`);
+      const data = await res.json();
+      if (!res.ok) throw new Error(data.reason || res.statusText);
+      if (!cursor) tbody.replaceChildren();
+      data.transactions.forEach(t => tbody.appendChild(activityRow(t)));
+      nextCursor = data.next_cursor;
+      moreEl.style.display = nextCursor ? "" : "none";
+    } catch (err) {
+      console.error("Failed to load account activity:", err);
+    }
+  }
+
+  moreEl.addEventListener("click", () => {
+    if (nextCursor) loadPage(nextCursor);
+  });
+  loadPage(null);
+}
@@ -8,6 +8,11 @@ const waitToTakeAction = 5000;
 const welcomeMessage = "Hi! I'm Sam. Tell me what you want to do, for example, e-transfer, and I'll take care of it.";
 let currentPage = window.parent.location.pathname.split("/").pop();
 let lastHighlightedSelector = null;
+const streamResponses = true;  // Use /tellerbot/stream so instructions and highlights show before the LLM finishes
+const useServerSession = true;  // The server keeps the conversation; we only send the session id and the new message
+const sessionId = sessionStorage.getItem("sessionId") || (crypto.randomUUID ? crypto.randomUUID() : Date.now() + "-" + Math.random().toString(16).slice(2));
+sessionStorage.setItem("sessionId", sessionId);
+let pendingLogs = JSON.parse(sessionStorage.getItem("pendingLogs") || "[]");  // user actions not yet sent to the server
 
 // This function sets the chat UI to be collapsed or expanded based on the isCollapsed parameter. (for the ease of voice control)
 function setChatCollapsed(isCollapsed) {
@@ -181,6 +186,7 @@ function appendMessage(role, text, suppressTTS = false) {
       }
       speak(text);
     }
+    return div;
 }
 
 // Highlight the element in the parent window
@@ -212,6 +218,13 @@ function logUserAction(text) {
     appendMessage("user", text);
     chatHistory.push({ role: "user", content: text });
     sessionStorage.setItem("chatHistory", JSON.stringify(chatHistory));
+    pendingLogs.push(text);
+    sessionStorage.setItem("pendingLogs", JSON.stringify(pendingLogs));
+}
+
+function clearPendingLogs() {
+    pendingLogs = [];
+    sessionStorage.setItem("pendingLogs", "[]");
 }
 
 // Update substep flags for the "Transfer Someone" page
@@ -272,25 +285,26 @@ function updateSubstepFlagsForAddPayeeForm() {
 
 
 // OPTION1: TTS function using server-side API
-// async function speak(text) {
-//   try {
-//     const response = await fetch("/speak", {
-//       method: "POST",
-//       headers: {
-//         "Content-Type": "application/json"
-//       },
-//       body: JSON.stringify({ text })
-//     });
-
-//     const result = await response.json();
-//     if (result.status === "success") {
-//       console.log("Speech played:", result.text);
-//     } else {
-//       console.error("TTS Error:", result.reason);
+// The server synthesizes (or reads from its audio cache) and streams the audio; the <audio> element starts playing as bytes arrive
+// let currentAudio = null;
+// function speak(text) {
+//   if (currentAudio) currentAudio.pause();
+//   const audio = new Audio("/speak?text=" + encodeURIComponent(text));
+//   audio.playbackRate = speech_rate;
+//   audio.onplay = function () {
+//     isSpeaking = true;
+//     if (listening && recognition) {
+//       recognition.abort();  // ⛔️ stop immediately
+//     }
+//   };
+//   audio.onended = audio.onerror = function () {
+//     isSpeaking = false;
+//     if (listening && recognition) {
+//       setTimeout(() => recognition.start(), 800);  // ✅ add delay
 //     }
-//   } catch (error) {
-//     console.error("Failed to fetch /speak:", error);
-//   }
+//   };
+//   currentAudio = audio;
+//   audio.play().catch((error) => console.error("Failed to play /speak audio:", error));
 // }
 
 // OPTION2: TTS function using Web Speech API
@@ -343,6 +357,7 @@ async function sendMessage(newPageLoaded = false, overrideTranscript = null) {
     if (!message && !newPageLoaded) return; // Don't send empty messages unless the page just loaded.
 
     substep_flags = JSON.parse(sessionStorage.getItem("substep_flags") || "{}");
+    const formFlagsFromPage = ["send_to_alex.html", "payee.html", "add_payee.html"].includes(currentPage);
     console.log("substep_flags:", substep_flags); 
 
     // This is used to track the user's progress in the transfer process.
@@ -365,10 +380,17 @@ async function sendMessage(newPageLoaded = false, overrideTranscript = null) {
     console.log("sending messages to backend:", chatHistory);
     console.log("substep_flags:", substep_flags)
     console.log("newPageLoaded:", newPageLoaded);
-    const res = await fetch("/tellerbot", {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({
+    const payload = useServerSession ? {
+        session_id: sessionId,
+        message: newPageLoaded ? null : message,
+        logs: pendingLogs,
+        newPageLoaded,
+        intent,
+        currentPage,
+        state,
+        ...(formFlagsFromPage ? { substep_flags } : {}),  // Other pages use the flags the server already has
+        assistant: "frank"    // FRANK UNIQUE PARAMETER: specify the assistant name
+    } : {
         messages: chatHistory,
         newPageLoaded,
         intent,
@@ -376,18 +398,104 @@ async function sendMessage(newPageLoaded = false, overrideTranscript = null) {
         state,
         substep_flags,  // ✅ Send subtask progress
         assistant: "frank"    // FRANK UNIQUE PARAMETER: specify the assistant name
-    })
+    };
+    clearPendingLogs();
+
+    if (streamResponses) {
+      await sendStreamingTurn("/tellerbot/stream", payload);
+      return;
+    }
+
+    const res = await fetch("/tellerbot", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(payload)
     });
 
     const data = await res.json();
+    handleBotResponse(data);
+  }
+
+// Reads the NDJSON stream from the backend: the substep instruction and highlights arrive first ("prelude"),
+// then LLM text as it is generated ("token"), then the usual response ("final").
+async function sendStreamingTurn(url, payload) {
+    const res = await fetch(url, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(payload)
+    });
+
+    // What was already rendered, so the final response doesn't show it twice
+    const shown = { preludeReceived: false, preludeReply: null, streamBubble: null, streamedText: "" };
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = "";
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffered += decoder.decode(value, { stream: true });
+      const lines = buffered.split("\n");
+      buffered = lines.pop();
+
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const event = JSON.parse(line);
+
+        if (event.event === "prelude") {
+          shown.preludeReceived = true;
+          dehighlightAll();
+          if (event.immediate_reply) {
+            appendMessage("assistant", event.immediate_reply);
+            chatHistory.push({ role: "assistant", content: event.immediate_reply });
+            sessionStorage.setItem("chatHistory", JSON.stringify(chatHistory));
+            shown.preludeReply = event.immediate_reply;
+          }
+          (event.action || []).forEach((act) => {
+            highlight(act.selector);
+            lastHighlightedSelector = act.selector;
+          });
+        } else if (event.event === "token") {
+          if (!shown.streamBubble) {
+            shown.streamBubble = appendMessage("assistant", "", true);
+          }
+          shown.streamedText += event.text;
+          shown.streamBubble.innerText = shown.streamedText;
+          document.getElementById("messages").scrollTop = document.getElementById("messages").scrollHeight;
+        } else if (event.event === "final") {
+          handleBotResponse(event.data, shown);
+        } else if (event.event === "error") {
+          appendMessage("assistant", event.message);
+        }
+      }
+    }
+}
+
+// Renders a bot response. `shown` describes what a streamed turn already put on screen.
+function handleBotResponse(data, shown = {}) {
     console.log("data from backend", data)
 
+    // A newer page-load/field-change turn replaced this one on the server; its response is what counts
+    if (data.superseded) {
+      shown.streamBubble?.remove();
+      return;
+    }
+
     intent = data.intent || intent ; // Use the intent from the response or keep the current one
     botMessage = data.botMessage || "";
-    
-    appendMessage("assistant", botMessage);
-    chatHistory.push({ role: "assistant", content: botMessage });
-    sessionStorage.setItem("chatHistory", JSON.stringify(chatHistory));
+
+    if (shown.preludeReply && botMessage === shown.preludeReply) {
+      // Already shown by the prelude
+    } else if (shown.streamBubble) {
+      shown.streamBubble.innerText = botMessage;
+      if (listening) speak(botMessage);
+      chatHistory.push({ role: "assistant", content: botMessage });
+      sessionStorage.setItem("chatHistory", JSON.stringify(chatHistory));
+    } else {
+      appendMessage("assistant", botMessage);
+      chatHistory.push({ role: "assistant", content: botMessage });
+      sessionStorage.setItem("chatHistory", JSON.stringify(chatHistory));
+    }
     
     if (intent && intent !== "unknown") {
     sessionStorage.setItem("intent", intent);
@@ -405,8 +513,10 @@ async function sendMessage(newPageLoaded = false, overrideTranscript = null) {
 
     // This checks if the backend returned actions (like "fill", "click", or "select")
     // and sends them to the main page after a short delay.
-    // Dehighlight anything from the last step
-    dehighlightAll();
+    // Dehighlight anything from the last step, unless the prelude just set this step's highlights
+    if (!shown.preludeReceived) {
+      dehighlightAll();
+    }
     
     if (Array.isArray(data.action)) {
       data.action.forEach((act) => {
@@ -7,6 +7,11 @@ let speech_rate = 1;
 const waitToTakeAction = 5000;
 const welcomeMessage = "Hi! I'm Alex. Tell me what you want to do, for example, e-transfer, and I'll walk you through.";
 const currentPage = window.parent.location.pathname.split("/").pop();
+const streamResponses = true;  // Use /tutorbot/stream so instructions and highlights show before the LLM finishes
+const useServerSession = true;  // The server keeps the conversation; we only send the session id and the new message
+const sessionId = sessionStorage.getItem("sessionId") || (crypto.randomUUID ? crypto.randomUUID() : Date.now() + "-" + Math.random().toString(16).slice(2));
+sessionStorage.setItem("sessionId", sessionId);
+let pendingLogs = JSON.parse(sessionStorage.getItem("pendingLogs") || "[]");  // user actions not yet sent to the server
 
 // This function sets the chat UI to be collapsed or expanded based on the isCollapsed parameter. (for the ease of voice control)
 function setChatCollapsed(isCollapsed) {
@@ -172,6 +177,7 @@ function appendMessage(role, text, suppressTTS = false) {
 
     speak(text);
     }
+    return div;
 }
 
 // Highlight the element in the parent window
@@ -203,6 +209,13 @@ function logUserAction(text) {
     appendMessage("user", text);
     chatHistory.push({ role: "user", content: text });
     sessionStorage.setItem("chatHistory", JSON.stringify(chatHistory));
+    pendingLogs.push(text);
+    sessionStorage.setItem("pendingLogs", JSON.stringify(pendingLogs));
+}
+
+function clearPendingLogs() {
+    pendingLogs = [];
+    sessionStorage.setItem("pendingLogs", "[]");
 }
 
 // Update substep flags for the "Transfer Someone" page
@@ -257,25 +270,26 @@ function updateSubstepFlagsForAddPayeeForm() {
 
 
 // OPTION1: TTS function using server-side API
-// async function speak(text) {
-//   try {
-//     const response = await fetch("/speak", {
-//       method: "POST",
-//       headers: {
-//         "Content-Type": "application/json"
-//       },
-//       body: JSON.stringify({ text })
-//     });
-
-//     const result = await response.json();
-//     if (result.status === "success") {
-//       console.log("Speech played:", result.text);
-//     } else {
-//       console.error("TTS Error:", result.reason);
+// The server synthesizes (or reads from its audio cache) and streams the audio; the <audio> element starts playing as bytes arrive
+// let currentAudio = null;
+// function speak(text) {
+//   if (currentAudio) currentAudio.pause();
+//   const audio = new Audio("/speak?text=" + encodeURIComponent(text));
+//   audio.playbackRate = speech_rate;
+//   audio.onplay = function () {
+//     isSpeaking = true;
+//     if (listening && recognition) {
+//       recognition.abort();  // ⛔️ stop immediately
+//     }
+//   };
+//   audio.onended = audio.onerror = function () {
+//     isSpeaking = false;
+//     if (listening && recognition) {
+//       setTimeout(() => recognition.start(), 800);  // ✅ add delay
 //     }
-//   } catch (error) {
-//     console.error("Failed to fetch /speak:", error);
-//   }
+//   };
+//   currentAudio = audio;
+//   audio.play().catch((error) => console.error("Failed to play /speak audio:", error));
 // }
 
 // OPTION2: TTS function using Web Speech API
@@ -329,6 +343,7 @@ async function sendMessage(newPageLoaded = false, overrideTranscript = null) {
     if (!message && !newPageLoaded) return; // Don't send empty messages unless the page just loaded.
     
     substep_flags = JSON.parse(sessionStorage.getItem("substep_flags") || "{}");
+    const formFlagsFromPage = ["send_to_alex.html", "payee.html", "add_payee.html"].includes(currentPage);
     console.log("substep_flags:", substep_flags); 
 
     // This is used to track the user's progress in the transfer process.
@@ -348,28 +363,117 @@ async function sendMessage(newPageLoaded = false, overrideTranscript = null) {
     input.value = "";
 
     console.log("sending messages to backend:", chatHistory);
-    const res = await fetch("/tutorbot", {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({
+    const payload = useServerSession ? {
+        session_id: sessionId,
+        message: newPageLoaded ? null : message,
+        logs: pendingLogs,
+        newPageLoaded,
+        intent,
+        currentPage,
+        ...(formFlagsFromPage ? { substep_flags } : {}),  // Other pages use the flags the server already has
+        assistant: "grace",  // Always use Grace for this chatbot
+    } : {
         messages: chatHistory,
         newPageLoaded,
         intent,
         currentPage,
         substep_flags,  // ✅ Send subtask progress
         assistant: "grace",  // Always use Grace for this chatbot
-    })
+    };
+    clearPendingLogs();
+
+    if (streamResponses) {
+    await sendStreamingTurn("/tutorbot/stream", payload);
+    return;
+    }
+
+    const res = await fetch("/tutorbot", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(payload)
     });
 
     const data = await res.json();
+    handleBotResponse(data);
+}
+
+// Reads the NDJSON stream from the backend: the substep instruction and highlights arrive first ("prelude"),
+// then LLM text as it is generated ("token"), then the usual response ("final").
+async function sendStreamingTurn(url, payload) {
+    const res = await fetch(url, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(payload)
+    });
+
+    // What was already rendered, so the final response doesn't show it twice
+    const shown = { preludeReceived: false, preludeReply: null, streamBubble: null, streamedText: "" };
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = "";
+
+    while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffered += decoder.decode(value, { stream: true });
+    const lines = buffered.split("\n");
+    buffered = lines.pop();
+
+    for (const line of lines) {
+        if (!line.trim()) continue;
+        const event = JSON.parse(line);
+
+        if (event.event === "prelude") {
+        shown.preludeReceived = true;
+        dehighlightAll();
+        if (event.immediate_reply) {
+            appendMessage("assistant", event.immediate_reply);
+            chatHistory.push({ role: "assistant", content: event.immediate_reply });
+            sessionStorage.setItem("chatHistory", JSON.stringify(chatHistory));
+            shown.preludeReply = event.immediate_reply;
+        }
+        (event.action || []).forEach(act => highlight(act.selector));
+        } else if (event.event === "token") {
+        if (!shown.streamBubble) {
+            shown.streamBubble = appendMessage("assistant", "", true);
+        }
+        shown.streamedText += event.text;
+        shown.streamBubble.innerText = shown.streamedText;
+        document.getElementById("messages").scrollTop = document.getElementById("messages").scrollHeight;
+        } else if (event.event === "final") {
+        handleBotResponse(event.data, shown);
+        } else if (event.event === "error") {
+        appendMessage("assistant", event.message);
+        }
+    }
+    }
+}
+
+// Renders a bot response. `shown` describes what a streamed turn already put on screen.
+function handleBotResponse(data, shown = {}) {
     console.log("data from backend", data)
 
+    // A newer page-load/field-change turn replaced this one on the server; its response is what counts
+    if (data.superseded) {
+      shown.streamBubble?.remove();
+      return;
+    }
+
     intent = data.intent
     botMessage = data.botMessage || "";
-    
+
+    if (shown.preludeReply && botMessage === shown.preludeReply) {
+    // Already shown by the prelude
+    } else if (shown.streamBubble) {
+    shown.streamBubble.innerText = botMessage;
+    if (listening) speak(botMessage);
+    chatHistory.push({ role: "assistant", content: botMessage });
+    sessionStorage.setItem("chatHistory", JSON.stringify(chatHistory));
+    } else {
     appendMessage("assistant", botMessage);
     chatHistory.push({ role: "assistant", content: botMessage });
     sessionStorage.setItem("chatHistory", JSON.stringify(chatHistory));
+    }
 
     if (intent && intent !== "unknown") {
     sessionStorage.setItem("intent", intent);
@@ -382,8 +486,10 @@ async function sendMessage(newPageLoaded = false, overrideTranscript = null) {
 
     // This checks if the backend returned actions (like "fill", "click", or "select")
     // and sends them to the main page after a short delay.
-    // Dehighlight anything from the last step
+    // Dehighlight anything from the last step, unless the prelude just set this step's highlights
+    if (!shown.preludeReceived) {
     dehighlightAll();
+    }
     if (Array.isArray(data.action)) {
     data.action.forEach(act => {
         if (act.selector && act.action) {
@@ -0,0 +1,174 @@
+"""
+Leveled, non-blocking, sampled and redacted logging.
+
+The handlers used to print() on the request path: every LLM reply, label lists,
+whole response dicts, customer messages. setup_logging() replaces that with:
+
+- the standard logging module, one logger per category (bankbot.llm, bankbot.flow,
+  bankbot.turn, ...), LOG_LEVEL for their threshold
+- a QueueHandler on the root logger: the request thread only builds the record and
+  enqueues it; a QueueListener thread formats and writes it
+- per-category sampling ({"bankbot.llm": 0.1} keeps one DEBUG/INFO record in ten);
+  warnings and errors are always kept. Dropped records never reach the queue.
+- PII redaction of amounts, account/card/phone numbers and emails, applied by the
+  listener's formatter, so it stays off the request path. A bare "250" or a 5-digit
+  transit number can't be told from any other number, so fill values, user
+  messages and fill replies are never logged as such: call sites log lengths and outcomes
+- text or JSON lines; both carry the current trace id when a span is open (tracing.py)
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+from typing import Optional
+
+from tracing import current_span
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s%(trace)s: %(message)s"
+
+NUMBER = r"\d[\d,]*(?:\.\d+)?"
+
+# (pattern, replacement), applied in order to the formatted message
+REDACTIONS = [
+    (re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"), "[EMAIL]"),
+    # Seven or more digits, optionally grouped by spaces or dashes (account, card and phone numbers), but not ISO dates
+    (re.compile(r"(?<!\d)(?!\d{4}-\d{2}-\d{2}(?!\d))\d(?:[ -]?\d){6,}(?!\d)"), "[ACCOUNT]"),
+    (re.compile(rf"[$€£]\s?{NUMBER}"), "[AMOUNT]"),
+    (re.compile(rf"\b{NUMBER}\s?(?:dollars?|bucks|cad|usd)\b", re.IGNORECASE), "[AMOUNT]"),
+    # "send 100", "pay 25.50", "amount is 40", {'amount': '40'}: the number that follows a money word
+    (re.compile(rf"\b(send|sent|pay|paid|transfer|amount(?: is| of)?|threshold|over|balance)(['\"]?\s*[:=]?\s*['\"]?\s*){NUMBER}",
+                re.IGNORECASE), r"\1\2[AMOUNT]"),
+    (re.compile(r"\b\d[\d,]*\.\d{2}\b"), "[AMOUNT]"),
+]
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class TraceContextFilter(logging.Filter):
+    """Stamps records with the current trace id (while still on the request's thread/task)."""
+
+    def filter(self, record):
+        span = current_span.get()
+        record.trace_id = span.trace_id if span else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of DEBUG/INFO records per category; the longest matching logger-name prefix wins."""
+
+    def __init__(self, rates: dict, rng=random.random):
+        super().__init__()
+        self.rates = sorted(rates.items(), key=lambda item: -len(item[0]))
+        self.rng = rng
+        self.dropped = 0
+
+    def rate(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        if rate >= 1.0 or self.rng() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class RedactingFormatter(logging.Formatter):
+    def __init__(self, fmt=TEXT_FORMAT, redact_pii=True):
+        super().__init__(fmt)
+        self.redact_pii = redact_pii
+
+    def format(self, record):
+        record.trace = f" [{record.trace_id}]" if getattr(record, "trace_id", None) else ""
+        if self.redact_pii:
+            # Only the message is redacted; the timestamp is digits too
+            record = logging.makeLogRecord({**record.__dict__, "msg": redact(record.getMessage()), "args": None})
+        return super().format(record)
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, redact_pii=True):
+        super().__init__()
+        self.redact_pii = redact_pii
+
+    def format(self, record):
+        message = record.getMessage()
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(message) if self.redact_pii else message,
+        }
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LoggingSetup:
+    """What setup_logging() installed, so it can be stopped (flushing the queue) or inspected."""
+
+    def __init__(self, listener, queue_handler, sampler):
+        self.listener = listener
+        self.queue_handler = queue_handler
+        self.sampler = sampler
+
+    def stats(self) -> dict:
+        return {"dropped_by_sampling": self.sampler.dropped if self.sampler else 0}
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()  # drains what is already queued
+            self.listener = None
+        logging.getLogger().removeHandler(self.queue_handler)
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text", sampling: Optional[dict] = None, redact_pii: bool = True,
+                  stream=None, queued: bool = True, namespace: str = "bankbot") -> LoggingSetup:
+    """
+    Installs the handler on the root logger, replacing any handler installed earlier.
+    level applies to the app's namespace; other libraries (httpx, openai, asyncio) only log warnings,
+    since their DEBUG output includes whole request bodies. queued=False writes synchronously from
+    the calling thread (for comparison only).
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    levelno = getattr(logging, level.upper())
+    root.setLevel(max(levelno, logging.WARNING))
+    logging.getLogger(namespace).setLevel(levelno)
+
+    output = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    output.setFormatter(JsonFormatter(redact_pii) if fmt == "json" else RedactingFormatter(redact_pii=redact_pii))
+    sampler = SamplingFilter(sampling) if sampling else None
+
+    if queued:
+        records = queue.SimpleQueue()
+        front = logging.handlers.QueueHandler(records)
+        listener = logging.handlers.QueueListener(records, output, respect_handler_level=False)
+        listener.start()
+    else:
+        front, listener = output, None
+    if sampler:
+        front.addFilter(sampler)  # first, so a dropped record costs no more than the level check and a coin flip
+    front.addFilter(TraceContextFilter())
+    root.addHandler(front)
+    return LoggingSetup(listener, front, sampler)
+
+
+def sampling_from_env(raw: Optional[str]) -> dict:
+    """LOG_SAMPLING='{"bankbot.llm": 0.1, "bankbot.flow": 0.5}'."""
+    return {name: float(rate) for name, rate in json.loads(raw).items()} if raw else {}
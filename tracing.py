@@ -0,0 +1,346 @@
+"""
+Request tracing and latency metrics.
+
+Spans nest through a ContextVar, so a span opened in an endpoint is the parent of
+everything awaited inside it, including tasks created there (asyncio copies the
+context). Typical tree for one bot turn:
+
+    http.request /tellerbot
+      request.parse
+      turn
+        classify (kind=intent)
+          llm.call (kind=intent, prompt/completion tokens)
+        flow.route
+        handler (fill_handler)
+          llm.call (kind=fill)
+        turn.postprocess
+
+Finished spans go two ways:
+- exporters: a whole trace is handed over when its root span ends, as OTLP/JSON
+  ({"resourceSpans": ...}, one line per trace) to stdout or a file, or kept in memory.
+  The OTLP exporter only enqueues the spans; a writer thread serializes and writes
+  them, so Tracer.finish does no I/O on the event loop (as with logging's QueueListener)
+- metrics: every span feeds latency histograms (span_duration_seconds by span name,
+  plus per-endpoint, per-handler and per-prompt-kind families), rendered in the
+  Prometheus text format for GET /metrics. Each worker keeps its own registry.
+"""
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Optional
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+current_span = ContextVar("current_span", default=None)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    attributes: dict = field(default_factory=dict)
+    metric: Optional[tuple] = None        # (histogram family, {label: value}) recorded besides span_duration_seconds
+    end_ns: Optional[int] = None
+    error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def seconds(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+
+def otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_span(span: Span) -> dict:
+    out = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [{"key": k, "value": otlp_value(v)} for k, v in span.attributes.items() if v is not None],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        out["parentSpanId"] = span.parent_id
+    return out
+
+
+def otlp_document(spans, service_name: str) -> dict:
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [otlp_span(s) for s in spans]}],
+    }]}
+
+
+class OTLPJsonExporter:
+    """
+    One OTLP/JSON document per line, to a file path or a stream (stdout by default).
+    export() only enqueues; a writer thread serializes, writes and flushes whatever is queued.
+    close() writes out what is still queued and stops the thread.
+    """
+
+    def __init__(self, path: Optional[str] = None, stream=None, service_name: str = "bankbot"):
+        self.path = path
+        self.stream = stream if stream is not None else (None if path else sys.stdout)
+        self.service_name = service_name
+        self._queue = queue.SimpleQueue()
+        self._stats = {"exported": 0, "failed": 0}
+        self._thread = threading.Thread(target=self._write_forever, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, spans):
+        self._queue.put(spans)
+
+    def _write_forever(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:  # everything already queued goes out in one write
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            traces = [spans for spans in batch if spans is not None]
+            if traces:
+                try:
+                    self._write("".join(json.dumps(otlp_document(spans, self.service_name)) + "\n" for spans in traces))
+                    self._stats["exported"] += len(traces)
+                except Exception as e:  # tracing must never stop; the next batch tries again
+                    self._stats["failed"] += len(traces)
+                    logger.warning("Trace export failed: %s", e)
+            if None in batch:
+                return
+
+    def _write(self, lines: str):
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as f:  # reopened per batch, so log rotation just works
+                f.write(lines)
+        else:
+            self.stream.write(lines)
+            self.stream.flush()
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    def close(self, timeout: float = 5.0):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+class MemoryExporter:
+    """Keeps the latest traces (lists of spans); for tests and benchmarks."""
+
+    def __init__(self, max_traces: int = 1000):
+        self.traces = deque(maxlen=max_traces)
+
+    def export(self, spans):
+        self.traces.append(list(spans))
+
+
+def create_exporter(kind: str, path: Optional[str] = None, service_name: str = "bankbot"):
+    """kind: "none", "stdout", "file" (OTLP/JSON lines to path) or "memory"."""
+    if kind == "stdout":
+        return OTLPJsonExporter(service_name=service_name)
+    if kind == "file":
+        return OTLPJsonExporter(path=path or "traces.jsonl", service_name=service_name)
+    if kind == "memory":
+        return MemoryExporter()
+    if kind == "none":
+        return None
+    raise ValueError(f"Unknown trace exporter: {kind}")
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # the last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus_labels(labels) -> str:
+    return ",".join(f'{k}="{escape_label(v)}"' for k, v in labels)
+
+
+class MetricsRegistry:
+    """Histograms and counters keyed by (family, sorted labels), rendered for Prometheus."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}     # family -> {labels tuple: Histogram}
+        self._counters = {}       # family -> {labels tuple: float}
+        self._help = {}
+
+    def describe(self, family: str, text: str):
+        self._help[family] = text
+
+    def observe(self, family: str, labels: dict, value: float):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(family, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, family: str, labels: dict, value: float = 1):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(family, {})
+            series[key] = series.get(key, 0) + value
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for family, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {family} {self._help.get(family, family)}")
+                lines.append(f"# TYPE {family} histogram")
+                for labels, h in sorted(series.items()):
+                    cumulative = 0
+                    for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                        cumulative += n
+                        le = bound if bound == "+Inf" else repr(float(bound))
+                        lines.append(f"{family}_bucket{{{prometheus_labels(labels + (('le', le),))}}} {cumulative}")
+                    lines.append(f"{family}_sum{{{prometheus_labels(labels)}}} {h.total}")
+                    lines.append(f"{family}_count{{{prometheus_labels(labels)}}} {h.count}")
+            for family, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {family} {self._help.get(family, family)}")
+                lines.append(f"# TYPE {family} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{family}{{{prometheus_labels(labels)}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    def __init__(self, exporters=(), metrics: Optional[MetricsRegistry] = None):
+        self.exporters = [e for e in exporters if e is not None]
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.metrics.describe("span_duration_seconds", "Duration of traced spans, by span name")
+        self._lock = threading.Lock()
+        self._pending = {}        # trace id -> finished spans waiting for their root
+
+    @contextmanager
+    def span(self, name: str, metric: Optional[tuple] = None, **attributes):
+        """
+        Times the block as a child of the current span (or a new trace's root).
+        metric=(family, labels) also records the duration in that histogram family.
+        """
+        parent = current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else f"{random.getrandbits(128):032x}",
+            span_id=f"{random.getrandbits(64):016x}",
+            parent_id=parent.span_id if parent else None,
+            start_ns=time.time_ns(),
+            attributes=attributes,
+            metric=metric,
+        )
+        if parent is None and self.exporters:
+            with self._lock:
+                self._pending[span.trace_id] = []  # collect the trace's spans until this root ends
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            current_span.reset(token)
+            self.finish(span)
+
+    def finish(self, span: Span):
+        span.end_ns = time.time_ns()
+        seconds = span.seconds
+        self.metrics.observe("span_duration_seconds", {"span": span.name}, seconds)
+        if span.metric is not None:
+            self.metrics.observe(span.metric[0], span.metric[1], seconds)
+        if not self.exporters:
+            return
+        with self._lock:
+            if span.parent_id is not None and span.trace_id in self._pending:
+                self._pending[span.trace_id].append(span)
+                return
+            if span.parent_id is not None:
+                # A child finishing after its root (e.g. a cancelled background call) goes out on its own
+                spans = [span]
+            else:
+                spans = self._pending.pop(span.trace_id, []) + [span]
+        for exporter in self.exporters:
+            try:
+                exporter.export(spans)
+            except Exception as e:  # tracing must never break a request
+                logger.warning("Trace export failed: %s", e)
+
+    def close(self):
+        """Writes out traces the exporters still hold (see OTLPJsonExporter.close)."""
+        for exporter in self.exporters:
+            if hasattr(exporter, "close"):
+                exporter.close()
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware: one root span per HTTP request, ended when the last body chunk is sent,
+    so streamed responses (/speak, /stream, statement.csv) are timed to the end.
+    The response carries the trace id in an x-trace-id header, to find a request's spans.
+    """
+
+    def __init__(self, app, tracer: Tracer, skip_prefixes=("/static", "/metrics")):
+        self.app = app
+        self.tracer = tracer
+        self.skip_prefixes = skip_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_prefixes):
+            return await self.app(scope, receive, send)
+        labels = {"method": scope["method"], "endpoint": "unmatched"}
+        with self.tracer.span("http.request", metric=("http_request_duration_seconds", labels),
+                              method=scope["method"], path=scope["path"]) as span:
+
+            async def traced_send(message):
+                if message["type"] == "http.response.start":
+                    span.set(status_code=message["status"])
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-trace-id", span.trace_id.encode())]}
+                await send(message)
+
+            # Returns once the whole body has been sent
+            await self.app(scope, receive, traced_send)
+            # The router has put the matched route in the (shared) scope by now; use its template, not the raw path
+            route = scope.get("route")
+            labels["endpoint"] = getattr(route, "path", None) or "unmatched"
+            span.set(endpoint=labels["endpoint"])
@@ -0,0 +1,312 @@
+"""
+Text-to-speech service behind /speak.
+
+The old endpoint built a SpeechConfig and SpeechSynthesizer per request, blocked the
+event loop on speak_text_async(text).get() and played the audio on the server's own
+speaker. This service instead:
+
+- returns audio bytes, streamed to the client as they are synthesized
+- synthesizes in a worker pool, off the event loop
+- reuses a fixed set of synthesizer objects (Azure backend)
+- keeps a content-addressed disk cache of rendered audio, so repeated phrases
+  (every static immediate_reply in the flows) are read from disk. GET /speak takes
+  any text, so the cache is capped at max_bytes: least recently used renderings
+  are removed first, except the pre-rendered static replies, which stay
+- reports every backend failure (SDK errors, timeouts, OSError) as TTSError, which
+  /speak turns into a 502
+
+Backends share one interface (synthesize_chunks(text) -> iterator of bytes):
+- AzureTTSBackend: Azure Speech, needs azure-cognitiveservices-speech and AZURE_SPEECH_KEY
+- StubTTSBackend: offline WAV tone whose length follows the text, for local runs and benchmarks
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import io
+import logging
+import math
+import os
+import queue
+import struct
+import threading
+import time
+import uuid
+import wave
+
+try:
+    import azure.cognitiveservices.speech as speechsdk
+except ImportError:  # optional: the stub backend works without it
+    speechsdk = None
+
+
+CHUNK_SIZE = 16 * 1024
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class TTSError(Exception):
+    pass
+
+
+def audio_cache_key(text: str, backend_id: str) -> str:
+    """Content address of a rendering: the exact text plus everything that changes the audio."""
+    return hashlib.sha256(f"{backend_id}\n{text}".encode("utf-8")).hexdigest()
+
+
+class AzureTTSBackend:
+    media_type = "audio/mpeg"
+    extension = "mp3"
+
+    def __init__(self, key: str, region: str, voice: str, language: str, pool_size: int = 4):
+        if speechsdk is None:
+            raise TTSError("azure-cognitiveservices-speech is not installed")
+        if not key:
+            raise TTSError("AZURE_SPEECH_KEY is not set")
+        speech_config = speechsdk.SpeechConfig(subscription=key, region=region)
+        speech_config.speech_synthesis_voice_name = voice
+        speech_config.speech_synthesis_language = language
+        speech_config.set_speech_synthesis_output_format(
+            speechsdk.SpeechSynthesisOutputFormat.Audio24Khz48KBitRateMonoMp3
+        )
+        self.backend_id = f"azure:{voice}:{language}:mp3-24khz-48kbit"
+        # audio_config=None: audio comes back to us instead of playing on the server's speaker
+        self._synthesizers = queue.Queue()
+        for _ in range(pool_size):
+            self._synthesizers.put(speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None))
+
+    def synthesize_chunks(self, text: str):
+        synthesizer = self._synthesizers.get()
+        try:
+            # start_speaking returns once audio starts arriving, so the first chunk goes out before synthesis ends
+            result = synthesizer.start_speaking_text_async(text).get()
+            if result.reason == speechsdk.ResultReason.Canceled:
+                raise TTSError(f"Speech synthesis canceled: {result.cancellation_details.reason} {result.cancellation_details.error_details}")
+            stream = speechsdk.AudioDataStream(result)
+            buffer = bytes(CHUNK_SIZE)
+            while True:
+                filled = stream.read_data(buffer)
+                if filled == 0:
+                    break
+                yield buffer[:filled]
+            if stream.status == speechsdk.StreamStatus.Canceled:
+                details = stream.cancellation_details
+                raise TTSError(f"Speech synthesis canceled: {details.reason} {details.error_details}")
+        finally:
+            self._synthesizers.put(synthesizer)
+
+
+class StubTTSBackend:
+    """
+    A quiet 440 Hz tone, 60 ms per character (capped at 10 s): deterministic, offline, sized like speech.
+    latency_ms delays the first chunk, to stand in for a synthesis service's time to first byte.
+    """
+
+    media_type = "audio/wav"
+    extension = "wav"
+    backend_id = "stub:tone:16khz"
+    sample_rate = 16000
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+
+    def synthesize_chunks(self, text: str):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)  # runs in the TTS worker pool
+        seconds = min(10.0, 0.3 + 0.06 * len(text))
+        frames = int(seconds * self.sample_rate)
+        samples = (int(800 * math.sin(2 * math.pi * 440 * i / self.sample_rate)) for i in range(frames))
+        header = io.BytesIO()
+        with wave.open(header, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.setnframes(frames)
+        yield header.getvalue()
+        chunk = []
+        for sample in samples:
+            chunk.append(sample)
+            if len(chunk) * 2 >= CHUNK_SIZE:
+                yield struct.pack(f"<{len(chunk)}h", *chunk)
+                chunk = []
+        if chunk:
+            yield struct.pack(f"<{len(chunk)}h", *chunk)
+
+
+class TTSService:
+    def __init__(self, backend, cache_dir: str, workers: int = 4, max_bytes: int = CACHE_MAX_BYTES):
+        self.backend = backend
+        self.media_type = backend.media_type
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        self._lock = threading.Lock()
+        self._stats = {"cache_hits": 0, "synthesized": 0, "prerendered": 0, "errors": 0, "evicted": 0}
+        self._entries = OrderedDict()   # cached file path -> size, least recently used first
+        self._cached_bytes = 0
+        self._pinned = set()            # paths of pre-rendered static replies, never evicted
+        self._load_entries()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _load_entries(self):
+        """Indexes renderings left by earlier runs, oldest use first (hits touch the file's mtime)."""
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(f".{self.backend.extension}"):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._cached_bytes += size
+        self._evict()
+
+    def _used(self, path, size=None):
+        """Marks a cached rendering as most recently used, adding it (ours or another worker's) if new."""
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+            else:
+                if size is None:
+                    size = os.path.getsize(path)
+                self._entries[path] = size
+                self._cached_bytes += size
+        self._evict()
+
+    def _evict(self):
+        """Removes least recently used renderings until the cache fits in max_bytes."""
+        with self._lock:
+            victims = []
+            for path, size in self._entries.items():
+                if self._cached_bytes <= self.max_bytes:
+                    break
+                if path not in self._pinned:
+                    victims.append(path)
+                    self._cached_bytes -= size
+            for path in victims:
+                del self._entries[path]
+            self._stats["evicted"] += len(victims)
+        for path in victims:
+            try:
+                os.remove(path)  # a reader that already opened it keeps its copy
+            except FileNotFoundError:
+                pass
+
+    def cache_path(self, text: str) -> str:
+        key = audio_cache_key(text, self.backend.backend_id)
+        return os.path.join(self.cache_dir, f"{key}.{self.backend.extension}")
+
+    def _render(self, text, path, on_chunk=None):
+        """Runs in the worker pool: synthesizes to a temp file, hands each chunk to on_chunk, then publishes the file."""
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in self.backend.synthesize_chunks(text):
+                    f.write(chunk)
+                    if on_chunk is not None:
+                        on_chunk(chunk)
+            os.replace(tmp_path, path)  # atomic, so a reader never sees a partial rendering
+        except Exception as e:
+            self._count("errors")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if isinstance(e, TTSError):
+                raise
+            raise TTSError(f"{type(e).__name__}: {e}") from e
+        self._count("synthesized")
+        self._used(path, os.path.getsize(path))
+
+    def _read_chunks(self, path):
+        """The cached rendering's chunks, or None when it isn't there (never rendered, or just evicted)."""
+        try:
+            with open(path, "rb") as f:
+                chunks = list(iter(lambda: f.read(CHUNK_SIZE), b""))
+            os.utime(path)  # keeps the use order across restarts
+            self._used(path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            raise TTSError(f"Reading cached speech failed: {e}") from e
+        return chunks
+
+    async def stream(self, text: str):
+        """
+        Async iterator of audio bytes: from the disk cache, or streamed from the backend while it renders.
+        Any failure is raised as TTSError.
+        """
+        loop = asyncio.get_running_loop()
+        path = self.cache_path(text)
+        if os.path.exists(path):
+            cached = await loop.run_in_executor(self._executor, self._read_chunks, path)
+            if cached is not None:
+                self._count("cache_hits")
+                for chunk in cached:
+                    yield chunk
+                return
+
+        chunks = asyncio.Queue()
+        future = loop.run_in_executor(
+            self._executor, self._render, text, path,
+            lambda chunk: loop.call_soon_threadsafe(chunks.put_nowait, chunk),
+        )
+        # Completion is delivered through the loop after every chunk callback, so None always comes last
+        future.add_done_callback(lambda _: chunks.put_nowait(None))
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+        await future  # re-raises a synthesis error
+        # If the client disconnects early the render still finishes in the pool and lands in the cache
+
+    def prerender(self, texts):
+        """
+        Queues every uncached text for rendering in the background; returns how many were queued.
+        These renderings are pinned: eviction never removes them.
+        """
+        texts = [t for t in dict.fromkeys(texts) if t]
+        with self._lock:
+            self._pinned.update(self.cache_path(t) for t in texts)
+        pending = [t for t in texts if not os.path.exists(self.cache_path(t))]
+        for text in pending:
+            self._executor.submit(self._prerender_one, text)
+        return len(pending)
+
+    def _prerender_one(self, text):
+        try:
+            self._render(text, self.cache_path(text))
+            self._count("prerendered")
+        except Exception as e:
+            logger.warning("TTS prerender failed: %s", e)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached_files"] = len(self._entries)
+            stats["cached_bytes"] = self._cached_bytes
+        stats["backend"] = type(self.backend).__name__
+        return stats
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_tts_service(backend: str, cache_dir: str, workers: int = 4, stub_latency_ms: float = 0,
+                       max_cache_bytes: int = CACHE_MAX_BYTES, **azure_options):
+    """
+    backend: "azure", "stub", or "auto" (Azure when the SDK is installed and a key is set, else the stub).
+    stub_latency_ms: the stub's delay before its first chunk.
+    max_cache_bytes: size of the disk cache before least recently used renderings are removed.
+    azure_options: key, region, voice, language for AzureTTSBackend.
+    """
+    if backend == "auto":
+        backend = "azure" if speechsdk is not None and azure_options.get("key") else "stub"
+    if backend == "azure":
+        return TTSService(AzureTTSBackend(pool_size=workers, **azure_options), cache_dir, workers, max_cache_bytes)
+    if backend == "stub":
+        return TTSService(StubTTSBackend(stub_latency_ms), cache_dir, workers, max_cache_bytes)
+    raise ValueError(f"Unknown TTS backend: {backend}")
@@ -0,0 +1,119 @@
+"""
+Per-session turn queue: turns of one session run one at a time, in arrival order.
+
+The bots post a turn for every page load, every change of a form field
+(#from-account, #amount, #payee-name, #account-number) and every speech result.
+Field changes come in bursts and each used to be evaluated concurrently, with
+its own LLM calls, although only the last one's answer matters. Here:
+
+- a "refresh" turn (newPageLoaded with no user message: page loads and field
+  changes) replaces the refresh turn queued just before it: if that one hasn't
+  started it is dropped, its logs moved to the newer turn; if it is running it
+  is cancelled, which cancels its in-flight LLM calls
+- a turn carrying a user message is never dropped and never replaces anything,
+  so the conversation keeps every message in order
+- a replaced turn's request gets SUPERSEDED back; the bots ignore it
+
+The queue lives on the event loop of one worker (no locks: everything runs on
+the loop). With several workers, a session's turns are only serialized if the
+load balancer keeps the session on one worker.
+"""
+import asyncio
+from contextvars import ContextVar
+from typing import Optional
+
+# The ticket whose turn is running in the current task (and the tasks it starts)
+current_ticket: ContextVar = ContextVar("current_ticket", default=None)
+
+
+def is_refresh(body: dict) -> bool:
+    return bool(body.get("newPageLoaded")) and not body.get("message")
+
+
+class Ticket:
+    def __init__(self, body: dict):
+        self.body = body
+        self.refresh = is_refresh(body)
+        self.task: Optional[asyncio.Task] = None
+        self.superseded = False
+        self.finished = False
+
+
+class Lane:
+    """One session's queue: the future of the last queued turn and that turn's ticket."""
+
+    def __init__(self):
+        self.tail: Optional[asyncio.Future] = None
+        self.last: Optional[Ticket] = None
+        self.queued = 0
+
+
+class SessionTurnQueue:
+    SUPERSEDED = {"superseded": True}
+
+    def __init__(self, coalesce_window_seconds: float = 0.0):
+        self.coalesce_window_seconds = coalesce_window_seconds
+        self._lanes = {}
+        self._stats = {"turns": 0, "ran": 0, "coalesced": 0, "cancelled": 0, "llm_calls_cancelled": 0, "max_queued": 0}
+
+    def _supersede(self, old: Ticket, new: Ticket):
+        old.superseded = True
+        if old.task is None:
+            # Not started: the newer turn reports the user actions this one would have
+            logs = (old.body.get("logs") or []) + (new.body.get("logs") or [])
+            new.body = {**new.body, "logs": logs}
+            self._stats["coalesced"] += 1
+        else:
+            old.task.cancel()
+            self._stats["cancelled"] += 1
+
+    async def submit(self, session_id: str, body: dict, run):
+        """Runs await run(body) in the session's turn, or returns SUPERSEDED when a newer turn replaced it."""
+        lane = self._lanes.get(session_id)
+        if lane is None:
+            lane = self._lanes[session_id] = Lane()
+        ticket = Ticket(body)
+        self._stats["turns"] += 1
+        if ticket.refresh and lane.last is not None and lane.last.refresh and not lane.last.finished:
+            self._supersede(lane.last, ticket)
+
+        previous, done = lane.tail, asyncio.get_running_loop().create_future()
+        lane.tail, lane.last = done, ticket
+        lane.queued += 1
+        self._stats["max_queued"] = max(self._stats["max_queued"], lane.queued)
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            if ticket.refresh and self.coalesce_window_seconds and lane.last is ticket:
+                await asyncio.sleep(self.coalesce_window_seconds)  # let the rest of a burst arrive
+            if ticket.superseded:
+                return {**self.SUPERSEDED, "session_id": session_id}
+
+            async def turn():
+                current_ticket.set(ticket)
+                return await run(ticket.body)
+
+            ticket.task = asyncio.ensure_future(turn())
+            self._stats["ran"] += 1
+            try:
+                return await ticket.task
+            except asyncio.CancelledError:
+                if ticket.superseded and ticket.task.cancelled():
+                    return {**self.SUPERSEDED, "session_id": session_id}
+                raise
+        finally:
+            ticket.finished = True
+            if not done.done():
+                done.set_result(None)
+            lane.queued -= 1
+            if lane.queued == 0 and self._lanes.get(session_id) is lane:
+                del self._lanes[session_id]
+
+    def record_cancelled_llm_call(self):
+        """Called by api_call when its request is cancelled; counted when a newer turn replaced this one."""
+        ticket = current_ticket.get()
+        if ticket is not None and ticket.superseded:
+            self._stats["llm_calls_cancelled"] += 1
+
+    def stats(self) -> dict:
+        return {**self._stats, "active_sessions": len(self._lanes)}